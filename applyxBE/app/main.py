@@ -1,9 +1,18 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from app.services.chat_services import ChatService
-from app.services.chatbot_sevice import ChatService as ChatBot
-from app.services.profile_service import save_profile, get_profile
-from app.services.profile_service_fastapi import ProfileService
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, field_validator
+from app.services.profile_service_fastapi import LEGACY_PROFILE_ID
+from app.services.profile_store import etag_matches
+from app.services.concurrency import run_blocking
+from app.services.registry import LazyService
+from app.services.scheduler import LLMScheduler, SchedulerOverloaded
+from app.services.session_sweeper import SessionSweeper
 import uvicorn
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
@@ -12,9 +21,77 @@ from typing import List, Optional
 
 load_dotenv()
 
-app = FastAPI()
-chat_service = ChatService()
-profile_service = ProfileService()
+logger = logging.getLogger(__name__)
+
+def _create_chat_service():
+    from app.services.chat_services import ChatService
+    # Ghi thống kê vào đúng instance mà /analytics/careers đọc
+    service = ChatService(analytics=_career_analytics.get())
+    # Các bước khởi động một lần (không nằm trong constructor để benchmark / script không ghi vào app/session)
+    service.import_legacy_results()
+    service.backfill_analytics()
+    return service
+
+def _create_chatbot():
+    from app.services.chatbot_sevice import ChatService as ChatBot
+    return ChatBot()
+
+def _create_profile_service():
+    from app.services.profile_service_fastapi import ProfileService
+    return ProfileService()
+
+def _create_career_analytics():
+    from app.services.career_analytics import CareerAnalytics
+    return CareerAnalytics()
+
+# Các service được khởi tạo lười (lần dùng đầu hoặc khi warm-up) để app khởi động nhanh
+_chat_service = LazyService("chat", _create_chat_service)
+_chatbot = LazyService("chatbot", _create_chatbot)
+_profile_service = LazyService("profile", _create_profile_service)
+# Một instance dùng chung: chat service ghi mỗi lần lưu kết quả, /analytics/careers đọc
+_career_analytics = LazyService("analytics", _create_career_analytics)
+SERVICES = [_chat_service, _chatbot, _profile_service, _career_analytics]
+session_sweeper = SessionSweeper([_chat_service, _chatbot])
+
+# Tắt warm-up (WARMUP_ON_STARTUP=0) để service chỉ được tạo khi có request đầu tiên
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+async def _warm_up_services():
+    await asyncio.gather(*(service.warm_up() for service in SERVICES))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = None
+    if WARMUP_ON_STARTUP:
+        # Chạy nền: app nhận kết nối ngay, /readyz báo khi nào service sẵn sàng
+        warmup_task = asyncio.create_task(_warm_up_services())
+    sweeper_task = asyncio.create_task(session_sweeper.run())
+    yield
+    sweeper_task.cancel()
+    if warmup_task is not None:
+        warmup_task.cancel()
+
+async def _require(service: LazyService):
+    try:
+        return await service.aget()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Service {service.name} chưa sẵn sàng: {str(e)}")
+
+async def get_chat_service():
+    return await _require(_chat_service)
+
+async def get_chatbot():
+    return await _require(_chatbot)
+
+async def get_profile_service():
+    return await _require(_profile_service)
+
+async def get_career_analytics():
+    return await _require(_career_analytics)
+
+app = FastAPI(lifespan=lifespan)
+# Dùng chung cho cả chatbot Ikigai và RAG vì cùng chia sẻ quota Gemini
+llm_scheduler = LLMScheduler()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  
@@ -22,6 +99,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+@app.exception_handler(SchedulerOverloaded)
+async def scheduler_overloaded_handler(request: Request, exc: SchedulerOverloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 class MessageRequest(BaseModel):
     session_id: str
     message: str
@@ -52,7 +137,30 @@ class ProfileRequest(BaseModel):
     updatedAt: Optional[str] = ""
     createdAt: Optional[str] = ""
 
-chatbot = ChatBot()
+class ProfilePatch(BaseModel):
+    """PATCH profile: chỉ các trường có trong body được ghi, trường khác giữ nguyên"""
+    firstName: Optional[str] = None
+    lastName: Optional[str] = None
+    gender: Optional[str] = None
+    birthDate: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    school: Optional[str] = None
+    major: Optional[str] = None
+    gpa: Optional[str] = None
+    portfolio: Optional[str] = None
+    achievements: Optional[List[Achievement]] = None
+    notes: Optional[str] = None
+    shareProfile: Optional[bool] = None
+    profileImageUrl: Optional[str] = None
+
+    @field_validator('firstName', 'email')
+    @classmethod
+    def required_not_null(cls, value):
+        # Bỏ qua trường thì giữ nguyên; gửi null cho trường bắt buộc của ProfileRequest là lỗi (422)
+        if value is None:
+            raise ValueError('không được để null')
+        return value
 
 class MessageRequestBot(BaseModel):
     session_id: str
@@ -61,25 +169,103 @@ class MessageRequestBot(BaseModel):
 class CreateSessionResponseBot(BaseModel):
     session_id: str
 
+def _sse_event(data: dict, event: str = None) -> str:
+    """Định dạng một sự kiện Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+
+class _SchedulerStream(StreamingResponse):
+    """
+    StreamingResponse giữ ticket của scheduler. Ticket được trả khi response kết thúc
+    theo bất kỳ cách nào: stream xong, client ngắt kết nối hoặc request bị hủy trước
+    khi Starlette bắt đầu đọc generator (khi đó finally của _stream_as_sse không chạy).
+    """
+
+    def __init__(self, content, ticket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+async def _stream_as_sse(chunks, label: str, ticket, meta: dict = None):
+    """
+    Chuyển các đoạn text thành SSE: mỗi đoạn là một sự kiện {"delta": ...},
+    sự kiện cuối "done" chứa câu trả lời đầy đủ và time-to-first-token.
+    Ticket của scheduler được giữ cho tới khi stream kết thúc (xem thêm _SchedulerStream).
+    `meta` (nếu có) được service điền trong lúc stream và gửi kèm sự kiện "done".
+    """
+    start = time.perf_counter()
+    ttft_ms = None
+    parts = []
+    try:
+        async for chunk in chunks:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+            parts.append(chunk)
+            yield _sse_event({"delta": chunk})
+    except Exception as e:
+        yield _sse_event({"detail": str(e)}, event="error")
+        return
+    finally:
+        ticket.release()
+    total_ms = (time.perf_counter() - start) * 1000
+    logger.info(f"{label} stream: ttft={ttft_ms or 0:.0f}ms total={total_ms:.0f}ms")
+    yield _sse_event({
+        "response": "".join(parts),
+        "ttft_ms": round(ttft_ms or 0, 1),
+        "total_ms": round(total_ms, 1),
+        **({"meta": meta} if meta is not None else {}),
+    }, event="done")
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: process còn sống và nhận được request."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: các service đã khởi tạo xong (index đã load, client đã tạo)."""
+    services = {service.name: service.status() for service in SERVICES}
+    if _chatbot.ready:
+        services[_chatbot.name].update(_chatbot.get().health())
+    ready = all(status["ready"] for status in services.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "services": services})
+
 @app.post("/chat/session", response_model=CreateSessionResponse)
-async def create_session():
+def create_session(chat_service=Depends(get_chat_service)):
     session_id = chat_service.create_session()
     return {"session_id": session_id}
 
 @app.post("/chat/send")
-async def send_message(request: MessageRequest):
+async def send_message(request: MessageRequest, chat_service=Depends(get_chat_service)):
+    async with llm_scheduler.slot(f"chat:{request.session_id}"):
+        try:
+            response = await chat_service.send_message_async(request.session_id, request.message)
+            return {"response": response}
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/chat/send/stream")
+async def send_message_stream(request: MessageRequest, chat_service=Depends(get_chat_service)):
+    """Gửi tin nhắn khảo sát Ikigai và nhận phản hồi dạng stream (SSE)."""
+    ticket = await llm_scheduler.acquire(f"chat:{request.session_id}")
     try:
-        response = chat_service.send_message(request.session_id, request.message)
-        return {"response": response}
+        chunks = await run_blocking(chat_service.send_message_stream, request.session_id, request.message)
     except Exception as e:
+        ticket.release()
         raise HTTPException(status_code=400, detail=str(e))
+    return _SchedulerStream(_stream_as_sse(chunks, "/chat/send", ticket), ticket, media_type="text/event-stream")
 
 @app.get("/chat/history/{session_id}")
-async def get_history(session_id: str):
+def get_history(session_id: str, chat_service=Depends(get_chat_service)):
     try:
         history = chat_service.get_chat_history(session_id)
         return {"history": history}
@@ -87,7 +273,7 @@ async def get_history(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/chat/session/{session_id}")
-async def get_session_info(session_id: str):
+def get_session_info(session_id: str, chat_service=Depends(get_chat_service)):
     try:
         info = chat_service.get_session_info(session_id)
         return info
@@ -95,38 +281,67 @@ async def get_session_info(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/chat/sessions")
-async def list_sessions():
+def list_sessions(chat_service=Depends(get_chat_service)):
     return {"sessions": chat_service.list_sessions()}
 
 @app.delete("/chat/session/{session_id}")
-async def delete_session(session_id: str):
+def delete_session(session_id: str, chat_service=Depends(get_chat_service)):
     try:
         chat_service.delete_session(session_id)
         return {"message": "Session deleted"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+@app.get("/sessions/sweeper")
+async def get_sweeper_stats():
+    """Thống kê số session bị dọn theo TTL/LRU."""
+    return session_sweeper.stats()
+
+@app.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Thống kê hàng đợi và số lời gọi LLM đang chạy."""
+    return llm_scheduler.stats()
+    
 @app.get("/chatbot")
 async def root():
     return {"message": "Welcome to the Admission Counseling Chatbot API"}
 
 @app.post("/chatbot/session", response_model=CreateSessionResponse, tags=["Chat"])
-async def create_session():
+def create_session(chatbot=Depends(get_chatbot)):
     """Tạo một phiên trò chuyện mới."""
     session_id = chatbot.create_session()
     return {"session_id": session_id}
 
 @app.post("/chatbot/send", tags=["Chat"])
-async def send_message(request: MessageRequest):
+async def send_message(request: MessageRequest, chatbot=Depends(get_chatbot)):
     """Gửi một tin nhắn trong một phiên trò chuyện và nhận câu trả lời."""
+    async with llm_scheduler.slot(f"chatbot:{request.session_id}"):
+        try:
+            result = await chatbot.send_message_async(request.session_id, request.message)
+            return {"response": result["answer"], "meta": result["meta"]}
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/chatbot/send/stream", tags=["Chat"])
+async def send_message_stream(request: MessageRequest, chatbot=Depends(get_chatbot)):
+    """Gửi tin nhắn và nhận câu trả lời dạng stream (SSE)."""
+    ticket = await llm_scheduler.acquire(f"chatbot:{request.session_id}")
+    meta = {}
     try:
-        response = chatbot.send_message(request.session_id, request.message)
-        return {"response": response}
+        chunks = await run_blocking(chatbot.send_message_stream, request.session_id, request.message, meta)
     except Exception as e:
+        ticket.release()
         raise HTTPException(status_code=400, detail=str(e))
+    return _SchedulerStream(_stream_as_sse(chunks, "/chatbot/send", ticket, meta), ticket,
+                            media_type="text/event-stream")
+
+@app.get("/chatbot/cache/stats", tags=["Session Management"])
+async def chatbot_cache_stats(chatbot=Depends(get_chatbot)):
+    """Thống kê cache câu trả lời, cache viết lại câu hỏi và tỷ lệ câu hỏi trả lời trực tiếp (không RAG)."""
+    return chatbot.cache_stats()
 
 @app.get("/chatbot/history/{session_id}", tags=["Session Management"])
-async def get_history(session_id: str):
+def get_history(session_id: str, chatbot=Depends(get_chatbot)):
     """Lấy lịch sử của một phiên trò chuyện."""
     try:
         history = chatbot.get_chat_history(session_id)
@@ -135,7 +350,7 @@ async def get_history(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/chatbot/session/{session_id}", tags=["Session Management"])
-async def get_session_info(session_id: str):
+def get_session_info(session_id: str, chatbot=Depends(get_chatbot)):
     """Lấy thông tin của một phiên trò chuyện."""
     try:
         info = chatbot.get_session_info(session_id)
@@ -144,12 +359,12 @@ async def get_session_info(session_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/chatbot/sessions", tags=["Session Management"])
-async def list_sessions():
+def list_sessions(chatbot=Depends(get_chatbot)):
     """Liệt kê tất cả các phiên đang hoạt động."""
     return {"sessions": chatbot.list_sessions()}
 
 @app.delete("/chatbot/session/{session_id}", tags=["Session Management"])
-async def delete_session(session_id: str):
+def delete_session(session_id: str, chatbot=Depends(get_chatbot)):
     """Xóa một phiên trò chuyện."""
     try:
         chatbot.delete_session(session_id)
@@ -160,97 +375,161 @@ async def delete_session(session_id: str):
 class SaveResultRequest(BaseModel):
     session_id: str
     result: str
+    profile_id: Optional[str] = None
+
+def _result_response(record: dict) -> dict:
+    # "result" giữ định dạng của session_data.txt cũ để frontend hiện tại vẫn parse được
+    return {
+        "session_id": record["session_id"],
+        "profile_id": record.get("profile_id"),
+        "saved_at": record["saved_at"],
+        "result": f"session_id: {record['session_id']}\nresult: {record['result']}\n",
+        "careers": record["careers"],
+    }
 
+# Các route kết quả là `def` thường: đọc / ghi file log (kèm flock) và SQLite thống kê chạy trong threadpool
 @app.post("/chat/saveResult", tags=["Save Results"])
-async def save_result_by_session(request: SaveResultRequest):
+def save_result_by_session(request: SaveResultRequest, chat_service=Depends(get_chat_service)):
     """
         Gọi save_result để lưu kết quả dạng chuỗi vào session.
+        result phải là JSON {"careers": [...]} (có thể nằm trong ```json```), được kiểm tra khi lưu.
     """
     try:
-        chat_service.save_result(request.session_id, request.result)
-        return {"message": f"Kết quả đã được lưu cho session {request.session_id}."}
+        record = chat_service.save_result(request.session_id, request.result, request.profile_id)
+        return {"message": f"Kết quả đã được lưu cho session {request.session_id}.",
+                "careers": len(record["careers"])}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/chat/getResult/{session_id}", tags=["get Results"])
-async def get_result_by_session(session_id: str):
+def get_result_by_session(session_id: str, chat_service=Depends(get_chat_service)):
     """
         Lấy kết quả đã lưu từ session.
     """
     try:
-        result = chat_service.get_results_by_session(session_id)
-        return {"session_id": session_id, "result": result}
+        record = chat_service.get_results_by_session(session_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Chưa có kết quả cho session {session_id}")
+    return _result_response(record)
 
-@app.post('/profile/save', tags=["Profile"])
-async def save_user_profile(profile: ProfileRequest):
-    """Lưu thông tin profile của người dùng."""
+@app.get("/chat/results", tags=["get Results"])
+def get_results_by_profile(profile_id: str, chat_service=Depends(get_chat_service)):
+    """
+        Lấy các kết quả đã lưu của một profile (mới nhất trước).
+    """
     try:
-        # Chuyển đổi Pydantic model thành dict
-        profile_data = profile.dict()
-        
-        # Gọi service để lưu profile
-        result = profile_service.save_profile(profile_data)
-        
-        if result['success']:
-            return result
-        else:
-            raise HTTPException(status_code=500, detail=result['message'])
-        
+        return {"profile_id": profile_id,
+                "results": [_result_response(record) for record in chat_service.get_results_by_profile(profile_id)]}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f'Lỗi khi lưu profile: {str(e)}')
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get('/profile/get', tags=["Profile"])
-async def get_user_profile():
-    """Lấy thông tin profile của người dùng."""
+@app.get("/analytics/careers", tags=["Analytics"])
+def get_career_analytics_summary(days: int = 30, limit: int = 20, analytics=Depends(get_career_analytics)):
+    """
+        Thống kê kết quả Ikigai cho dashboard: nghề phổ biến, histogram điểm,
+        số kết quả theo ngày (days ngày gần nhất) và lựa chọn Câu 1.
+        Chỉ đọc các bảng đếm được cộng dồn khi lưu kết quả.
+    """
     try:
-        result = profile_service.get_profile()
-        
-        if result['success']:
-            return result
-        else:
-            if "chưa được tạo" in result['message']:
-                raise HTTPException(status_code=404, detail=result['message'])
-            else:
-                raise HTTPException(status_code=500, detail=result['message'])
-        
-    except HTTPException:
-        raise
+        return analytics.summary(min(max(days, 1), 366), min(max(limit, 1), 200))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f'Lỗi khi đọc profile: {str(e)}')
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _profile_result(result: dict, response: Response) -> dict:
+    """
+    Kết quả của ProfileService -> response: gắn ETag của phiên bản vừa đọc / ghi;
+    lỗi không tìm thấy là 404, If-Match không khớp là 412, còn lại 500
+    """
+    if not result['success']:
+        status = {'not_found': 404, 'precondition_failed': 412}.get(result.get('error'), 500)
+        raise HTTPException(status_code=status, detail=result['message'])
+    if 'etag' in result:
+        response.headers['ETag'] = result['etag']
+        # Trình duyệt giữ bản sao nhưng luôn hỏi lại bằng If-None-Match (được 304 nếu chưa đổi)
+        response.headers['Cache-Control'] = 'no-cache'
+    return result
+
+def _read_profile(profile_id: str, if_none_match: Optional[str], response: Response, profile_service):
+    # So ETag trước (không đọc nội dung profile): nếu frontend đã có bản mới nhất thì trả 304 rỗng
+    etag = profile_service.etag(profile_id)
+    if etag_matches(if_none_match, etag, weak=True):
+        return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+    return _profile_result(profile_service.get_profile(profile_id), response)
+
+# Các route profile là `def` thường: FastAPI chạy chúng trong threadpool nên đọc / ghi SQLite
+# (kể cả lúc chờ khóa ghi BEGIN IMMEDIATE) không chặn event loop của stream SSE và scheduler.
+# Các route cũ: thao tác trên profile ?profile_id=..., mặc định là profile dùng chung trước đây (huy.json)
+@app.post('/profile/save', tags=["Profile"])
+def save_user_profile(profile: ProfileRequest, response: Response, profile_id: str = LEGACY_PROFILE_ID,
+                      if_match: Optional[str] = Header(None), profile_service=Depends(get_profile_service)):
+    """Lưu thông tin profile của người dùng."""
+    return _profile_result(profile_service.save_profile(profile_id, profile.dict(), if_match), response)
+
+@app.get('/profile/get', tags=["Profile"])
+def get_user_profile(response: Response, profile_id: str = LEGACY_PROFILE_ID,
+                     if_none_match: Optional[str] = Header(None), profile_service=Depends(get_profile_service)):
+    """Lấy thông tin profile của người dùng (304 nếu If-None-Match khớp ETag hiện tại)."""
+    return _read_profile(profile_id, if_none_match, response, profile_service)
 
 @app.put('/profile/update', tags=["Profile"])
-async def update_user_profile(profile: ProfileRequest):
-    """Cập nhật thông tin profile của người dùng."""
-    try:
-        # Chuyển đổi Pydantic model thành dict
-        profile_data = profile.dict()
-        
-        # Gọi service để cập nhật profile
-        result = profile_service.update_profile(profile_data)
-        
-        if result['success']:
-            return result
-        else:
-            raise HTTPException(status_code=500, detail=result['message'])
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f'Lỗi khi cập nhật profile: {str(e)}')
+def update_user_profile(profile: ProfileRequest, response: Response, profile_id: str = LEGACY_PROFILE_ID,
+                        if_match: Optional[str] = Header(None), profile_service=Depends(get_profile_service)):
+    """Cập nhật thông tin profile của người dùng: chỉ các trường có trong body."""
+    updated = profile.dict(exclude_unset=True)
+    return _profile_result(profile_service.update_profile(profile_id, updated, if_match, create=True), response)
 
 @app.delete('/profile/delete', tags=["Profile"])
-async def delete_user_profile():
+def delete_user_profile(response: Response, profile_id: str = LEGACY_PROFILE_ID,
+                        if_match: Optional[str] = Header(None), profile_service=Depends(get_profile_service)):
     """Xóa profile của người dùng."""
-    try:
-        result = profile_service.delete_profile()
-        
-        if result['success']:
-            return result
-        else:
-            raise HTTPException(status_code=500, detail=result['message'])
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f'Lỗi khi xóa profile: {str(e)}')
+    return _profile_result(profile_service.delete_profile(profile_id, if_match), response)
+
+@app.post('/profile', status_code=201, tags=["Profile"])
+def create_user_profile(profile: ProfileRequest, response: Response,
+                        profile_service=Depends(get_profile_service)):
+    """Tạo profile mới; profile_id trong kết quả dùng cho các route /profile/{profile_id}."""
+    return _profile_result(profile_service.create_profile(profile.dict()), response)
+
+@app.get('/profile', tags=["Profile"])
+def list_user_profiles(response: Response, email: Optional[str] = None, limit: int = 50, offset: int = 0,
+                       profile_service=Depends(get_profile_service)):
+    """Tìm profile theo email, hoặc liệt kê các profile sửa gần đây nhất."""
+    return _profile_result(profile_service.find_profiles(email, min(max(limit, 1), 200), max(offset, 0)), response)
+
+@app.get('/profile/cache/stats', tags=["Profile"])
+async def profile_cache_stats(profile_service=Depends(get_profile_service)):
+    """Tỷ lệ trúng cache đọc profile của worker này và thời gian đọc trung bình."""
+    return profile_service.cache_stats()
+
+@app.get('/profile/{profile_id}', tags=["Profile"])
+def get_user_profile_by_id(profile_id: str, response: Response, if_none_match: Optional[str] = Header(None),
+                           profile_service=Depends(get_profile_service)):
+    """Lấy profile theo id (304 nếu If-None-Match khớp ETag hiện tại)."""
+    return _read_profile(profile_id, if_none_match, response, profile_service)
+
+@app.put('/profile/{profile_id}', tags=["Profile"])
+def save_user_profile_by_id(profile_id: str, profile: ProfileRequest, response: Response,
+                            if_match: Optional[str] = Header(None), profile_service=Depends(get_profile_service)):
+    """Lưu (ghi đè hoặc tạo mới) toàn bộ profile theo id; có If-Match thì chỉ ghi khi ETag khớp (412 nếu không)."""
+    return _profile_result(profile_service.save_profile(profile_id, profile.dict(), if_match), response)
+
+@app.patch('/profile/{profile_id}', tags=["Profile"])
+def patch_user_profile(profile_id: str, patch: ProfilePatch, response: Response,
+                       if_match: Optional[str] = Header(None), profile_service=Depends(get_profile_service)):
+    """
+    Chỉ ghi các trường có trong body; có If-Match thì chỉ ghi khi ETag khớp (412 nếu không).
+    Profile chưa tồn tại trả 404 (tạo mới bằng PUT hoặc POST /profile).
+    """
+    return _profile_result(profile_service.update_profile(profile_id, patch.dict(exclude_unset=True), if_match),
+                           response)
+
+@app.delete('/profile/{profile_id}', tags=["Profile"])
+def delete_user_profile_by_id(profile_id: str, response: Response, if_match: Optional[str] = Header(None),
+                              profile_service=Depends(get_profile_service)):
+    """Xóa profile theo id."""
+    return _profile_result(profile_service.delete_profile(profile_id, if_match), response)
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="127.0.0.1", port=8000, reload=True)
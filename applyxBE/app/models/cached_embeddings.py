@@ -0,0 +1,207 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from app.models.embedding_pipeline import EmbeddingPipeline
+from app.services.lru_cache import LRUCache
+
+APP_DIR = Path(__file__).resolve().parents[1]
+
+# Model embedding dùng chung cho index và truy vấn
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+# File SQLite lưu embedding đã tính (để trống = chỉ cache trong bộ nhớ)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(APP_DIR / "session" / "embeddings.db"))
+# Số embedding giữ trong bộ nhớ
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa Unicode (NFC) và khoảng trắng để cùng một câu luôn cho cùng một khóa"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc một Embeddings của LangChain, ghi nhớ kết quả theo
+    (model, loại embedding, văn bản đã chuẩn hóa):
+    - Tầng 1: LRU trong bộ nhớ
+    - Tầng 2: file SQLite (WAL), giữ lại qua các lần khởi động và dùng chung giữa các worker
+
+    Embedding của truy vấn và của tài liệu được cache riêng vì Gemini dùng
+    task_type khác nhau cho hai loại này.
+
+    Nếu có `pipeline`, embed_documents chạy theo batch qua EmbeddingPipeline
+    và ghi mỗi batch xong xuống SQLite ngay (checkpoint): build bị dừng giữa
+    chừng thì lần chạy sau chỉ embed phần còn lại.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 max_entries: int = EMBEDDING_CACHE_SIZE, pipeline: Optional[EmbeddingPipeline] = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.path = path
+        self.pipeline = pipeline
+        self.memory = LRUCache(max_entries)
+        self._local = threading.local()
+        self.disk_hits = 0
+        self.api_calls = 0
+        self.api_texts = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha1(f"{self.model}\x00{kind}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Tìm các khóa trong bộ nhớ rồi trong SQLite; khóa tìm thấy trên đĩa được nạp lên bộ nhớ"""
+        found = {}
+        missing = []
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+            else:
+                missing.append(key)
+        if missing and self.path:
+            conn = self._conn()
+            # Giới hạn số tham số của một câu SQL
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self.memory.put(key, vector)
+                    found[key] = vector
+                    self.disk_hits += 1
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        for key, vector in items.items():
+            self.memory.put(key, vector)
+        if items and self.path:
+            now = time.time()
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _plan(self, kind: str, texts: List[str]):
+        keys = [self._key(kind, text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+        # Mỗi văn bản chưa có trong cache chỉ được gửi đi một lần
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    @staticmethod
+    def _round(keys: List[str], vectors: List[List[float]]) -> Dict[str, List[float]]:
+        # Làm tròn về float32 (như FAISS và như bản trên đĩa) để kết quả không phụ thuộc tầng cache
+        return {key: np.asarray(vector, dtype=np.float32).tolist() for key, vector in zip(keys, vectors)}
+
+    def _finish(self, keys: List[str], found: Dict, missing: Dict, vectors: List[List[float]],
+                store: bool = True) -> List[List[float]]:
+        computed = self._round(list(missing.keys()), vectors)
+        if store:
+            self._store(computed)
+        found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._plan("document", texts)
+        if not missing:
+            return self._finish(keys, found, missing, [])
+        self.api_texts += len(missing)
+        if self.pipeline is None:
+            self.api_calls += 1
+            return self._finish(keys, found, missing, self.embeddings.embed_documents(list(missing.values())))
+
+        missing_keys = list(missing.keys())
+
+        def checkpoint(start: int, vectors: List[List[float]]):
+            self.api_calls += 1
+            self._store(self._round(missing_keys[start:start + len(vectors)], vectors))
+
+        vectors = self.pipeline.run(self.embeddings.embed_documents, list(missing.values()), on_batch=checkpoint)
+        return self._finish(keys, found, missing, vectors, store=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._plan("query", [text])
+        vectors = []
+        if missing:
+            self.api_calls += 1
+            self.api_texts += 1
+            vectors = [self.embeddings.embed_query(text)]
+        return self._finish(keys, found, missing, vectors)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._plan("document", texts)
+        vectors = []
+        if missing:
+            self.api_calls += 1
+            self.api_texts += len(missing)
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+        return self._finish(keys, found, missing, vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._plan("query", [text])
+        vectors = []
+        if missing:
+            self.api_calls += 1
+            self.api_texts += 1
+            vectors = [await self.embeddings.aembed_query(text)]
+        return self._finish(keys, found, missing, vectors)[0]
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "path": self.path or None,
+            "memory": self.memory.stats(),
+            "disk_hits": self.disk_hits,
+            "api_calls": self.api_calls,
+            "api_texts": self.api_texts,
+            **({"pipeline": self.pipeline.stats()} if self.pipeline is not None else {}),
+        }
+
+
+def create_embeddings(api_key: str, pipeline: Optional[EmbeddingPipeline] = None) -> CachedEmbeddings:
+    """
+    Tạo embeddings Gemini có cache, dùng chung cho truy vấn (ChatService)
+    và cho việc tạo index (process_data, truyền thêm pipeline để embed theo batch)
+    """
+    embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=api_key)
+    return CachedEmbeddings(embeddings, EMBEDDING_MODEL, pipeline=pipeline)
@@ -0,0 +1,264 @@
+import json
+import os
+import re
+from typing import Dict, List, Tuple
+
+from app.services.history_policy import estimate_tokens
+
+# Cách dựng nội dung document: "compact" (các dòng "Nhãn: giá trị") hoặc "json" (json.dumps indent=2 như cũ)
+DOC_RENDER_MODE = os.getenv("DOC_RENDER_MODE", "compact")
+# Kích thước mục tiêu của một chunk và phần gối đầu giữa hai chunk liên tiếp (token ước lượng)
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "60"))
+
+# Nhãn dễ đọc cho các key thường gặp trong thư mục data; key khác được đổi "a_b" -> "A b"
+LABELS = {
+    "stt": "STT",
+    "nganh_dao_tao": "Ngành",
+    "chuong_trinh_dao_tao": "Chương trình đào tạo",
+    "ten_chuong_trinh_dao_tao": "Chương trình đào tạo",
+    "van_bang_tot_nghiep": "Văn bằng",
+    "thoi_gian_dao_tao_chuan": "Thời gian đào tạo (năm)",
+    "ghi_chu": "Ghi chú",
+    "ghi_chu_chung": "Ghi chú chung",
+    "ten_truong": "Tên trường",
+    "ma_truong": "Mã trường",
+    "ma_nganh": "Mã ngành",
+    "ten_nganh": "Tên ngành",
+    "ma_xet_tuyen": "Mã xét tuyển",
+    "ma_phuong_thuc": "Mã phương thức",
+    "ten_phuong_thuc": "Phương thức",
+    "chi_tieu": "Chỉ tiêu",
+    "tong_chi_tieu": "Tổng chỉ tiêu",
+    "to_hop": "Tổ hợp",
+    "to_hop_mon_xet_tuyen": "Tổ hợp môn xét tuyển",
+    "diem": "Điểm",
+    "diem_trung_tuyen": "Điểm trúng tuyển",
+    "diem_cong": "Điểm cộng",
+    "nguong_dau_vao": "Ngưỡng đầu vào",
+    "hoc_phi": "Học phí",
+    "muc_hoc_phi": "Mức học phí",
+    "phuong_thuc_tuyen_sinh": "Phương thức tuyển sinh",
+    "xet_tuyen_thang": "Xét tuyển thẳng",
+    "uu_tien_xet_tuyen": "Ưu tiên xét tuyển",
+    "doi_tuong_ap_dung": "Đối tượng áp dụng",
+    "dia_chi": "Địa chỉ",
+    "dien_thoai": "Điện thoại",
+    "lien_he": "Liên hệ",
+    "mo_ta": "Mô tả",
+    "noi_dung": "Nội dung",
+    "tieu_de": "Tiêu đề",
+    "chuong": "Chương",
+    "ten_chuong": "Tên chương",
+    "dieu": "Điều",
+    "so_dieu": "Điều số",
+    "ten_dieu": "Tên điều",
+    "khoan": "Khoản",
+    "so_khoan": "Khoản số",
+    "muc": "Mục",
+    "so_muc": "Mục số",
+    "ten_muc": "Tên mục",
+    "metadata": "Thông tin văn bản",
+    "ten_tai_lieu": "Tên tài liệu",
+    "so_hieu_van_ban": "Số hiệu văn bản",
+    "ngay_ky": "Ngày ký",
+    "ngay_thanh_lap": "Ngày thành lập",
+    "quyet_dinh_so": "Quyết định số",
+    "thong_tin_chung": "Thông tin chung",
+    "tuyen_sinh_dai_hoc": "Tuyển sinh đại học",
+    "ty_le_tien_si": "Tỷ lệ tiến sĩ",
+    "ty_le_giao_su_va_pho_giao_su": "Tỷ lệ giáo sư và phó giáo sư",
+    "ty_le_viec_lam": "Tỷ lệ việc làm",
+    "co_so_dao_tao": "Cơ sở đào tạo",
+    "ten_co_so_dao_tao": "Tên cơ sở đào tạo",
+    "ma_co_so": "Mã cơ sở",
+    "dia_chi_tru_so": "Địa chỉ trụ sở",
+    "nam_tuyen_sinh": "Năm tuyển sinh",
+    "hinh_thuc_dao_tao": "Hình thức đào tạo",
+    "trang_thong_tin_dien_tu": "Trang thông tin điện tử",
+    "doi_tuong_dieu_kien_du_tuyen": "Đối tượng, điều kiện dự tuyển",
+    "chi_tiet_phuong_thuc": "Chi tiết phương thức",
+    "xet_tuyen_theo_ket_qua_thpt": "Xét tuyển theo kết quả THPT",
+    "xet_tuyen_theo_hsa": "Xét tuyển theo HSA",
+    "xet_tuyen_theo_sat": "Xét tuyển theo SAT",
+    "mon": "Môn",
+    "nganh_xet_tuyen": "Ngành xét tuyển",
+    "quy_doi_diem_tieng_anh": "Quy đổi điểm tiếng Anh",
+    "chi_tieu_tuyen_sinh": "Chỉ tiêu tuyển sinh",
+    "danh_sach_nganh": "Danh sách ngành",
+    "chinh_sach_uu_tien": "Chính sách ưu tiên",
+    "noi_dung_quy_dinh": "Nội dung quy định",
+    "thong_tin_tuyen_sinh_2_nam_gan_nhat": "Thông tin tuyển sinh 2 năm gần nhất",
+    "gioi_thieu_truong": "Giới thiệu trường",
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+
+
+def label(key: str) -> str:
+    """Nhãn dễ đọc của một key JSON"""
+    if key in LABELS:
+        return LABELS[key]
+    text = key.replace("_", " ").strip()
+    return text[:1].upper() + text[1:]
+
+
+def _scalar(value) -> str:
+    if isinstance(value, bool):
+        return "Có" if value else "Không"
+    return str(value)
+
+
+def render_lines(value, path: Tuple[str, ...] = ()) -> List[Tuple[Tuple[str, ...], str]]:
+    """
+    Làm phẳng dữ liệu JSON thành các dòng "Nhãn: giá trị" kèm đường dẫn mục chứa dòng đó.
+    Giá trị rỗng (None, "", [], {}) bị bỏ qua; danh sách giá trị đơn nối bằng "; ".
+
+    Returns:
+        List[Tuple]: (đường dẫn các nhãn mục, dòng)
+    """
+    lines = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if item is None or item == "" or item == [] or item == {}:
+                continue
+            if isinstance(item, (dict, list)) and not _is_flat_list(item):
+                lines.extend(render_lines(item, path + (label(key),)))
+            elif isinstance(item, list):
+                lines.append((path, f"{label(key)}: {'; '.join(_scalar(x) for x in item)}"))
+            else:
+                lines.append((path, f"{label(key)}: {_scalar(item)}"))
+    elif isinstance(value, list):
+        if _is_flat_list(value):
+            lines.extend((path, f"- {_scalar(x)}") for x in value)
+        elif all(_is_flat_record(item) for item in value):
+            # Bảng: mỗi phần tử một dòng "- Nhãn: giá trị | Nhãn: giá trị"
+            for item in value:
+                cells = [line for _, line in render_lines(item)]
+                if cells:
+                    lines.append((path, f"- {' | '.join(cells)}"))
+        else:
+            name = path[-1] if path else ""
+            for i, item in enumerate(value, start=1):
+                lines.extend(render_lines(item, path[:-1] + (f"{name} {i}".strip(),)))
+    elif value is not None:
+        lines.append((path, _scalar(value)))
+    return lines
+
+
+def _is_flat_list(value) -> bool:
+    return isinstance(value, list) and all(not isinstance(x, (dict, list)) for x in value)
+
+
+def _is_flat_record(value) -> bool:
+    return isinstance(value, dict) and all(not isinstance(x, (dict, list)) or _is_flat_list(x)
+                                           for x in value.values())
+
+
+def _heading(path: Tuple[str, ...]) -> str:
+    return f"[{' > '.join(path)}]" if path else ""
+
+
+def render_compact(value) -> str:
+    """Dựng nội dung document gọn: tiêu đề mục chỉ xuất hiện khi mục thay đổi"""
+    out, current = [], ()
+    for path, line in render_lines(value):
+        if path != current and path:
+            out.append(_heading(path))
+        current = path
+        out.append(line)
+    return "\n".join(out)
+
+
+def render(value, mode: str = DOC_RENDER_MODE) -> str:
+    if mode == "json":
+        return json.dumps(value, ensure_ascii=False, indent=2)
+    return render_compact(value)
+
+
+def _pack(sizes: List[int], target: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Gom các đơn vị liên tiếp thành nhóm khoảng target token;
+    nhóm sau bắt đầu lại từ các đơn vị cuối (tối đa overlap token) của nhóm trước.
+
+    Returns:
+        List[Tuple[int, int]]: Các khoảng [đầu, cuối) theo chỉ số đơn vị
+    """
+    ranges, start, size = [], 0, 0
+    for i, tokens in enumerate(sizes):
+        if i > start and size + tokens > target:
+            ranges.append((start, i))
+            new_start, size = i, 0
+            while new_start - 1 > start and size + sizes[new_start - 1] <= overlap:
+                new_start -= 1
+                size += sizes[new_start]
+            start = new_start
+        size += tokens
+    ranges.append((start, len(sizes)))
+    return ranges
+
+
+def _split_long_line(line: str, target: int, overlap: int) -> List[str]:
+    """Cắt một dòng quá dài theo câu (hoặc theo từ nếu câu vẫn quá dài), có gối đầu"""
+    units = []
+    for sentence in _SENTENCE_END.split(line):
+        if estimate_tokens(sentence) <= target:
+            units.append(sentence)
+        else:
+            units.extend(sentence.split())
+    ranges = _pack([estimate_tokens(unit + " ") for unit in units], target, overlap)
+    return [" ".join(units[start:end]) for start, end in ranges]
+
+
+def chunk_text(text: str, target: int = CHUNK_TARGET_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """
+    Chia văn bản thành các chunk khoảng target token, cắt theo dòng; chunk sau lặp lại
+    tối đa overlap token cuối của chunk trước. Mỗi chunk (trừ chunk đầu) được mở đầu
+    bằng tiêu đề mục "[A > B]" gần nhất để không mất ngữ cảnh.
+
+    Args:
+        text (str): Nội dung document (dạng compact hoặc json)
+        target (int): Số token mục tiêu của một chunk
+        overlap (int): Số token gối đầu
+
+    Returns:
+        List[str]: Các chunk; văn bản ngắn hơn target được giữ nguyên
+    """
+    if estimate_tokens(text) <= target:
+        return [text]
+    lines = []
+    for line in text.split("\n"):
+        if estimate_tokens(line) > target:
+            lines.extend(_split_long_line(line, target, overlap))
+        else:
+            lines.append(line)
+
+    # Tiêu đề mục đang áp dụng cho từng dòng
+    headings, current = [], ""
+    for line in lines:
+        if line.startswith("[") and line.endswith("]"):
+            current = line
+        headings.append(current)
+
+    chunks = []
+    for start, end in _pack([estimate_tokens(line + "\n") for line in lines], target, overlap):
+        group = lines[start:end]
+        if chunks and headings[start] and group[0] != headings[start]:
+            group = [headings[start]] + group
+        chunks.append("\n".join(group))
+    return chunks
+
+
+def token_report(documents) -> Dict[str, Dict[str, int]]:
+    """
+    Returns:
+        Dict: source -> {"docs", "tokens", "max_tokens"} (token ước lượng của page_content)
+    """
+    report: Dict[str, Dict[str, int]] = {}
+    for doc in documents:
+        entry = report.setdefault(doc.metadata.get("source", ""), {"docs": 0, "tokens": 0, "max_tokens": 0})
+        tokens = estimate_tokens(doc.page_content)
+        entry["docs"] += 1
+        entry["tokens"] += tokens
+        entry["max_tokens"] = max(entry["max_tokens"], tokens)
+    return report
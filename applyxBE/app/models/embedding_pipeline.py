@@ -0,0 +1,169 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Số document trong một request embedding
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Số request embedding chạy song song
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Số request embedding tối đa mỗi phút (theo quota của API key)
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "150"))
+# Số lần thử lại tối đa cho một batch bị lỗi tạm thời (429, 5xx, timeout)
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+# Thời gian chờ trước lần thử lại đầu tiên (giây), nhân đôi sau mỗi lần
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "1.0"))
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "60"))
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+                    "TooManyRequests", "RateLimitError"}
+
+
+class TokenBucket:
+    """
+    Giới hạn tốc độ kiểu token bucket: token được nạp đều theo `rate` mỗi
+    giây, tối đa `capacity` token (cho phép một đợt ngắn vượt tốc độ trung bình).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens: float = 1.0):
+        """Chờ (chặn thread) cho tới khi đủ token"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                delay = (tokens - self._tokens) / self.rate
+                self.waited_seconds += delay
+            time.sleep(delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Lỗi tạm thời (quá quota, server quá tải, timeout) thì nên thử lại"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in _RETRYABLE_NAMES:
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if callable(status):
+        status = status()
+    try:
+        if int(status) in _RETRYABLE_STATUS:
+            return True
+    except (TypeError, ValueError):
+        pass
+    return "429" in str(error) or "quota" in str(error).lower()
+
+
+class EmbeddingPipeline:
+    """
+    Embed một danh sách văn bản theo batch:
+    - batch_size văn bản mỗi request, tối đa concurrency request song song
+    - mỗi request lấy một token từ TokenBucket (requests_per_minute)
+    - lỗi tạm thời được thử lại với exponential backoff + jitter
+    - mỗi batch xong được báo qua `on_batch` (dùng để checkpoint), nên khi
+      bị dừng giữa chừng, các batch đã xong không phải embed lại
+    """
+
+    def __init__(self, batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY,
+                 requests_per_minute: float = EMBED_REQUESTS_PER_MINUTE, max_retries: int = EMBED_MAX_RETRIES,
+                 backoff_base: float = EMBED_BACKOFF_BASE, backoff_max: float = EMBED_BACKOFF_MAX):
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.limiter = TokenBucket(requests_per_minute / 60, capacity=self.concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._stats = {"batches": 0, "texts": 0, "retries": 0}
+
+    def _embed_batch(self, embed_batch: Callable[[List[str]], List[List[float]]],
+                     texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                vectors = embed_batch(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"API trả về {len(vectors)} embedding cho {len(texts)} văn bản")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay *= random.uniform(0.5, 1.0)
+                attempt += 1
+                self._stats["retries"] += 1
+                logger.warning(f"Lỗi embedding ({e}), thử lại lần {attempt} sau {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, embed_batch: Callable[[List[str]], List[List[float]]], texts: List[str],
+            on_batch: Optional[Callable[[int, List[List[float]]], None]] = None) -> List[List[float]]:
+        """
+        Args:
+            embed_batch: Hàm embed một batch (ví dụ embeddings.embed_documents)
+            texts (List[str]): Các văn bản cần embed
+            on_batch: Gọi (trên thread gọi run) khi một batch xong: on_batch(vị trí đầu batch, vectors)
+
+        Returns:
+            List[List[float]]: Embedding theo đúng thứ tự của texts
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        error: Optional[BaseException] = None
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed") as executor:
+            pending = {
+                executor.submit(self._embed_batch, embed_batch, texts[start:start + self.batch_size]): start
+                for start in range(0, len(texts), self.batch_size)
+            }
+            while pending:
+                try:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                except BaseException as e:
+                    # Bị ngắt (Ctrl+C): dừng nhận batch mới như khi có lỗi
+                    error = error or e
+                    done = set()
+                for future in done:
+                    start = pending.pop(future)
+                    try:
+                        vectors = future.result()
+                    except BaseException as e:
+                        error = error or e
+                        continue
+                    results[start:start + len(vectors)] = vectors
+                    self._stats["batches"] += 1
+                    self._stats["texts"] += len(vectors)
+                    if on_batch is not None:
+                        on_batch(start, vectors)
+                if error is not None:
+                    # Hủy các batch chưa chạy; batch đang chạy vẫn được chờ và checkpoint
+                    for future in list(pending):
+                        if future.cancel():
+                            del pending[future]
+        if error is not None:
+            raise error
+        return results
+
+    def stats(self) -> Dict:
+        return {
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "rate_limited_seconds": round(self.limiter.waited_seconds, 3),
+            **self._stats,
+        }
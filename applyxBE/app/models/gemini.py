@@ -1,22 +1,141 @@
 import google.generativeai as genai
 import os
 import logging
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.services.concurrency import run_blocking
+from app.services.career_analytics import CareerAnalytics, first_choice
+from app.services.history_policy import SUMMARY_MODEL, HistoryPolicy, estimate_tokens
+from app.services.results_store import ResultsStore
+from app.services.session_store import create_session_store
 
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# System instruction cố định của ApplyX: vai trò của bot và kịch bản khảo sát Ikigai.
+# Được dựng một lần khi import và gắn vào model qua system_instruction, nên session
+# chỉ còn lưu các lượt hội thoại thật thay vì một bản sao của 4 tin nhắn mồi.
+IKIGAI_SYSTEM_INSTRUCTION = (
+    "Từ bây giờ, bạn là một chatbot của applyX, một nền tảng hỗ trợ tuyển sinh "
+    "do trường Đại Học Công Nghệ - ĐHQG phát triển. Hãy luôn nhớ vai trò này. "
+    "Bạn sẽ hỗ trợ học sinh, phụ huynh về các thông tin tuyển sinh, học bổng, "
+    "chương trình đào tạo, hướng nghiệp bằng ikigai, và các câu hỏi liên quan đến việc xét tuyển vào trường. "
+    "Hãy trả lời một cách thân thiện, chính xác và hữu ích.\n\n"
+    "Bây giờ bạn hãy tạo ra một cuộc hội thoại kiểu như một bài khảo sát định hướng nghề nghiệp dựa trên nguyên lý Ikigai. "
+    "Bạn sẽ hỏi lần lượt 18 câu hỏi, bao gồm 8 câu hỏi cơ bản sau đây và 10 câu hỏi bổ sung dựa trên câu trả lời của tôi để tạo ra những câu hỏi sâu hơn, cá nhân hóa hơn.\n\n"
+
+    "**18 câu hỏi - PHẢI HỎI CHÍNH XÁC THEO CẤU TRÚC NÀY:**\n\n"
+
+    "**Câu 1: Hoạt động nào khiến bạn thấy hứng thú và muốn làm hàng ngày?\n"
+    "a) Sáng tạo nghệ thuật (vẽ, viết, thiết kế)\n"
+    "b) Giải quyết vấn đề logic hoặc kỹ thuật\n"
+    "c) Hỗ trợ và giúp đỡ người khác\n"
+    "d) Khám phá và học hỏi những điều mới\n"
+    "e) Khác\n\n"
+
+    "**Câu 2: Khi rảnh rỗi, bạn thường thích làm gì nhất?\n"
+    "a) Tham gia các hoạt động nhóm, giao lưu\n"
+    "b) Nghiên cứu một lĩnh vực chuyên sâu\n"
+    "c) Làm việc với công cụ sáng tạo\n"
+    "d) Thử thách bản thân với trò chơi trí tuệ\n"
+    "e) Khác\n\n"
+
+    "**Câu 3: Bạn nghĩ xã hội hiện tại cần cải thiện điều gì nhất?\n"
+    "a) Công nghệ và đổi mới\n"
+    "b) Giáo dục và tri thức\n"
+    "c) Sức khỏe và môi trường\n"
+    "d) Công bằng và phát triển cộng đồng\n"
+    "e) Khác\n\n"
+
+    "**Câu 4: Nếu bạn có thể đóng góp cho thế giới, bạn muốn đóng góp theo cách nào?\n"
+    "a) Tạo ra sản phẩm hữu ích\n"
+    "b) Giúp người khác phát triển kỹ năng\n"
+    "c) Giải quyết vấn đề môi trường/xã hội\n"
+    "d) Mang lại niềm vui và cảm hứng\n"
+    "e) Khác\n\n"
+
+    "**Câu 5: Bạn nhận được lời khen nhiều nhất ở khả năng nào?\n"
+    "a) Giao tiếp và thuyết phục\n"
+    "b) Phân tích và xử lý dữ liệu\n"
+    "c) Tư duy sáng tạo\n"
+    "d) Lập kế hoạch và tổ chức\n"
+    "e) Khác\n\n"
+
+    "**Câu 6: Khi đối mặt với một vấn đề khó, bạn thường:\n"
+    "a) Tìm cách sáng tạo để giải quyết\n"
+    "b) Phân tích nguyên nhân cặn kẽ\n"
+    "c) Hỏi ý kiến và hợp tác cùng người khác\n"
+    "d) Lập kế hoạch cụ thể và từng bước\n"
+    "e) Khác\n\n"
+
+    "**Câu 7: Lĩnh vực nào bạn nghĩ mình có thể kiếm sống lâu dài?\n"
+    "a) Công nghệ thông tin và AI\n"
+    "b) Giáo dục và đào tạo\n"
+    "c) Kinh doanh và marketing\n"
+    "d) Y tế và chăm sóc sức khỏe\n"
+    "e) Khác\n\n"
+
+    "**Câu 8: Nếu được chọn một kỹ năng để phát triển chuyên nghiệp, bạn chọn:\n"
+    "a) Lập trình và công nghệ\n"
+    "b) Giao tiếp và ngoại ngữ\n"
+    "c) Quản lý dự án\n"
+    "d) Sáng tạo nội dung\n"
+    "e) Khác\n\n"
+
+    "**Hướng dẫn thực hiện:**\n"
+    "- QUAN TRỌNG: Phải hỏi chính xác theo đúng cấu trúc trên, không được thay đổi nội dung câu hỏi hoặc các lựa chọn a, b, c, d, e với các câu hỏi cơ bản, không cảm ơn, không thêm giải thích hoặc ký tự thừa, không in đậm không in nghiêng\n"
+    "- Hỏi từng câu một, đợi tôi trả lời trước khi chuyển sang câu tiếp theo\n"
+    "- Sau 8 câu cơ bản (Câu 1 đến Câu 8), tạo thêm CHÍNH XÁC 10 câu hỏi cá nhân hóa (từ Option 9 đến Option 18) dựa trên câu trả lời của tôi\n"
+    "- 10 câu hỏi bổ sung phải tuân thủ quy tắc hiển thị sau:\n"
+    "  + Option 9: câu hỏi bạn tạo ra...\n"
+    "  + Option 10: câu hỏi bạn tạo ra...\n"
+    "  + Option 11: câu hỏi bạn tạo ra...\n"
+    "  + ...\n"
+    "  + Option 18: câu hỏi bạn tạo ra...\n"
+    "- BẮT BUỘC: Phải hỏi đủ 18 câu hỏi (8 câu cố định + 10 câu cá nhân hóa)\n"
+    "- Các câu hỏi bổ sung phải bám sát vào người trả lời để hiểu rõ hơn về đam mê, khả năng, giá trị và nhu cầu thị trường của họ\n"
+    "- Chỉ sau khi tôi trả lời xong TẤT CẢ 18 câu hỏi, hãy trả về kết quả theo đúng cấu trúc JSON sau (chỉ trả về JSON, không thêm giải thích hoặc ký tự thừa):\n"
+    "{"
+    "\"careers\": ["
+    "{"
+    "\"rank\": 1,"
+    "\"title\": \"Tên nghề nghiệp\","
+    "\"subtitle\": \"Mô tả ngắn\","
+    "\"averageScore\": 95,"
+    "\"worldNeedsScore\": 90,"
+    "\"paidScore\": 60,"
+    "\"loveScore\": 90,"
+    "\"goodAtScore\": 80,"
+    "\"color\": \"#FFB800\","
+    "\"explanation\": \"Giải thích chi tiết về nghề này dựa trên 4 yếu tố Ikigai\""
+    "},"
+    "..."
+    "]"
+    "}"
+    "- Mỗi nghề nghiệp là một object trong mảng \"careers\". Các trường số là số nguyên, color là mã màu hex, explanation là chuỗi.\n"
+    "- BẮT BUỘC: Trong mảng \"careers\" phải có ít nhất 3 nghề nghiệp khác nhau.\n"
+    "- Chỉ trả về đúng cấu trúc JSON trên, không thêm bất kỳ văn bản nào khác.\n"
+    "- Khi người dùng nói \"Bắt đầu khảo sát ikigai\", hãy bắt đầu với Câu 1 và tiếp tục đến Option 18.\n"
+    "- 8 câu hỏi đầu phải bắt đầu bằng \"Câu [số]: \", 10 câu tiếp theo phải bắt đầu bằng \"Option [số]: \".\n"
+    "- Khi đặt câu hỏi: không cảm ơn, không giải thích, không in đậm in nghiêng."
+)
+
 class ApplyXChatbot:
-    def __init__(self, api_key: str = None, model : str = 'gemini-2.5-flash'):
+    def __init__(self, api_key: str = None, model : str = 'gemini-2.5-flash', results: Optional[ResultsStore] = None,
+                 analytics: Optional[CareerAnalytics] = None):
         """
         Khởi tạo ApplyX Chatbot
         
         Args:
             api_key (str): API key cho Gemini. Nếu None thì sẽ lấy từ env variable
             model (str): tên model 
+            results (ResultsStore): Nơi lưu kết quả Ikigai. Nếu None thì dùng RESULTS_LOG_PATH
+            analytics (CareerAnalytics): Thống kê nghề nghiệp. App truyền instance dùng chung với
+                /analytics/careers; None (script chạy riêng) thì tạo mới theo ANALYTICS_DB_PATH
         """
         try:
             # Cấu hình API key
@@ -25,10 +144,22 @@ class ApplyXChatbot:
             
             
             # Khởi tạo model
-            self.model = genai.GenerativeModel(model)
+            self.model = genai.GenerativeModel(model, system_instruction=IKIGAI_SYSTEM_INSTRUCTION)
+            
+            # Nơi lưu các chat sessions (bộ nhớ, SQLite hoặc Redis theo SESSION_STORE)
+            self.store = create_session_store("ikigai")
+
+            # Kết quả Ikigai theo session (session_data.txt cũ được chuyển vào lúc khởi động app,
+            # xem ChatService.import_legacy_results)
+            self.results = results if results is not None else ResultsStore()
+
+            # Thống kê nghề nghiệp cộng dồn mỗi lần lưu kết quả (các kết quả có từ trước được
+            # cộng lúc khởi động app, xem backfill_analytics)
+            self.analytics = analytics if analytics is not None else CareerAnalytics()
             
-            # Dictionary lưu trữ các chat sessions
-            self.sessions = {}
+            # Giới hạn lịch sử gửi mỗi lượt; lượt cũ được tóm tắt nền bằng model nhẹ
+            self.history_policy = HistoryPolicy()
+            self.summary_model = genai.GenerativeModel(SUMMARY_MODEL)
             
             logger.info("ApplyX Chatbot đã được khởi tạo thành công sử dụng api key" + api_key)
             
@@ -36,142 +167,9 @@ class ApplyXChatbot:
             logger.error(f"Lỗi khởi tạo ApplyX Chatbot: {e}")
             raise e
     
-    def get_initial_system_prompt(self) -> List[Dict]:
-        """Trả về system prompt ban đầu cho ApplyX bot"""
-        return [
-            {
-                "role": "user",
-                "parts": [
-                    "Từ bây giờ, bạn là một chatbot của applyX, một nền tảng hỗ trợ tuyển sinh "
-                    "do trường Đại Học Công Nghệ - ĐHQG phát triển. Hãy luôn nhớ vai trò này. "
-                    "Bạn sẽ hỗ trợ học sinh, phụ huynh về các thông tin tuyển sinh, học bổng, "
-                    "chương trình đào tạo, hướng nghiệp bằng ikigai, và các câu hỏi liên quan đến việc xét tuyển vào trường. "
-                    "Hãy trả lời một cách thân thiện, chính xác và hữu ích."
-                ]
-            },
-            {
-                "role": "model",
-                "parts": [
-                    "Xin chào! Tôi là chatbot của ApplyX - nền tảng hỗ trợ tuyển sinh của "
-                    "Đại học Công nghệ - ĐHQG Hà Nội. Tôi sẵn sàng hỗ trợ bạn các thông tin "
-                    "về tuyển sinh, học bổng, chương trình đào tạo, hướng nghiệp bằng ikigai và mọi câu hỏi liên quan "
-                    "đến việc xét tuyển vào trường. Bạn có câu hỏi gì cần tôi hỗ trợ không?"
-                ]
-            },
-            {
-                "role": "user",
-                "parts": [
-                    "Bây giờ bạn hãy tạo ra một cuộc hội thoại kiểu như một bài khảo sát định hướng nghề nghiệp dựa trên nguyên lý Ikigai. "
-                    "Bạn sẽ hỏi lần lượt 18 câu hỏi, bao gồm 8 câu hỏi cơ bản sau đây và 10 câu hỏi bổ sung dựa trên câu trả lời của tôi để tạo ra những câu hỏi sâu hơn, cá nhân hóa hơn.\n\n"
-                    
-                    "**18 câu hỏi - PHẢI HỎI CHÍNH XÁC THEO CẤU TRÚC NÀY:**\n\n"
-                    
-                    "**Câu 1: Hoạt động nào khiến bạn thấy hứng thú và muốn làm hàng ngày?\n"
-                    "a) Sáng tạo nghệ thuật (vẽ, viết, thiết kế)\n"
-                    "b) Giải quyết vấn đề logic hoặc kỹ thuật\n"
-                    "c) Hỗ trợ và giúp đỡ người khác\n"
-                    "d) Khám phá và học hỏi những điều mới\n"
-                    "e) Khác\n\n"
-                    
-                    "**Câu 2: Khi rảnh rỗi, bạn thường thích làm gì nhất?\n"
-                    "a) Tham gia các hoạt động nhóm, giao lưu\n"
-                    "b) Nghiên cứu một lĩnh vực chuyên sâu\n"
-                    "c) Làm việc với công cụ sáng tạo\n"
-                    "d) Thử thách bản thân với trò chơi trí tuệ\n"
-                    "e) Khác\n\n"
-                    
-                    "**Câu 3: Bạn nghĩ xã hội hiện tại cần cải thiện điều gì nhất?\n"
-                    "a) Công nghệ và đổi mới\n"
-                    "b) Giáo dục và tri thức\n"
-                    "c) Sức khỏe và môi trường\n"
-                    "d) Công bằng và phát triển cộng đồng\n"
-                    "e) Khác\n\n"
-                    
-                    "**Câu 4: Nếu bạn có thể đóng góp cho thế giới, bạn muốn đóng góp theo cách nào?\n"
-                    "a) Tạo ra sản phẩm hữu ích\n"
-                    "b) Giúp người khác phát triển kỹ năng\n"
-                    "c) Giải quyết vấn đề môi trường/xã hội\n"
-                    "d) Mang lại niềm vui và cảm hứng\n"
-                    "e) Khác\n\n"
-                    
-                    "**Câu 5: Bạn nhận được lời khen nhiều nhất ở khả năng nào?\n"
-                    "a) Giao tiếp và thuyết phục\n"
-                    "b) Phân tích và xử lý dữ liệu\n"
-                    "c) Tư duy sáng tạo\n"
-                    "d) Lập kế hoạch và tổ chức\n"
-                    "e) Khác\n\n"
-                    
-                    "**Câu 6: Khi đối mặt với một vấn đề khó, bạn thường:\n"
-                    "a) Tìm cách sáng tạo để giải quyết\n"
-                    "b) Phân tích nguyên nhân cặn kẽ\n"
-                    "c) Hỏi ý kiến và hợp tác cùng người khác\n"
-                    "d) Lập kế hoạch cụ thể và từng bước\n"
-                    "e) Khác\n\n"
-                    
-                    "**Câu 7: Lĩnh vực nào bạn nghĩ mình có thể kiếm sống lâu dài?\n"
-                    "a) Công nghệ thông tin và AI\n"
-                    "b) Giáo dục và đào tạo\n"
-                    "c) Kinh doanh và marketing\n"
-                    "d) Y tế và chăm sóc sức khỏe\n"
-                    "e) Khác\n\n"
-                    
-                    "**Câu 8: Nếu được chọn một kỹ năng để phát triển chuyên nghiệp, bạn chọn:\n"
-                    "a) Lập trình và công nghệ\n"
-                    "b) Giao tiếp và ngoại ngữ\n"
-                    "c) Quản lý dự án\n"
-                    "d) Sáng tạo nội dung\n"
-                    "e) Khác\n\n"
-                    
-                    "**Hướng dẫn thực hiện:**\n"
-                    "- QUAN TRỌNG: Phải hỏi chính xác theo đúng cấu trúc trên, không được thay đổi nội dung câu hỏi hoặc các lựa chọn a, b, c, d, e với các câu hỏi cơ bản, không cảm ơn, không thêm giải thích hoặc ký tự thừa, không in đậm không in nghiêng\n"
-                    "- Hỏi từng câu một, đợi tôi trả lời trước khi chuyển sang câu tiếp theo\n"
-                    "- Sau 8 câu cơ bản (Câu 1 đến Câu 8), tạo thêm CHÍNH XÁC 10 câu hỏi cá nhân hóa (từ Option 9 đến Option 18) dựa trên câu trả lời của tôi\n"
-                    "- 10 câu hỏi bổ sung phải tuân thủ quy tắc hiển thị sau:\n"
-                    "  + Option 9: câu hỏi bạn tạo ra...\n"
-                    "  + Option 10: câu hỏi bạn tạo ra...\n"
-                    "  + Option 11: câu hỏi bạn tạo ra...\n"
-                    "  + ...\n"
-                    "  + Option 18: câu hỏi bạn tạo ra...\n"
-                    "- BẮT BUỘC: Phải hỏi đủ 18 câu hỏi (8 câu cố định + 10 câu cá nhân hóa)\n"
-                    "- Các câu hỏi bổ sung phải bám sát vào người trả lời để hiểu rõ hơn về đam mê, khả năng, giá trị và nhu cầu thị trường của họ\n"
-                    "- Chỉ sau khi tôi trả lời xong TẤT CẢ 18 câu hỏi, hãy trả về kết quả theo đúng cấu trúc JSON sau (chỉ trả về JSON, không thêm giải thích hoặc ký tự thừa):\n"
-                    "{"
-                    "\"careers\": ["
-                        "{"
-                        "\"rank\": 1,"
-                        "\"title\": \"Tên nghề nghiệp\","
-                        "\"subtitle\": \"Mô tả ngắn\","
-                        "\"averageScore\": 95,"
-                        "\"worldNeedsScore\": 90,"
-                        "\"paidScore\": 60,"
-                        "\"loveScore\": 90,"
-                        "\"goodAtScore\": 80,"
-                        "\"color\": \"#FFB800\","
-                        "\"explanation\": \"Giải thích chi tiết về nghề này dựa trên 4 yếu tố Ikigai\""
-                        "},"
-                        "..."
-                    "]"
-                    "}"
-                    "- Mỗi nghề nghiệp là một object trong mảng \"careers\". Các trường số là số nguyên, color là mã màu hex, explanation là chuỗi.\n"
-                    "- BẮT BUỘC: Trong mảng \"careers\" phải có ít nhất 3 nghề nghiệp khác nhau.\n"
-                    "- Chỉ trả về đúng cấu trúc JSON trên, không thêm bất kỳ văn bản nào khác."
-                ]
-            },
-            {
-                "role": "model",
-                "parts": [
-                    "Đã hiểu rõ! Tôi đã ghi nhận đầy đủ yêu cầu của bạn về cuộc khảo sát Ikigai:\n\n"
-                    "✅ Tôi sẽ thực hiện chính xác 18 câu hỏi tổng cộng\n"
-                    "✅ Cụ thể: 8 câu hỏi cố định (Câu 1 → Câu 8) + 10 câu hỏi cá nhân hóa (Option 9 → Option 18)\n"
-                    "✅ 8 câu hỏi đầu phải có chữ \"Câu [số]\" ở đầu ví dụ: Câu 1: ..., Câu 2: ..., v.v.\n"
-                    "✅ 10 câu hỏi tiếp theo sẽ có chữ \"Option [số]\" ở đầu từ Option 9 đến Option 18\n"
-                    "✅ Tất cả các câu hỏi sẽ được hỏi theo ĐÚNG CẤU TRÚC bạn đã cung cấp, không cảm ơn, giải thích, không in đậm in nghiêng\n"
-                    "✅ Hỏi từng câu một và đợi câu trả lời\n"
-                    "✅ Chỉ sau khi hoàn thành đủ 18 câu hỏi mới trả về kết quả JSON\n\n"
-                    "Tôi đã sẵn sàng! Khi nào bạn nói \"Bắt đầu khảo sát ikigai\", tôi sẽ bắt đầu với Câu 1 và tiếp tục đến Option 18 theo đúng format đã được cung cấp."
-                ]
-            }
-        ]
+    def get_system_instruction(self) -> str:
+        """Trả về system instruction (dùng chung, không sao chép theo session)"""
+        return IKIGAI_SYSTEM_INSTRUCTION
 
     
     def create_session(self, session_id: str = None) -> str:
@@ -189,17 +187,14 @@ class ApplyXChatbot:
             if not session_id:
                 session_id = f"session_{int(datetime.now().timestamp())}"
             
-            # Khởi tạo chat với system prompt
-            initial_history = self.get_initial_system_prompt()
-            chat = self.model.start_chat(history=initial_history)
-            
-            # Lưu session
-            self.sessions[session_id] = {
-                "chat": chat,
-                "created_at": datetime.now(),
+            # Lưu session (chỉ lưu dữ liệu, ChatSession được dựng lại khi cần)
+            now = time.time()
+            self.store.put(session_id, {
+                "created_at": now,
+                "last_activity": now,
                 "message_count": 0,
-                "last_activity": datetime.now()
-            }
+                "history": []
+            })
             
             logger.info(f"Đã tạo session: {session_id}")
             return session_id
@@ -208,6 +203,75 @@ class ApplyXChatbot:
             logger.error(f"Lỗi tạo session: {e}")
             raise e
     
+    def _get_record(self, session_id: str) -> Dict:
+        """Lấy dữ liệu session từ store, báo lỗi nếu không tồn tại"""
+        record = self.store.get(session_id)
+        if record is None:
+            raise ValueError(f"Session {session_id} không tồn tại")
+        return record
+    
+    def _build_chat(self, record: Dict):
+        """
+        Dựng lại ChatSession của Gemini từ lịch sử đã lưu (bản tóm tắt + các
+        lượt gần nhất theo HistoryPolicy)
+        
+        Returns:
+            Tuple: (ChatSession, số token prompt ước lượng chưa gồm tin nhắn mới)
+        """
+        messages, tokens = self.history_policy.prompt_messages(record)
+        history = [{"role": role, "parts": [text]} for role, text in messages]
+        return self.model.start_chat(history=history), tokens + estimate_tokens(IKIGAI_SYSTEM_INSTRUCTION)
+    
+    async def _summarize(self, prompt: str) -> str:
+        response = await self.summary_model.generate_content_async(prompt)
+        return response.text
+    
+    def _get_session_for_send(self, session_id: str, message: str) -> Dict:
+        """Kiểm tra session và tin nhắn trước khi gửi, trả về dữ liệu session"""
+        # Kiểm tra session tồn tại
+        record = self._get_record(session_id)
+        
+        # Validate input
+        if not message or not message.strip():
+            raise ValueError("Tin nhắn không được để trống")
+        
+        self.history_policy.check_budget(record, message)
+        return record
+    
+    def _extract_text(self, response) -> str:
+        """Lấy nội dung text từ phản hồi của Gemini"""
+        if not response.parts or not response.parts[0].text:
+            logger.error(f"Lỗi gửi tin nhắn: Không có phản hồi hợp lệ từ ApplyX. finish_reason: {getattr(response.candidates[0], 'finish_reason', None)}")
+            raise ValueError("Không có phản hồi hợp lệ từ ApplyX. Vui lòng thử lại với nội dung khác.")
+        return response.text
+    
+    def _save_turn(self, session_id: str, message: str, bot_response: str, prompt_tokens: int):
+        """Ghi lượt hội thoại và thống kê vào session store (blocking)"""
+        def apply(record: Dict):
+            record["history"].append(["user", message.strip()])
+            record["history"].append(["model", bot_response])
+            record["message_count"] += 1
+            record["last_activity"] = time.time()
+            HistoryPolicy.add_usage(record, prompt_tokens + estimate_tokens(message), bot_response)
+        
+        try:
+            record = self.store.update(session_id, apply)
+        except KeyError:
+            raise ValueError(f"Session {session_id} không tồn tại")
+        logger.info(f"Session {session_id} - User: {message[:50]}...")
+        logger.info(f"Session {session_id} - Bot: {bot_response[:50]}...")
+        return record
+    
+    def _record_turn(self, session_id: str, message: str, bot_response: str, prompt_tokens: int):
+        """Lưu lượt hội thoại, cập nhật thống kê session và lên lịch tóm tắt nếu cần"""
+        record = self._save_turn(session_id, message, bot_response, prompt_tokens)
+        self.history_policy.schedule_summary(self.store, session_id, record, self._summarize)
+    
+    async def _arecord_turn(self, session_id: str, message: str, bot_response: str, prompt_tokens: int):
+        """Như _record_turn nhưng ghi session store trên executor, không chặn event loop"""
+        record = await run_blocking(self._save_turn, session_id, message, bot_response, prompt_tokens)
+        self.history_policy.schedule_summary(self.store, session_id, record, self._summarize)
+    
     def send_message(self, session_id: str, message: str) -> str:
         """
         Gửi tin nhắn trong một session
@@ -220,38 +284,90 @@ class ApplyXChatbot:
             str: Phản hồi của bot
         """
         try:
-            # Kiểm tra session tồn tại
-            if session_id not in self.sessions:
-                raise ValueError(f"Session {session_id} không tồn tại")
-            
-            # Validate input
-            if not message or not message.strip():
-                raise ValueError("Tin nhắn không được để trống")
-            
-            # Lấy chat instance
-            session = self.sessions[session_id]
-            chat = session["chat"]
+            record = self._get_session_for_send(session_id, message)
+            chat, prompt_tokens = self._build_chat(record)
             
             # Gửi tin nhắn
             response = chat.send_message(message.strip())
-            if not response.parts or not response.parts[0].text:
-                logger.error(f"Lỗi gửi tin nhắn: Không có phản hồi hợp lệ từ ApplyX. finish_reason: {getattr(response.candidates[0], 'finish_reason', None)}")
-                raise ValueError("Không có phản hồi hợp lệ từ ApplyX. Vui lòng thử lại với nội dung khác.")
-            bot_response = response.text
+            bot_response = self._extract_text(response)
+            
+            self._record_turn(session_id, message, bot_response, prompt_tokens)
+            return bot_response
+            
+        except Exception as e:
+            logger.error(f"Lỗi gửi tin nhắn: {e}")
+            raise e
+    
+    async def send_message_async(self, session_id: str, message: str) -> str:
+        """
+        Gửi tin nhắn trong một session mà không chặn event loop
+        
+        Dùng API async của SDK (send_message_async); nếu không có thì chạy
+        bản đồng bộ trên executor giới hạn. Số lời gọi đồng thời do
+        LLMScheduler ở tầng API điều phối.
+        
+        Args:
+            session_id (str): ID của session
+            message (str): Tin nhắn của user
             
-            # Cập nhật thống kê session
-            session["message_count"] += 1
-            session["last_activity"] = datetime.now()
+        Returns:
+            str: Phản hồi của bot
+        """
+        try:
+            record = await run_blocking(self._get_session_for_send, session_id, message)
+            chat, prompt_tokens = self._build_chat(record)
             
-            logger.info(f"Session {session_id} - User: {message[:50]}...")
-            logger.info(f"Session {session_id} - Bot: {bot_response[:50]}...")
+            if hasattr(chat, "send_message_async"):
+                response = await chat.send_message_async(message.strip())
+            else:
+                response = await run_blocking(chat.send_message, message.strip())
+            bot_response = self._extract_text(response)
             
+            await self._arecord_turn(session_id, message, bot_response, prompt_tokens)
             return bot_response
             
         except Exception as e:
             logger.error(f"Lỗi gửi tin nhắn: {e}")
             raise e
     
+    def send_message_stream(self, session_id: str, message: str) -> AsyncIterator[str]:
+        """
+        Gửi tin nhắn và nhận phản hồi dạng stream (từng đoạn text)
+        
+        Session và tin nhắn được kiểm tra ngay khi gọi (đọc session store, blocking:
+        route async gọi hàm này qua run_blocking); lịch sử và message_count chỉ được
+        cập nhật sau khi stream kết thúc trọn vẹn.
+        
+        Args:
+            session_id (str): ID của session
+            message (str): Tin nhắn của user
+            
+        Returns:
+            AsyncIterator[str]: Các đoạn text của phản hồi
+        """
+        record = self._get_session_for_send(session_id, message)
+        return self._stream_reply(session_id, record, message)
+    
+    async def _stream_reply(self, session_id: str, record: Dict, message: str) -> AsyncIterator[str]:
+        # ChatSession chỉ sống trong lượt này nên stream dang dở không làm hỏng lịch sử đã lưu
+        chat, prompt_tokens = self._build_chat(record)
+        chunks = []
+        try:
+            response = await chat.send_message_async(message.strip(), stream=True)
+            async for chunk in response:
+                text = chunk.text if chunk.parts else ""
+                if text:
+                    chunks.append(text)
+                    yield text
+        except BaseException as e:
+            logger.error(f"Lỗi stream tin nhắn: {e!r}")
+            raise
+        
+        bot_response = "".join(chunks)
+        if not bot_response:
+            raise ValueError("Không có phản hồi hợp lệ từ ApplyX. Vui lòng thử lại với nội dung khác.")
+        await self._arecord_turn(session_id, message, bot_response, prompt_tokens)
+    
     def get_chat_history(self, session_id: str) -> List[Dict]:
         """
         Lấy lịch sử chat của session
@@ -263,16 +379,13 @@ class ApplyXChatbot:
             List[Dict]: Danh sách các tin nhắn
         """
         try:
-            if session_id not in self.sessions:
-                raise ValueError(f"Session {session_id} không tồn tại")
-            
-            chat = self.sessions[session_id]["chat"]
+            record = self._get_record(session_id)
             history = []
             
-            for message in chat.history:
+            for role, text in record["history"]:
                 history.append({
-                    "role": message.role,
-                    "content": message.parts[0].text if message.parts else "",
+                    "role": role,
+                    "content": text,
                     "timestamp": datetime.now().isoformat()
                 })
             
@@ -292,15 +405,12 @@ class ApplyXChatbot:
         Returns:
             Dict: Thông tin session
         """
-        if session_id not in self.sessions:
-            raise ValueError(f"Session {session_id} không tồn tại")
-        
-        session = self.sessions[session_id]
+        record = self._get_record(session_id)
         return {
             "session_id": session_id,
-            "created_at": session["created_at"].isoformat(),
-            "last_activity": session["last_activity"].isoformat(),
-            "message_count": session["message_count"]
+            "created_at": datetime.fromtimestamp(record["created_at"]).isoformat(),
+            "last_activity": datetime.fromtimestamp(record["last_activity"]).isoformat(),
+            "message_count": record["message_count"]
         }
     
     def list_sessions(self) -> List[Dict]:
@@ -311,8 +421,12 @@ class ApplyXChatbot:
             List[Dict]: Danh sách thông tin các sessions
         """
         sessions_info = []
-        for session_id in self.sessions:
-            sessions_info.append(self.get_session_info(session_id))
+        for session_id in self.store.list_ids():
+            try:
+                sessions_info.append(self.get_session_info(session_id))
+            except ValueError:
+                # Session vừa bị xóa bởi worker khác
+                continue
         
         return sessions_info
     
@@ -326,69 +440,77 @@ class ApplyXChatbot:
         Returns:
             bool: True nếu xóa thành công
         """
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        if self.store.delete(session_id):
             logger.info(f"Đã xóa session: {session_id}")
             return True
         return False
     
-    def cleanup_old_sessions(self, max_age_hours: int = 24):
+    def cleanup_old_sessions(self, max_age_hours: float = 24, max_sessions: int = None,
+                             max_bytes: int = None) -> List[str]:
         """
-        Xóa các sessions cũ
+        Xóa các sessions cũ, sau đó xóa các session ít dùng gần đây nhất nếu
+        vượt quá giới hạn số lượng hoặc dung lượng
         
         Args:
-            max_age_hours (int): Số giờ tối đa để giữ session
+            max_age_hours (float): Số giờ tối đa để giữ session
+            max_sessions (int): Số session tối đa (None: không giới hạn)
+            max_bytes (int): Tổng dung lượng session tối đa (None: không giới hạn)
+            
+        Returns:
+            List[str]: Các session đã bị xóa
         """
-        current_time = datetime.now()
-        sessions_to_delete = []
-        
-        for session_id, session_data in self.sessions.items():
-            age = current_time - session_data["last_activity"]
-            if age.total_seconds() > max_age_hours * 3600:
-                sessions_to_delete.append(session_id)
-        
-        for session_id in sessions_to_delete:
-            self.delete_session(session_id)
+        sessions_to_delete = self.store.sweep(max_age_hours * 3600, max_sessions, max_bytes)
             
         if sessions_to_delete:
             logger.info(f"Đã xóa {len(sessions_to_delete)} sessions cũ")
-    def saveResultsBySession(self, session_id, result: str):
+        return sessions_to_delete
+    def _first_choice(self, session_id: str, record: Optional[Dict] = None) -> Optional[str]:
+        """Lựa chọn Câu 1 của session (None nếu session đã hết hạn hoặc chưa trả lời)"""
+        record = record or self.store.get(session_id)
+        return first_choice(record["history"]) if record else None
+    def saveResultsBySession(self, session_id, result: str, profile_id: Optional[str] = None) -> Dict:
         """
             frontend gửi result về be lưu lại để truy vấn sau này
-            Lưu vào file session/session_data.txt, ghi đè mỗi lần lưu
+            Lưu vào ResultsStore theo session (và profile nếu có); careers được parse / kiểm tra một lần khi lưu
+            rồi cộng vào thống kê nghề nghiệp (CareerAnalytics)
+
+        Raises:
+            ValueError: Session không tồn tại hoặc result không phải JSON careers hợp lệ
         """
-        if session_id not in self.sessions:
+        session = self.store.get(session_id)
+        if session is None:
             raise ValueError(f"Session {session_id} không tồn tại")
-        # Lưu kết quả vào session (bộ nhớ)
-        self.sessions[session_id]["result"] = result
-        logger.info(f"Đã lưu kết quả cho session {session_id}")
-
-        # Đảm bảo thư mục session tồn tại
-        session_dir = os.path.join(os.path.dirname(__file__), "..", "session")
-        session_dir = os.path.abspath(session_dir)
-        os.makedirs(session_dir, exist_ok=True)
+        record = self.results.save(session_id, result, profile_id)
+        logger.info(f"Đã lưu kết quả cho session {session_id} ({len(record['careers'])} nghề)")
+        try:
+            self.analytics.record(record, self._first_choice(session_id, session))
+        except Exception as e:
+            # Kết quả đã được lưu; thống kê lỗi không làm hỏng request của người dùng
+            logger.error(f"Lỗi cập nhật thống kê cho session {session_id}: {e}")
+        return record
+    def backfill_analytics(self) -> int:
+        """
+        Cộng các kết quả đã lưu vào thống kê nếu thống kê còn trống (bước khởi động một lần,
+        chạy sau khi đã chuyển session_data.txt cũ)
 
-        # Ghi đè dữ liệu vào file session_data.txt
-        file_path = os.path.join(session_dir, "session_data.txt")
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(f"session_id: {session_id}\n")
-            f.write(f"result: {result}\n")
-        logger.info(f"Đã ghi kết quả vào file {file_path}")
-    def getResultsBySession(self, session_id):
+        Returns:
+            int: Số kết quả đã cộng
+        """
+        if not self.analytics.is_empty():
+            return 0
+        records = list(self.results.records())
+        return self.analytics.backfill(records, {r["session_id"]: self._first_choice(r["session_id"])
+                                                 for r in records})
+    def getResultsBySession(self, session_id) -> Optional[Dict]:
         """
-        Đọc dữ liệu đã lưu từ file session/session_data.txt
+        Đọc kết quả mới nhất đã lưu của session (vẫn đọc được sau khi session hết hạn)
         Returns:
-            str: Nội dung file (hoặc None nếu file không tồn tại)
+            Optional[Dict]: {"session_id", "profile_id", "saved_at", "result", "careers"} hoặc None
         """
-        session_dir = os.path.join(os.path.dirname(__file__), "..", "session")
-        session_dir = os.path.abspath(session_dir)
-        file_path = os.path.join(session_dir, "session_data.txt")
-        if not os.path.exists(file_path):
-            logger.warning(f"File {file_path} không tồn tại")
-            return None
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = f.read()
-        return data
+        return self.results.get(session_id)
+    def getResultsByProfile(self, profile_id) -> List[Dict]:
+        """Các kết quả đã lưu gắn với profile, mới nhất trước"""
+        return self.results.by_profile(profile_id)
 def create_applyx_bot(api_key: str = None) -> ApplyXChatbot:
     """
     Tạo instance ApplyX Chatbot
@@ -0,0 +1,85 @@
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.models.index_store import IndexWriter, content_hash, document_key, is_legacy, migrate_legacy
+
+logger = logging.getLogger(__name__)
+
+
+def _keyed_documents(docs: List[Document]) -> Dict[str, Tuple[Document, str]]:
+    keyed = {}
+    for doc in docs:
+        key = document_key(doc.metadata)
+        # Phòng trường hợp hai document trùng khóa
+        suffix = 1
+        unique_key = key
+        while unique_key in keyed:
+            suffix += 1
+            unique_key = f"{key}#{suffix}"
+        keyed[unique_key] = (doc, content_hash(doc))
+    return keyed
+
+
+def update_vector_store(docs: List[Document], embeddings: Embeddings, index_path: Path,
+                        embedding_model: str) -> Dict:
+    """
+    Cập nhật index trên đĩa theo danh sách document hiện tại: chỉ embed
+    document mới hoặc đã đổi nội dung, xóa vector của document đã đổi/bị xóa.
+    Manifest (doc_key, hash) nằm trong docs.sqlite của index (xem index_store).
+    Index định dạng cũ được chuyển sang định dạng mới trước.
+
+    Dựng lại toàn bộ khi đổi model embedding, đổi loại index (INDEX_TYPE / VECTOR_DTYPE),
+    index IVF cần huấn luyện lại, hoặc index HNSW có document bị sửa/xóa (HNSW không
+    xóa được vector). Vector của document không đổi lấy lại từ cache embedding.
+
+    Args:
+        docs (List[Document]): Toàn bộ document sinh ra từ thư mục data
+        embeddings (Embeddings): Model embedding
+        index_path (Path): Thư mục faiss_index
+        embedding_model (str): Tên model embedding, ghi vào meta.json
+
+    Returns:
+        Dict: Báo cáo {"mode", "added", "updated", "deleted", "unchanged"}
+    """
+    if is_legacy(index_path):
+        migrate_legacy(index_path, embedding_model)
+
+    keyed = _keyed_documents(docs)
+    writer = IndexWriter(index_path)
+    manifest = writer.entries()
+    stale = [key for key, (_, digest) in manifest.items()
+             if key not in keyed or digest != keyed[key][1]]
+    reason = writer.rebuild_reason(embedding_model)
+    if reason is None and stale and not writer.supports_remove:
+        reason = "index HNSW không xóa được vector"
+    deleted = sum(1 for key in manifest if key not in keyed)
+    if reason is not None:
+        logger.info(f"Dựng lại toàn bộ index '{index_path}': {reason}")
+        writer.index = None
+        manifest = {}
+        stale = []
+
+    to_add = {key: value for key, value in keyed.items()
+              if key not in manifest or manifest[key][1] != value[1]}
+    report = {
+        "mode": "incremental" if writer.index is not None else "full",
+        "added": sum(1 for key in to_add if key not in manifest),
+        "updated": sum(1 for key in to_add if key in manifest),
+        "deleted": deleted,
+        "unchanged": len(keyed) - len(to_add),
+    }
+    if not to_add and not stale and reason is None:
+        # Không ghi lại index để phiên bản index (và cache câu trả lời) giữ nguyên
+        report["mode"] = "unchanged"
+        return report
+
+    writer.delete([manifest[key][0] for key in stale])
+    items = list(to_add.items())
+    vectors = embeddings.embed_documents([doc.page_content for _, (doc, _) in items])
+    writer.add([(key, digest, doc) for key, (doc, digest) in items], vectors)
+    writer.commit(embedding_model)
+    return report
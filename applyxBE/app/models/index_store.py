@@ -0,0 +1,560 @@
+"""
+Định dạng index trên đĩa của chatbot RAG (thư mục faiss_index):
+
+    meta.json       Header phiên bản, ghi sau cùng mỗi lần cập nhật:
+                    {"format": "applyx-rag-index", "format_version": 1,
+                     "index_version": "<hex, đổi sau mỗi lần cập nhật>",
+                     "embedding_model": "models/embedding-001", "metric": "l2",
+                     "dimension": 768, "count": 8, "updated_at": "<ISO 8601>",
+                     "index_type": "hnsw", "vector_dtype": "float16",
+                     "index_params": {"factory": "HNSW32,SQfp16", "ef_search": 64,
+                                      "nprobe": null, "trained_on": null}}
+                    Meta không có index_type là index flat / float32 (trước khi có tùy chọn).
+    vectors.faiss   FAISS IndexIDMap2(<index theo index_type>); id của vector = id của
+                    dòng trong docs.sqlite. Mở bằng mmap, chỉ đọc; efSearch / nprobe
+                    lấy từ index_params khi mở.
+    docs.sqlite     Bảng docs(id, doc_key, hash, page_content, metadata JSON).
+                    doc_key/hash là manifest cho việc cập nhật tăng dần.
+                    Chỉ các dòng của top-k kết quả được đọc ở mỗi truy vấn.
+                    Bảng FTS5 docs_fts(folded), rowid = docs.id: chỉ mục BM25 trên
+                    nội dung đã bỏ dấu tiếng Việt (index cũ chưa có thì writer tự bổ sung).
+
+Không còn unpickle docstore: mỗi worker chỉ map file vào bộ nhớ, nên thời
+gian khởi động và RSS gần như không đổi khi dữ liệu tăng lên.
+
+Định dạng cũ của LangChain (index.faiss + index.pkl) vẫn đọc được, và được
+chuyển sang định dạng mới (hoặc bổ sung docs_fts) bằng: python -m app.models.index_store
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.services.text_normalize import fold_diacritics
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parents[1]
+VECTORSTORE_PATH = APP_DIR / "faiss_index"
+
+FORMAT_NAME = "applyx-rag-index"
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.faiss"
+DOCS_FILE = "docs.sqlite"
+LEGACY_FILES = ("index.faiss", "index.pkl")
+
+# Dung lượng SQLite được phép mmap khi đọc document
+DOCS_MMAP_SIZE = 256 * 1024 * 1024
+# Loại index FAISS khi tạo index mới:
+#   flat  - tìm chính xác, phù hợp dữ liệu nhỏ
+#   hnsw  - đồ thị HNSW, tìm gần đúng rất nhanh, không xóa được vector (cập nhật = dựng lại)
+#   ivf   - phân cụm IVF, cần huấn luyện
+#   ivfpq - IVF + product quantization, nhỏ nhất nhưng giảm độ chính xác
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+# Kiểu lưu vector: float32, float16 hoặc int8 (scalar quantizer); ivfpq luôn dùng mã PQ
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+# Tham số HNSW: số cạnh mỗi nút, độ rộng tìm kiếm khi dựng và khi truy vấn
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Tham số IVF: số cụm (0 = tự chọn theo số vector) và số cụm được duyệt khi truy vấn
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# Tham số PQ: số đoạn con (phải chia hết số chiều) và số bit mỗi mã
+PQ_M = int(os.getenv("PQ_M", "64"))
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+# Index IVF được huấn luyện lại (dựng lại toàn bộ) khi số vector tăng quá số lần này so với lúc huấn luyện
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "2.0"))
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+# Phần mã hóa vector của index_factory theo kiểu lưu
+_STORAGE = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
+
+# IO_FLAG_MMAP_IFC (faiss >= 1.10) map thẳng vector của index flat từ file, không copy vào heap
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def document_key(metadata: Dict) -> str:
+    """
+    Khóa ổn định của một document: file nguồn | key cha | vị trí trong danh sách.
+    Document không nằm trong danh sách (summary, raw_data) dùng type thay cho vị trí.
+    Document bị chia nhỏ có thêm số thứ tự chunk.
+    """
+    position = metadata.get("index", metadata.get("type", ""))
+    key = f"{metadata.get('source', '')}|{metadata.get('parent_key', '')}|{position}"
+    return f"{key}|{metadata['chunk']}" if "chunk" in metadata else key
+
+
+def content_hash(doc: Document) -> str:
+    payload = json.dumps([doc.page_content, doc.metadata], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def read_meta(path: Path) -> Optional[Dict]:
+    try:
+        with open(path / META_FILE, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get("format") != FORMAT_NAME or meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Index '{path}' có định dạng không hỗ trợ: "
+                         f"{meta.get('format')} v{meta.get('format_version')}")
+    return meta
+
+
+def is_legacy(path: Path) -> bool:
+    return not (path / META_FILE).exists() and all((path / name).exists() for name in LEGACY_FILES)
+
+
+def index_version(path) -> str:
+    """
+    Phiên bản của index trên đĩa. Chỉ gọi os.stat (meta.json được ghi sau
+    cùng mỗi lần cập nhật) nên đủ rẻ để kiểm tra ở mỗi request.
+    """
+    path = Path(path)
+    names = (META_FILE,) if (path / META_FILE).exists() else LEGACY_FILES
+    parts = []
+    for name in names:
+        try:
+            stat = os.stat(path / name)
+            parts.append(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        except FileNotFoundError:
+            parts.append("0")
+    return ".".join(parts)
+
+
+def index_settings(meta: Optional[Dict]) -> Tuple[str, str]:
+    """(index_type, vector_dtype) ghi trong meta; meta cũ chưa có là flat / float32"""
+    meta = meta or {}
+    return meta.get("index_type", "flat"), meta.get("vector_dtype", "float32")
+
+
+def factory_string(index_type: str, vector_dtype: str, dimension: int, count: int) -> Tuple[str, Dict]:
+    """
+    Chuỗi index_factory của FAISS cho một cấu hình index
+
+    Args:
+        index_type (str): flat / hnsw / ivf / ivfpq
+        vector_dtype (str): float32 / float16 / int8
+        dimension (int): Số chiều vector
+        count (int): Số vector dùng để dựng (quyết định số cụm IVF)
+
+    Returns:
+        Tuple: (chuỗi factory, index_params ghi vào meta)
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"INDEX_TYPE không hỗ trợ: {index_type} (chọn một trong {', '.join(INDEX_TYPES)})")
+    if vector_dtype not in _STORAGE:
+        raise ValueError(f"VECTOR_DTYPE không hỗ trợ: {vector_dtype} (chọn một trong {', '.join(_STORAGE)})")
+    storage = _STORAGE[vector_dtype]
+    params = {"ef_search": None, "nprobe": None, "trained_on": None}
+    if index_type == "flat":
+        factory = storage
+    elif index_type == "hnsw":
+        factory = f"HNSW{HNSW_M}" + ("" if storage == "Flat" else f",{storage}")
+        params["ef_search"] = HNSW_EF_SEARCH
+    else:
+        # Khoảng 4 * sqrt(n) cụm, mỗi cụm có ít nhất 39 vector huấn luyện (khuyến nghị của FAISS)
+        nlist = IVF_NLIST or max(1, min(int(4 * np.sqrt(count)), count // 39))
+        if index_type == "ivf":
+            factory = f"IVF{nlist},{storage}"
+        else:
+            if dimension % PQ_M:
+                raise ValueError(f"PQ_M={PQ_M} phải chia hết số chiều vector ({dimension})")
+            # Mã PQ n bit cần ít nhất 2^n vector huấn luyện; dữ liệu nhỏ thì giảm số bit
+            nbits = PQ_NBITS if count >= 2 ** PQ_NBITS else 4
+            if count < 2 ** nbits:
+                raise ValueError(f"Cần ít nhất {2 ** nbits} vector để huấn luyện index ivfpq (hiện có {count})")
+            factory = f"IVF{nlist},PQ{PQ_M}x{nbits}"
+        params["nprobe"] = min(IVF_NPROBE, nlist)
+        params["trained_on"] = count
+    return factory, {"factory": factory, **params}
+
+
+def apply_search_params(index, params: Dict):
+    """Đặt efSearch (HNSW) / nprobe (IVF) cho index đã đọc từ đĩa; tham số None được bỏ qua"""
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if params.get("ef_search") and hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = int(params["ef_search"])
+    ivf = faiss.try_extract_index_ivf(index)
+    if params.get("nprobe") and ivf is not None:
+        ivf.nprobe = int(params["nprobe"])
+
+
+def _search_overrides() -> Dict:
+    """efSearch / nprobe đặt qua biến môi trường khi chạy, ưu tiên hơn giá trị trong meta"""
+    return {name: int(os.environ[env]) for name, env in (("ef_search", "HNSW_EF_SEARCH"), ("nprobe", "IVF_NPROBE"))
+            if os.getenv(env)}
+
+
+class IndexStore(VectorStore):
+    """
+    VectorStore chỉ đọc trên định dạng mới (FAISS mmap + SQLite).
+    Loại index (flat / HNSW / IVF, float32 / float16 / int8) do file vectors.faiss
+    quyết định; tham số tìm kiếm được lấy từ meta nên không cần cấu hình thêm.
+    """
+
+    def __init__(self, path: Path, embeddings: Embeddings):
+        self.path = Path(path)
+        self.meta = read_meta(self.path)
+        if self.meta is None:
+            raise FileNotFoundError(f"Không tìm thấy {META_FILE} trong '{self.path}'")
+        self._embeddings = embeddings
+        self.index = faiss.read_index(str(self.path / VECTORS_FILE), _MMAP_FLAGS)
+        self.search_params = {**self.meta.get("index_params", {}), **_search_overrides()}
+        apply_search_params(self.index, self.search_params)
+        self._local = threading.local()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    @property
+    def version(self) -> str:
+        return self.meta["index_version"]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path / DOCS_FILE}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={DOCS_MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def get_documents(self, ids: Iterable[int]) -> Dict[int, Document]:
+        """Đọc document theo id (chỉ các dòng cần thiết)"""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT id, page_content, metadata FROM docs WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return {
+            row_id: Document(page_content=page_content, metadata=json.loads(metadata))
+            for row_id, page_content, metadata in rows
+        }
+
+    @property
+    def has_lexical(self) -> bool:
+        if not hasattr(self, "_has_lexical"):
+            self._has_lexical = self._conn().execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'docs_fts'"
+            ).fetchone() is not None
+        return self._has_lexical
+
+    def vector_search(self, embedding: List[float], k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Returns:
+            List: (id, khoảng cách L2) của k vector gần nhất
+        """
+        if self.index.ntotal == 0:
+            return []
+        query = np.asarray([embedding], dtype=np.float32)
+        distances, ids = self.index.search(query, min(k, self.index.ntotal))
+        return [(int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+
+    def lexical_search(self, terms: List[str], k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Tìm theo BM25 (FTS5) với các từ đã bỏ dấu
+
+        Returns:
+            List: (id, điểm BM25, càng lớn càng khớp) của tối đa k document
+        """
+        if not terms or not self.has_lexical:
+            return []
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self._conn().execute(
+            "SELECT rowid, bm25(docs_fts) FROM docs_fts WHERE docs_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, k),
+        ).fetchall()
+        # bm25() của SQLite trả về số âm (càng nhỏ càng khớp)
+        return [(row_id, -score) for row_id, score in rows]
+
+    def folded_text(self, row_id: int) -> str:
+        row = self._conn().execute("SELECT folded FROM docs_fts WHERE rowid = ?", (row_id,)).fetchone()
+        return row[0] if row else ""
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs) -> List[Tuple[Document, float]]:
+        hits = self.vector_search(embedding, k)
+        docs = self.get_documents(i for i, _ in hits)
+        # Dòng có thể vừa bị xóa bởi một lần cập nhật đang diễn ra: bỏ qua
+        return [(docs[i], distance) for i, distance in hits if i in docs]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self._embeddings.embed_query(query), k, **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Dùng IndexWriter (process_data) để tạo index")
+
+
+class IndexWriter:
+    """
+    Cập nhật index theo định dạng mới. Các thay đổi được gom lại và chỉ ghi
+    khi commit(): docs.sqlite trong một transaction, vectors.faiss ghi ra
+    file tạm rồi đổi tên, meta.json ghi sau cùng (đánh dấu phiên bản mới).
+    Worker đang đọc index cũ vẫn chạy tiếp bình thường.
+
+    Loại index chỉ áp dụng khi tạo mới (index = None); index đang có giữ nguyên
+    loại ghi trong meta cho tới khi được dựng lại (xem rebuild_reason).
+    """
+
+    def __init__(self, path: Path, index_type: str = INDEX_TYPE, vector_dtype: str = VECTOR_DTYPE):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.meta = read_meta(self.path)
+        self.index_type = index_type
+        self.vector_dtype = vector_dtype
+        self.index = None
+        if self.meta is not None:
+            self.index = faiss.read_index(str(self.path / VECTORS_FILE))
+        self.conn = sqlite3.connect(str(self.path / DOCS_FILE), isolation_level=None)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " id INTEGER PRIMARY KEY,"
+            " doc_key TEXT NOT NULL UNIQUE,"
+            " hash TEXT NOT NULL,"
+            " page_content TEXT NOT NULL,"
+            " metadata TEXT NOT NULL)"
+        )
+        self.rebuilt_lexical = self._ensure_lexical_index()
+        self._deleted: List[int] = []
+        self._added: List[Tuple[int, str, str, Document]] = []
+        self._vectors: List[np.ndarray] = []
+        self._next_id = (self.conn.execute("SELECT MAX(id) FROM docs").fetchone()[0] or 0) + 1
+
+    def _ensure_lexical_index(self) -> bool:
+        """
+        Tạo bảng FTS5 nếu chưa có (index tạo trước khi có tìm kiếm lexical)
+        và dựng lại nếu lệch với bảng docs.
+
+        Returns:
+            bool: True nếu đã phải dựng lại
+        """
+        self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(folded, tokenize='unicode61')")
+        docs_count = self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        fts_count = self.conn.execute("SELECT COUNT(*) FROM docs_fts").fetchone()[0]
+        if docs_count == fts_count:
+            return False
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM docs_fts")
+            self.conn.executemany(
+                "INSERT INTO docs_fts (rowid, folded) VALUES (?, ?)",
+                [(row_id, fold_diacritics(text)) for row_id, text in
+                 self.conn.execute("SELECT id, page_content FROM docs").fetchall()],
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Đã dựng chỉ mục BM25 cho {docs_count} document trong '{self.path}'")
+        return True
+
+    def entries(self) -> Dict[str, Tuple[int, str]]:
+        """
+        Returns:
+            Dict: doc_key -> (id, hash nội dung) của các document đang có trong index
+        """
+        if self.index is None:
+            return {}
+        return {key: (row_id, digest) for row_id, key, digest in
+                self.conn.execute("SELECT id, doc_key, hash FROM docs")}
+
+    @property
+    def supports_remove(self) -> bool:
+        """HNSW không xóa được vector: mọi thay đổi nội dung đều phải dựng lại index"""
+        return index_settings(self.meta)[0] != "hnsw"
+
+    def rebuild_reason(self, embedding_model: str) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: Lý do phải dựng lại toàn bộ index, hoặc None nếu cập nhật tăng dần được
+        """
+        if self.meta is None:
+            return None
+        if self.meta.get("embedding_model") != embedding_model:
+            return "model embedding thay đổi"
+        if index_settings(self.meta) != (self.index_type, self.vector_dtype):
+            return "loại index thay đổi"
+        trained_on = self.meta.get("index_params", {}).get("trained_on")
+        if trained_on and self.meta["count"] > IVF_RETRAIN_GROWTH * trained_on:
+            return "số vector đã tăng nhiều so với lúc huấn luyện"
+        return None
+
+    def delete(self, ids: List[int]):
+        self._deleted.extend(ids)
+
+    def add(self, keyed_docs: List[Tuple[str, str, Document]], vectors: List[List[float]]):
+        """
+        Args:
+            keyed_docs: Danh sách (doc_key, hash, document)
+            vectors: Embedding tương ứng
+        """
+        for key, digest, doc in keyed_docs:
+            self._added.append((self._next_id, key, digest, doc))
+            self._next_id += 1
+        if len(vectors):
+            self._vectors.append(np.asarray(vectors, dtype=np.float32))
+
+    def commit(self, embedding_model: str) -> Dict:
+        vectors = np.concatenate(self._vectors) if self._vectors else None
+        reset = self.index is None
+        if reset:
+            if vectors is None:
+                raise ValueError("Không có document nào để tạo index")
+            self.index, index_params = self._new_index(vectors)
+        else:
+            index_type, vector_dtype = index_settings(self.meta)
+            index_params = self.meta.get("index_params", {"factory": _STORAGE[vector_dtype]})
+
+        if self._deleted:
+            self.index.remove_ids(np.asarray(self._deleted, dtype=np.int64))
+        if vectors is not None:
+            self.index.add_with_ids(vectors, np.asarray([row[0] for row in self._added], dtype=np.int64))
+
+        tmp_vectors = self.path / (VECTORS_FILE + ".tmp")
+        faiss.write_index(self.index, str(tmp_vectors))
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if reset:
+                # Tạo index mới: bỏ mọi dòng còn sót lại từ lần build trước
+                self.conn.execute("DELETE FROM docs")
+                self.conn.execute("DELETE FROM docs_fts")
+            self.conn.executemany("DELETE FROM docs WHERE id = ?", [(i,) for i in self._deleted])
+            self.conn.executemany("DELETE FROM docs_fts WHERE rowid = ?", [(i,) for i in self._deleted])
+            self.conn.executemany(
+                "INSERT INTO docs (id, doc_key, hash, page_content, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(row_id, key, digest, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                 for row_id, key, digest, doc in self._added],
+            )
+            self.conn.executemany(
+                "INSERT INTO docs_fts (rowid, folded) VALUES (?, ?)",
+                [(row_id, fold_diacritics(doc.page_content)) for row_id, _, _, doc in self._added],
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        os.replace(tmp_vectors, self.path / VECTORS_FILE)
+
+        self.meta = {
+            "format": FORMAT_NAME,
+            "format_version": FORMAT_VERSION,
+            "index_version": uuid.uuid4().hex,
+            "embedding_model": embedding_model,
+            "metric": "l2",
+            "dimension": self.index.d,
+            "count": self.index.ntotal,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "index_type": self.index_type if reset else index_type,
+            "vector_dtype": self.vector_dtype if reset else vector_dtype,
+            "index_params": index_params,
+        }
+        tmp_meta = self.path / (META_FILE + ".tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_meta, self.path / META_FILE)
+        self.conn.close()
+        return self.meta
+
+    def _new_index(self, vectors: np.ndarray) -> Tuple[faiss.Index, Dict]:
+        """Tạo index rỗng theo index_type / vector_dtype và huấn luyện trên vectors nếu cần"""
+        factory, params = factory_string(self.index_type, self.vector_dtype, vectors.shape[1], len(vectors))
+        inner = faiss.index_factory(vectors.shape[1], factory)
+        if self.index_type == "hnsw":
+            inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        ivf = faiss.try_extract_index_ivf(inner)
+        if ivf is not None:
+            ivf = faiss.downcast_index(ivf)
+            # Dữ liệu tuyển sinh nhỏ hơn nhiều so với khuyến nghị của k-means: không in cảnh báo
+            ivf.cp.min_points_per_centroid = 1
+            if isinstance(ivf, faiss.IndexIVFPQ):
+                ivf.pq.cp.min_points_per_centroid = 1
+                # Huấn luyện polysemous chỉ có ích khi tìm bằng khoảng cách Hamming (không dùng ở đây)
+                ivf.do_polysemous_training = False
+        index = faiss.IndexIDMap2(inner)
+        if not index.is_trained:
+            start = time.perf_counter()
+            index.train(vectors)
+            logger.info(f"Đã huấn luyện index {factory} trên {len(vectors)} vector "
+                        f"({time.perf_counter() - start:.1f}s)")
+        apply_search_params(index, params)
+        return index, params
+
+
+def migrate_legacy(path: Path, embedding_model: str) -> Dict:
+    """
+    Chuyển index định dạng cũ (index.faiss + index.pkl của LangChain) sang
+    định dạng mới. Không gọi API embedding: vector được lấy lại từ FAISS.
+    File cũ được giữ nguyên, có thể xóa sau khi kiểm tra.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    legacy = FAISS.load_local(str(path), None, allow_dangerous_deserialization=True)
+    vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+    keyed_docs = []
+    for position in range(legacy.index.ntotal):
+        doc = legacy.docstore.search(legacy.index_to_docstore_id[position])
+        keyed_docs.append((document_key(doc.metadata), content_hash(doc), doc))
+
+    writer = IndexWriter(path)
+    writer.add(keyed_docs, vectors.tolist())
+    meta = writer.commit(embedding_model)
+    logger.info(f"Đã chuyển {meta['count']} document sang định dạng {FORMAT_NAME} v{FORMAT_VERSION}")
+    return meta
+
+
+def upgrade_lexical_index(path: Path) -> bool:
+    """Bổ sung chỉ mục BM25 cho index định dạng mới tạo trước khi có tìm kiếm lexical"""
+    writer = IndexWriter(path)
+    writer.conn.close()
+    return writer.rebuilt_lexical
+
+
+def load_vector_store(path: Path, embeddings: Embeddings) -> VectorStore:
+    """
+    Mở index để truy vấn: định dạng mới nếu có meta.json, nếu không thì
+    đọc định dạng cũ của LangChain (unpickle, chậm hơn và tốn bộ nhớ hơn).
+    """
+    path = Path(path)
+    if (path / META_FILE).exists():
+        return IndexStore(path, embeddings)
+    if is_legacy(path):
+        from langchain_community.vectorstores import FAISS
+
+        logger.warning(f"Index '{path}' đang ở định dạng cũ (index.pkl), "
+                       "hãy chạy: python -m app.models.index_store")
+        return FAISS.load_local(str(path), embeddings, allow_dangerous_deserialization=True)
+    raise FileNotFoundError(f"Không tìm thấy index trong '{path}'. Vui lòng chạy script để tạo index trước.")
+
+
+# Chạy từ thư mục applyxBE: python -m app.models.index_store
+if __name__ == "__main__":
+    from app.models.cached_embeddings import EMBEDDING_MODEL
+
+    logging.basicConfig(level=logging.INFO)
+    if is_legacy(VECTORSTORE_PATH):
+        print(migrate_legacy(VECTORSTORE_PATH, EMBEDDING_MODEL))
+    elif upgrade_lexical_index(VECTORSTORE_PATH):
+        print(f"Đã bổ sung chỉ mục BM25 cho '{VECTORSTORE_PATH}'.")
+    else:
+        print(f"'{VECTORSTORE_PATH}' đã ở định dạng mới nhất.")
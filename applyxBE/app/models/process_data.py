@@ -1,36 +1,52 @@
 import os
 import json
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain.schema.document import Document
+from langchain_core.documents import Document
 from dotenv import load_dotenv
 
+from app.models.cached_embeddings import EMBEDDING_MODEL, create_embeddings
+from app.models.document_chunking import (CHUNK_OVERLAP_TOKENS, CHUNK_TARGET_TOKENS, DOC_RENDER_MODE, chunk_text,
+                                          render, token_report)
+from app.models.embedding_pipeline import EmbeddingPipeline
+from app.models.incremental_index import update_vector_store
+
 # Tải các biến môi trường từ file .env
 load_dotenv()
 
-# Cấu hình API key
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY không được tìm thấy. Hãy chắc chắn bạn đã tạo file .env")
-
 # Đường dẫn đến thư mục chứa các file JSON và nơi lưu vector store
 APP_DIR = Path(__file__).resolve().parent.parent
 DATA_PATH = APP_DIR / "data"
 VECTORSTORE_PATH = APP_DIR / "faiss_index"
 
-def create_documents_from_generic_json(data, source_filename):
+def _chunked_documents(content, metadata, target_tokens):
+    """Chia document quá dài thành các chunk (metadata có thêm 'chunk' và 'chunks')"""
+    chunks = chunk_text(content, target_tokens, CHUNK_OVERLAP_TOKENS) if target_tokens else [content]
+    if len(chunks) == 1:
+        return [Document(page_content=content, metadata=metadata)]
+    return [
+        Document(page_content=chunk, metadata={**metadata, "chunk": j, "chunks": len(chunks)})
+        for j, chunk in enumerate(chunks, start=1)
+    ]
+
+
+def create_documents_from_generic_json(data, source_filename, render_mode=DOC_RENDER_MODE,
+                                       target_tokens=CHUNK_TARGET_TOKENS, verbose=True):
     """
     Hàm này phân tích một file JSON bất kỳ và tạo ra các Document một cách thông minh.
     Nó tìm các danh sách đối tượng để tạo document cho từng thực thể.
     MỌI DOCUMENT ĐƯỢC TẠO RA ĐỀU CÓ METADATA 'source' và 'page'.
+
+    Args:
+        render_mode (str): "compact" (các dòng "Nhãn: giá trị") hoặc "json" (json.dumps indent=2)
+        target_tokens (int): Document dài hơn được chia thành các chunk cỡ này (0 = không chia)
+        verbose (bool): In các danh sách thực thể tìm thấy
     """
     documents = []
     
     # Nếu dữ liệu gốc là một danh sách đối tượng
     if isinstance(data, list) and all(isinstance(i, dict) for i in data):
         for i, item in enumerate(data):
-            content = json.dumps(item, ensure_ascii=False, indent=2)
+            content = render(item, render_mode)
             # Thêm 'page' key, sử dụng index + 1
             metadata = {
                 "source": source_filename,
@@ -38,7 +54,7 @@ def create_documents_from_generic_json(data, source_filename):
                 "type": "entity_from_list",
                 "index": i 
             }
-            documents.append(Document(page_content=content, metadata=metadata))
+            documents.extend(_chunked_documents(content, metadata, target_tokens))
         return documents
 
     # Nếu dữ liệu gốc là một đối tượng (dictionary)
@@ -47,9 +63,10 @@ def create_documents_from_generic_json(data, source_filename):
         for key, value in data.items():
             # Tìm các danh sách đối tượng bên trong
             if isinstance(value, list) and all(isinstance(i, dict) for i in value):
-                print(f"  -> Tìm thấy danh sách thực thể dưới key: '{key}'")
+                if verbose:
+                    print(f"  -> Tìm thấy danh sách thực thể dưới key: '{key}'")
                 for i, item in enumerate(value):
-                    content = json.dumps(item, ensure_ascii=False, indent=2)
+                    content = render(item, render_mode)
                     # Thêm 'page' key, sử dụng index + 1
                     metadata = {
                         "source": source_filename,
@@ -58,45 +75,59 @@ def create_documents_from_generic_json(data, source_filename):
                         "parent_key": key,
                         "index": i
                     }
-                    documents.append(Document(page_content=content, metadata=metadata))
+                    documents.extend(_chunked_documents(content, metadata, target_tokens))
             else:
                 top_level_info[key] = value
 
         # Tạo một document tóm tắt cho các thông tin cấp cao còn lại
         if top_level_info:
-            summary_content = "Thông tin tổng quan từ file:\n" + json.dumps(top_level_info, ensure_ascii=False, indent=2)
+            summary_content = "Thông tin tổng quan từ file:\n" + render(top_level_info, render_mode)
             # Thêm 'page' key với giá trị mặc định là 1
             metadata = {
                 "source": source_filename,
                 "page": 1, # SỬA LỖI: Thêm key 'page'
                 "type": "summary"
             }
-            documents.append(Document(page_content=summary_content, metadata=metadata))
+            documents.extend(_chunked_documents(summary_content, metadata, target_tokens))
             
         return documents
 
     # Trường hợp dữ liệu không phải list hoặc dict
-    documents.append(Document(
-        page_content=str(data),
+    documents.extend(_chunked_documents(
+        str(data),
         # Thêm 'page' key với giá trị mặc định là 1
-        metadata={
+        {
             "source": source_filename,
             "page": 1, # SỬA LỖI: Thêm key 'page'
             "type": "raw_data"
-        }
+        },
+        target_tokens,
     ))
     return documents
 
 
+def print_token_report(before, after):
+    """In số document / token (ước lượng) theo từng file trước và sau khi dựng gọn + chia chunk"""
+    print(f"\nToken theo nguồn (chế độ '{DOC_RENDER_MODE}', chunk {CHUNK_TARGET_TOKENS} token):")
+    print(f"  {'nguồn':<28} {'':>4} {'doc':>5} {'token':>7} {'TB/doc':>7} {'lớn nhất':>9}")
+    for source in sorted(after):
+        for name, entry in (("trước", before.get(source)), ("sau", after[source])):
+            if entry:
+                print(f"  {source if name == 'trước' else '':<28} {name:>4} {entry['docs']:>5} {entry['tokens']:>7} "
+                      f"{entry['tokens'] // entry['docs']:>7} {entry['max_tokens']:>9}")
+
+
 def create_vector_store():
     """
     Hàm này đọc tất cả các file JSON trong thư mục data,
     phân tích cấu trúc và tạo các Document thông minh,
-    vector hóa và lưu vào FAISS vector store.
+    vector hóa và cập nhật FAISS vector store (chỉ phần thay đổi).
     """
     print("Bắt đầu xử lý các file JSON...")
     
     all_docs = []
+    # Số token theo từng file: cách dựng cũ (JSON indent, không chia) và hiện tại
+    before_docs = []
     json_files = list(DATA_PATH.glob("*.json"))
 
     if not json_files:
@@ -112,6 +143,8 @@ def create_vector_store():
             # Tạo các document từ dữ liệu JSON một cách tổng quát
             docs_from_file = create_documents_from_generic_json(data, json_file_path.name)
             all_docs.extend(docs_from_file)
+            before_docs.extend(create_documents_from_generic_json(data, json_file_path.name, render_mode="json",
+                                                                  target_tokens=0, verbose=False))
             print(f"Đã tạo được {len(docs_from_file)} document từ file {json_file_path.name}.")
         
         except json.JSONDecodeError:
@@ -125,19 +158,25 @@ def create_vector_store():
         return
         
     print(f"\nTổng cộng đã tạo được {len(all_docs)} document.")
+    print_token_report(token_report(before_docs), token_report(all_docs))
 
-    # Tạo embeddings
+    # Tạo embeddings: embed theo batch, song song, giới hạn tốc độ, thử lại khi gặp 429;
+    # document đã embed (kể cả ở lần build bị dừng giữa chừng) được lấy lại từ cache
     print("Tạo embeddings cho các document...")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=api_key)
-
-    # Tạo vector store từ các document đã xử lý
-    print("Bắt đầu tạo và lưu vector store...")
-    vector_store = FAISS.from_documents(all_docs, embeddings)
+    # Chỉ bước này cần API key; phần dựng document dùng được offline (xem benchmarks/bench_retrieval.py)
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY không được tìm thấy. Hãy chắc chắn bạn đã tạo file .env")
+    embeddings = create_embeddings(api_key, pipeline=EmbeddingPipeline())
 
-    # Lưu vector store vào ổ đĩa
-    vector_store.save_local(str(VECTORSTORE_PATH))
-    print(f"Hoàn tất! Đã lưu vector store vào '{VECTORSTORE_PATH}'.")
+    # Chỉ embed document mới/đã sửa, xóa vector cũ rồi ghi lại index
+    print("Bắt đầu cập nhật và lưu vector store...")
+    report = update_vector_store(all_docs, embeddings, VECTORSTORE_PATH, EMBEDDING_MODEL)
+    print(f"Hoàn tất ({report['mode']})! Thêm {report['added']}, sửa {report['updated']}, "
+          f"xóa {report['deleted']}, giữ nguyên {report['unchanged']} document trong '{VECTORSTORE_PATH}'.")
+    print(f"Embedding cache: {embeddings.stats()}")
 
 
+# Chạy từ thư mục applyxBE: python -m app.models.process_data
 if __name__ == '__main__':
     create_vector_store()
\ No newline at end of file
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.lru_cache import LRUCache
+
+# Độ tương đồng cosine tối thiểu để coi hai câu hỏi là một
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+# Thời gian sống của một câu trả lời trong cache (giây)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Số câu trả lời tối đa (0 = tắt cache)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo embedding của câu hỏi độc lập: câu hỏi mới có
+    độ tương đồng cosine >= threshold với một câu hỏi đã trả lời thì dùng
+    lại câu trả lời đó.
+
+    - Mỗi phần tử sống tối đa ttl_seconds
+    - Vượt max_entries thì bỏ phần tử ít dùng gần đây nhất (LRU)
+    - Gắn với phiên bản của index: phiên bản đổi thì toàn bộ cache bị xóa
+
+    Các vector được giữ trong một ma trận cấp phát sẵn nên mỗi lần tra cứu
+    chỉ là một phép nhân ma trận - vector.
+
+    Ngoài ra có tầng khớp chính xác theo câu hỏi đã chuẩn hóa (get_exact), dùng
+    cho câu hỏi được trả lời bằng BM25 mà không tính embedding.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl_seconds: float = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._answers: List[Optional[str]] = [None] * max_entries
+        self._questions: List[Optional[str]] = [None] * max_entries
+        # slot -> None, theo thứ tự dùng gần đây (đầu = ít dùng nhất)
+        self._order: "OrderedDict[int, None]" = OrderedDict()
+        # câu hỏi đã chuẩn hóa -> (câu trả lời, thời điểm hết hạn)
+        self._exact = LRUCache(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.exact_hits = 0
+        self.exact_misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def question_key(question: str) -> str:
+        """Khóa của tầng khớp chính xác: chữ thường, gộp khoảng trắng"""
+        return " ".join(question.lower().split())
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _check_version(self, version: str):
+        # Gọi khi đang giữ lock
+        if version == self._version:
+            return
+        if self._version is not None:
+            self.invalidations += 1
+        self._version = version
+        self._expires[:] = 0
+        self._answers = [None] * self.max_entries
+        self._questions = [None] * self.max_entries
+        self._order.clear()
+        self._exact.clear()
+
+    def get_exact(self, question: str, version: str) -> Optional[str]:
+        """
+        Tìm câu trả lời cho đúng câu hỏi này (sau khi chuẩn hóa), không cần embedding
+
+        Args:
+            question (str): Câu hỏi độc lập
+            version (str): Phiên bản hiện tại của index
+
+        Returns:
+            Optional[str]: Câu trả lời hoặc None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_version(version)
+            key = self.question_key(question)
+            entry = self._exact.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    self._exact.pop(key)
+                self.exact_misses += 1
+                return None
+            self.exact_hits += 1
+            return entry[0]
+
+    def get(self, vector, version: str) -> Tuple[Optional[str], float]:
+        """
+        Tìm câu trả lời cho câu hỏi có embedding gần nhất
+
+        Args:
+            vector: Embedding của câu hỏi độc lập
+            version (str): Phiên bản hiện tại của index
+
+        Returns:
+            Tuple[Optional[str], float]: (câu trả lời hoặc None, độ tương đồng cao nhất)
+        """
+        if not self.enabled:
+            return None, 0.0
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(version)
+            if not self._order or self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None, 0.0
+            scores = self._matrix @ query
+            # Slot trống hoặc đã hết hạn không được chọn
+            scores[self._expires <= time.time()] = -1.0
+            slot = int(np.argmax(scores))
+            similarity = float(scores[slot])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, max(similarity, 0.0)
+            self._order.move_to_end(slot)
+            self.hits += 1
+            return self._answers[slot], similarity
+
+    def put(self, vector, question: str, answer: str, version: str):
+        """
+        Lưu câu trả lời cho câu hỏi
+
+        Args:
+            vector: Embedding của câu hỏi độc lập; None thì chỉ lưu vào tầng khớp chính xác
+            question (str): Câu hỏi độc lập
+            answer (str): Câu trả lời
+            version (str): Phiên bản index dùng để tạo câu trả lời
+        """
+        if not self.enabled or not answer:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._exact.put(self.question_key(question), (answer, time.time() + self.ttl_seconds))
+            if vector is None:
+                return
+            vector = self._normalize(vector)
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._expires[:] = 0
+                self._order.clear()
+            slot = self._free_slot()
+            self._matrix[slot] = vector
+            self._expires[slot] = time.time() + self.ttl_seconds
+            self._answers[slot] = answer
+            self._questions[slot] = question
+            self._order[slot] = None
+            self._order.move_to_end(slot)
+
+    def _free_slot(self) -> int:
+        now = time.time()
+        if len(self._order) < self.max_entries:
+            used = set(self._order)
+            return next(slot for slot in range(self.max_entries) if slot not in used)
+        # Ưu tiên dùng lại slot đã hết hạn, nếu không thì bỏ slot ít dùng nhất
+        for slot in self._order:
+            if self._expires[slot] <= now:
+                del self._order[slot]
+                return slot
+        slot, _ = self._order.popitem(last=False)
+        return slot
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._order.clear()
+            self._exact.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._order),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "index_version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "exact_entries": len(self._exact),
+            "exact_hits": self.exact_hits,
+            "exact_misses": self.exact_misses,
+            "invalidations": self.invalidations,
+        }
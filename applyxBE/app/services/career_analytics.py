@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from app.services.results_store import SCORE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parents[1]
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", str(APP_DIR / "session" / "analytics.db"))
+# Độ rộng mỗi cột histogram điểm (điểm 0 - 100)
+SCORE_BUCKET = 10
+
+# Câu hỏi đầu tiên của khảo sát (xem IKIGAI_SYSTEM_INSTRUCTION) và lựa chọn a) - e) của người dùng
+_FIRST_QUESTION = re.compile(r"Câu 1\s*:", re.IGNORECASE)
+_CHOICE = re.compile(r"^\W*([a-e])\W*(?:\s|$)", re.IGNORECASE)
+
+
+def first_choice(history: List) -> Optional[str]:
+    """
+    Lựa chọn của người dùng cho Câu 1 trong lịch sử hội thoại
+
+    Returns:
+        Optional[str]: "a" - "e", "other" nếu trả lời tự do, None nếu chưa tới Câu 1
+    """
+    for i, (role, text) in enumerate(history):
+        if role == "model" and _FIRST_QUESTION.search(text):
+            answer = next((text for role, text in history[i + 1:] if role == "user"), None)
+            if answer is None:
+                return None
+            match = _CHOICE.match(answer.strip())
+            return match.group(1).lower() if match else "other"
+    return None
+
+
+def result_day(saved_at: float) -> str:
+    """Ngày (UTC, YYYY-MM-DD) của một kết quả, dùng cho thống kê theo ngày"""
+    return datetime.fromtimestamp(saved_at, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _title_key(title: str) -> str:
+    return " ".join(title.split())
+
+
+class CareerAnalytics:
+    """
+    Thống kê kết quả Ikigai được cộng dồn ngay khi lưu kết quả (xem ApplyXChatbot.saveResultsBySession),
+    nên dashboard chỉ đọc các bảng đếm nhỏ, không bao giờ quét lại kết quả gốc.
+
+    Các bảng (SQLite WAL, dùng chung giữa các worker):
+    - career_counts: số kết quả có mỗi nghề, số lần đứng hạng 1, tổng averageScore
+    - score_histogram: phân bố từng loại điểm theo cột SCORE_BUCKET điểm
+    - daily_results / daily_careers: số kết quả và số lần xuất hiện của mỗi nghề theo ngày
+    - first_choices: số người chọn mỗi đáp án của Câu 1
+    - contributions: phần mỗi session đã cộng vào các bảng trên; session lưu lại kết
+      quả thì phần cũ được trừ đi trước khi cộng phần mới, trong cùng một transaction
+    """
+
+    def __init__(self, path: str = ANALYTICS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._writer = self._connect()
+        self._write_lock = threading.Lock()
+        self._writer.executescript(
+            "CREATE TABLE IF NOT EXISTS contributions ("
+            " session_id TEXT PRIMARY KEY, day TEXT NOT NULL, first_choice TEXT, careers TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS career_counts ("
+            " title TEXT PRIMARY KEY, results INTEGER NOT NULL, top1 INTEGER NOT NULL, score_sum INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_career_counts_results ON career_counts (results);"
+            "CREATE TABLE IF NOT EXISTS score_histogram ("
+            " field TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (field, bucket));"
+            "CREATE TABLE IF NOT EXISTS daily_results (day TEXT PRIMARY KEY, results INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS daily_careers ("
+            " day TEXT NOT NULL, title TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (day, title));"
+            "CREATE TABLE IF NOT EXISTS first_choices (choice TEXT PRIMARY KEY, count INTEGER NOT NULL);"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        """Connection đọc của thread hiện tại"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._writer
+                self._writer.execute("COMMIT")
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, day: str, choice: Optional[str], careers: List[Dict], sign: int):
+        """Cộng (sign=1) hoặc trừ (sign=-1) phần đóng góp của một kết quả vào các bảng đếm"""
+        conn.execute("INSERT INTO daily_results (day, results) VALUES (?, ?) "
+                     "ON CONFLICT (day) DO UPDATE SET results = results + excluded.results", (day, sign))
+        if choice is not None:
+            conn.execute("INSERT INTO first_choices (choice, count) VALUES (?, ?) "
+                         "ON CONFLICT (choice) DO UPDATE SET count = count + excluded.count", (choice, sign))
+        for career in careers:
+            title = career["title"]
+            conn.execute(
+                "INSERT INTO career_counts (title, results, top1, score_sum) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (title) DO UPDATE SET results = results + excluded.results,"
+                " top1 = top1 + excluded.top1, score_sum = score_sum + excluded.score_sum",
+                (title, sign, sign * (career["rank"] == 1), sign * career["averageScore"]))
+            conn.execute("INSERT INTO daily_careers (day, title, count) VALUES (?, ?, ?) "
+                         "ON CONFLICT (day, title) DO UPDATE SET count = count + excluded.count", (day, title, sign))
+            conn.executemany(
+                "INSERT INTO score_histogram (field, bucket, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (field, bucket) DO UPDATE SET count = count + excluded.count",
+                [(field, career[field] // SCORE_BUCKET, sign) for field in SCORE_FIELDS])
+        if sign < 0:
+            conn.execute("DELETE FROM career_counts WHERE results <= 0")
+            conn.execute("DELETE FROM daily_careers WHERE day = ? AND count <= 0", (day,))
+
+    def record(self, record: Dict, choice: Optional[str] = None):
+        """
+        Cộng một kết quả vừa lưu (record của ResultsStore) vào thống kê. Session đã có kết
+        quả trước đó thì kết quả cũ được thay thế, nên mỗi session chỉ được tính một lần.
+
+        Args:
+            record (Dict): {"session_id", "saved_at", "careers", ...}
+            choice (str): Lựa chọn Câu 1 (xem first_choice); None thì giữ lựa chọn đã ghi nhận trước đó
+        """
+        careers = [{"title": _title_key(c["title"]), "rank": c["rank"], **{f: c[f] for f in SCORE_FIELDS}}
+                   for c in record["careers"]]
+        day = result_day(record["saved_at"])
+        with self._transaction() as conn:
+            previous = conn.execute("SELECT day, first_choice, careers FROM contributions WHERE session_id = ?",
+                                    (record["session_id"],)).fetchone()
+            if previous is not None:
+                self._apply(conn, previous[0], previous[1], json.loads(previous[2]), -1)
+                if choice is None:
+                    choice = previous[1]
+            self._apply(conn, day, choice, careers, 1)
+            conn.execute("INSERT OR REPLACE INTO contributions (session_id, day, first_choice, careers) "
+                         "VALUES (?, ?, ?, ?)",
+                         (record["session_id"], day, choice,
+                          json.dumps(careers, ensure_ascii=False, separators=(",", ":"))))
+
+    def is_empty(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM contributions LIMIT 1").fetchone() is None
+
+    def backfill(self, records: Iterable[Dict], choices: Dict[str, Optional[str]] = None) -> int:
+        """
+        Cộng các kết quả đã lưu từ trước khi có thống kê (chạy một lần khi bảng còn trống)
+
+        Returns:
+            int: Số kết quả đã cộng
+        """
+        count = 0
+        for record in records:
+            self.record(record, (choices or {}).get(record["session_id"]))
+            count += 1
+        if count:
+            logger.info(f"Đã cộng {count} kết quả có sẵn vào thống kê '{self.path}'")
+        return count
+
+    def summary(self, days: int = 30, limit: int = 20) -> Dict:
+        """
+        Thống kê cho dashboard, chỉ đọc các bảng đếm
+
+        Args:
+            days (int): Số ngày gần nhất trong phần "daily"
+            limit (int): Số nghề phổ biến nhất trả về
+
+        Returns:
+            Dict: total_results, careers, score_histograms, daily, first_choices
+        """
+        conn = self._conn()
+        # Đọc trong một transaction: các bảng nhất quán với nhau dù worker khác đang ghi
+        conn.execute("BEGIN")
+        try:
+            total = conn.execute("SELECT COALESCE(SUM(results), 0) FROM daily_results").fetchone()[0]
+            careers = [
+                {"title": title, "results": results, "top1": top1,
+                 "avg_score": round(score_sum / results, 1) if results else None,
+                 "share": round(results / total, 4) if total else 0.0}
+                for title, results, top1, score_sum in conn.execute(
+                    "SELECT title, results, top1, score_sum FROM career_counts "
+                    "ORDER BY results DESC, top1 DESC, title LIMIT ?", (limit,))
+            ]
+            buckets = 100 // SCORE_BUCKET + 1
+            histograms = {field: [0] * buckets for field in SCORE_FIELDS}
+            for field, bucket, count in conn.execute("SELECT field, bucket, count FROM score_histogram"):
+                if field in histograms and 0 <= bucket < buckets:
+                    histograms[field][bucket] = count
+            since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+            daily = {day: {"day": day, "results": results, "top_careers": []}
+                     for day, results in conn.execute(
+                         "SELECT day, results FROM daily_results WHERE day >= ? AND results > 0 ORDER BY day",
+                         (since,))}
+            for day, title, count in conn.execute(
+                    "SELECT day, title, count FROM daily_careers WHERE day >= ? AND count > 0 "
+                    "ORDER BY day, count DESC, title", (since,)):
+                if day in daily and len(daily[day]["top_careers"]) < 3:
+                    daily[day]["top_careers"].append({"title": title, "count": count})
+            choices = dict(conn.execute("SELECT choice, count FROM first_choices WHERE count > 0 ORDER BY choice"))
+        finally:
+            conn.execute("COMMIT")
+        return {
+            "total_results": total,
+            "careers": careers,
+            "score_histograms": {"bucket_size": SCORE_BUCKET, **histograms},
+            "daily": list(daily.values()),
+            "first_choices": choices,
+        }
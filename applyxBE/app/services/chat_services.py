@@ -1,8 +1,27 @@
+from typing import Optional
+
 from app.models.gemini import ApplyXChatbot
+from app.services.career_analytics import CareerAnalytics
+from app.services.results_store import LEGACY_RESULTS_FILE, ResultsStore
 
 class ChatService:
-    def __init__(self):
-        self.bot = ApplyXChatbot()
+    def __init__(self, results: Optional[ResultsStore] = None, analytics: Optional[CareerAnalytics] = None):
+        """
+            results / analytics: truyền từ app (main.py) để dùng chung với các route đọc thống kê
+        """
+        self.bot = ApplyXChatbot(results=results, analytics=analytics)
+
+    def import_legacy_results(self):
+        """
+            Bước khởi động một lần: chuyển kết quả trong session_data.txt cũ vào ResultsStore
+        """
+        return self.bot.results.import_legacy(LEGACY_RESULTS_FILE)
+
+    def backfill_analytics(self):
+        """
+            Bước khởi động một lần: cộng các kết quả đã lưu vào thống kê nghề nghiệp nếu thống kê còn trống
+        """
+        return self.bot.backfill_analytics()
 
     def create_session(self, session_id: str = None):
         return self.bot.create_session(session_id)
@@ -10,6 +29,12 @@ class ChatService:
     def send_message(self, session_id: str, message: str):
         return self.bot.send_message(session_id, message)
 
+    async def send_message_async(self, session_id: str, message: str):
+        return await self.bot.send_message_async(session_id, message)
+
+    def send_message_stream(self, session_id: str, message: str):
+        return self.bot.send_message_stream(session_id, message)
+
     def get_chat_history(self, session_id: str):
         return self.bot.get_chat_history(session_id)
 
@@ -21,16 +46,24 @@ class ChatService:
 
     def delete_session(self, session_id: str):
         return self.bot.delete_session(session_id)
-    def save_result(self, session_id: str, result: str):
+
+    def cleanup_old_sessions(self, max_age_hours: float = 24, max_sessions: int = None, max_bytes: int = None):
+        return self.bot.cleanup_old_sessions(max_age_hours, max_sessions, max_bytes)
+    def save_result(self, session_id: str, result: str, profile_id: str = None):
         """
             Lưu kết quả vào session
         """
         # Lưu kết quả vào session
-        self.bot.saveResultsBySession(session_id, result)
+        return self.bot.saveResultsBySession(session_id, result, profile_id)
     def get_results_by_session(self, session_id: str):
         """
             Lấy kết quả đã lưu từ session
         """
         # Trả về kết quả đã lưu
         return self.bot.getResultsBySession(session_id)
+    def get_results_by_profile(self, profile_id: str):
+        """
+            Lấy các kết quả đã lưu của profile
+        """
+        return self.bot.getResultsByProfile(profile_id)
 
@@ -1,24 +1,45 @@
 # app/services/chat_services.py
 
+import asyncio
+import logging
 import os
+import threading
+import time
 import uuid
+from typing import AsyncIterator, Dict, Tuple
 from dotenv import load_dotenv
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
 from pathlib import Path
 
+from app.models.cached_embeddings import create_embeddings
+from app.models.index_store import index_version, load_vector_store
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.concurrency import run_blocking
+from app.services.context_packer import PACK_FETCH_K, ContextPacker
+from app.services.hybrid_retrieval import HybridRetriever
+from app.services.history_policy import SUMMARY_MODEL, HistoryPolicy, estimate_tokens
+from app.services.lru_cache import LRUCache
+from app.services.query_rewrite import is_self_contained, rewrite_cache_key
+from app.services.session_store import create_session_store
+from app.services.structured_lookup import StructuredLookup
+
 APP_DIR = Path(__file__).resolve().parents[1]   # .../applyxBE/app
 PDFS_PATH = APP_DIR / "data"                    # .../applyxBE/app/data
 VECTORSTORE_PATH = APP_DIR / "faiss_index"
 
+logger = logging.getLogger(__name__)
+
 # Tải các biến môi trường từ file .env
 load_dotenv()
 
+# Số câu hỏi đã viết lại được ghi nhớ
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "1024"))
+
 class ChatService:
     def __init__(self):
         """
@@ -37,26 +58,68 @@ class ChatService:
 
         # --- 3. Khởi tạo các mô hình của Google ---
         self.llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro", google_api_key=self.api_key, temperature=0.3)
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=self.api_key)
+        # Embedding có cache (bộ nhớ + SQLite): truy vấn lặp lại không gọi API nữa
+        self.embeddings = create_embeddings(self.api_key)
 
-        # --- 4. Tải Vector Store ---
-        self.vector_store = FAISS.load_local(
-            self.vectorstore_path, 
-            self.embeddings, 
-            allow_dangerous_deserialization=True # Cần thiết cho FAISS
-        )
-        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 5})
+        # --- 4. Tải Vector Store (tự tải lại khi process_data cập nhật index trên đĩa) ---
+        self._index_lock = threading.Lock()
+        self.index_version = index_version(self.vectorstore_path)
+        self._load_vector_store()
+        # Chọn tài liệu đưa vào prompt theo ngân sách token (đa dạng, bỏ trùng lặp)
+        self.packer = ContextPacker(baseline_k=self.retriever.search_kwargs["k"])
+        # Tra cứu trực tiếp dữ liệu có cấu trúc (ngành, thông tin trường), không cần RAG
+        self.structured = StructuredLookup(PDFS_PATH)
 
         # --- 5. Xây dựng RAG Chain có khả năng ghi nhớ lịch sử ---
-        self.conversational_rag_chain = self._create_conversational_rag_chain()
+        self.contextualize_chain, self.question_answer_chain = self._create_conversational_rag_chain()
+        self.rewrite_cache = LRUCache(REWRITE_CACHE_SIZE)
+
+        # Cache câu trả lời theo embedding của câu hỏi độc lập, xóa khi index đổi phiên bản
+        self.answer_cache = SemanticAnswerCache()
         
-        # --- 6. Quản lý các phiên chat (lưu trong bộ nhớ) ---
-        self.sessions = {}
+        # --- 6. Quản lý các phiên chat (bộ nhớ, SQLite hoặc Redis theo SESSION_STORE) ---
+        self.store = create_session_store("rag")
+
+        # --- 7. Giới hạn lịch sử gửi mỗi lượt, lượt cũ được tóm tắt nền bằng model nhẹ ---
+        self.history_policy = HistoryPolicy()
+        self.summary_llm = ChatGoogleGenerativeAI(model=SUMMARY_MODEL, google_api_key=self.api_key, temperature=0)
+
+    def _load_vector_store(self):
+        # Định dạng mới: FAISS mmap + docs.sqlite, không unpickle docstore (xem index_store)
+        self.vector_store = load_vector_store(self.vectorstore_path, self.embeddings)
+        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 5})
+        # BM25 + vector (RRF); câu hỏi khớp chính xác tên ngành/điều khoản không cần embedding.
+        # Lấy dư PACK_FETCH_K ứng viên để ContextPacker chọn lại
+        self.hybrid = HybridRetriever(self.vector_store, k=max(PACK_FETCH_K, self.retriever.search_kwargs["k"]))
+
+    def _current_index_version(self) -> str:
+        """
+        Kiểm tra index trên đĩa; nếu đã được cập nhật thì tải lại.
+        Nếu tải lỗi (ví dụ file đang được ghi dở) thì giữ index cũ, lần sau thử lại.
+
+        Returns:
+            str: Phiên bản của index đang dùng
+        """
+        version = index_version(self.vectorstore_path)
+        if version != self.index_version:
+            with self._index_lock:
+                if version != self.index_version:
+                    try:
+                        self._load_vector_store()
+                        self.structured.load(PDFS_PATH)
+                        self.index_version = version
+                        logger.info(f"Đã tải lại FAISS index (phiên bản {version})")
+                    except Exception as e:
+                        logger.warning(f"Chưa tải lại được FAISS index: {e}")
+        return self.index_version
 
     def _create_conversational_rag_chain(self):
         """
-        Tạo ra một chain phức tạp hơn, có khả năng xem lại lịch sử chat
+        Tạo ra các chain có khả năng xem lại lịch sử chat
         để hiểu câu hỏi mới trong ngữ cảnh của cuộc hội thoại.
+
+        Returns:
+            Tuple: (chain viết lại câu hỏi thành câu hỏi độc lập, chain trả lời từ context)
         """
         # Prompt này dùng để biến câu hỏi mới (có thể là câu hỏi nối tiếp)
         # thành một câu hỏi độc lập dựa trên lịch sử trò chuyện.
@@ -74,10 +137,8 @@ class ChatService:
                 ("human", "{input}"),
             ]
         )
-        # Tạo history-aware retriever
-        history_aware_retriever = create_history_aware_retriever(
-            self.llm, self.retriever, contextualize_q_prompt
-        )
+        # Chain viết lại câu hỏi; chỉ được gọi khi thật sự cần (xem _contextualize)
+        contextualize_chain = contextualize_q_prompt | self.llm | StrOutputParser()
 
         # Prompt cuối cùng để Gemini trả lời câu hỏi DỰA TRÊN context (lấy từ PDF)
         qa_system_prompt = """
@@ -105,66 +166,310 @@ class ChatService:
             self.llm, qa_prompt, document_prompt=document_prompt
         )
 
-        # Kết hợp tất cả lại thành RAG chain cuối cùng
-        rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-        
-        return rag_chain
+        return contextualize_chain, question_answer_chain
+
+    def _plan_rewrite(self, chat_history: list, message: str) -> Tuple[str, str, str]:
+        """
+        Quyết định có cần gọi LLM để viết lại câu hỏi hay không
+
+        Returns:
+            Tuple: (câu hỏi độc lập hoặc None nếu cần gọi LLM, cách xử lý, khóa cache)
+            Cách xử lý: "skip" (không cần viết lại), "cache" (đã viết lại trước đó), "llm"
+        """
+        if not chat_history or is_self_contained(message):
+            return message, "skip", None
+        key = rewrite_cache_key(chat_history, message)
+        question = self.rewrite_cache.get(key)
+        if question is not None:
+            return question, "cache", key
+        return None, "llm", key
+
+    def _contextualize(self, chat_history: list, message: str) -> Tuple[str, str]:
+        question, path, key = self._plan_rewrite(chat_history, message)
+        if question is None:
+            question = self.contextualize_chain.invoke({"chat_history": chat_history, "input": message})
+            self.rewrite_cache.put(key, question)
+        return question, path
+
+    async def _acontextualize(self, chat_history: list, message: str) -> Tuple[str, str]:
+        question, path, key = self._plan_rewrite(chat_history, message)
+        if question is None:
+            question = await self.contextualize_chain.ainvoke({"chat_history": chat_history, "input": message})
+            self.rewrite_cache.put(key, question)
+        return question, path
+
+    async def _acurrent_index_version(self) -> str:
+        # Tải lại FAISS / docs.sqlite có thể mất vài giây: chạy trong thread, không chặn event loop
+        return await asyncio.to_thread(self._current_index_version)
+
+    def _structured_answer(self, question: str) -> Tuple[str, Dict]:
+        """
+        Trả lời trực tiếp câu hỏi tra cứu (thời gian đào tạo, văn bằng... của một ngành).
+        Người gọi kiểm tra phiên bản index (_current_index_version) trước đó.
+
+        Returns:
+            Tuple: (câu trả lời hoặc None nếu cần đi qua RAG, meta)
+        """
+        answer = self.structured.answer(question)
+        return answer, {"retrieval": "structured", "cache": "skip"}
+
+    def _lookup(self, question: str, version: str) -> Tuple[list, str, list, Dict]:
+        """
+        Truy xuất tài liệu cho câu hỏi độc lập:
+        1. BM25 (cục bộ); nếu khớp chắc chắn thì dùng luôn, không embed, chỉ tra
+           cache câu trả lời theo đúng câu hỏi (tầng khớp chính xác)
+        2. Nếu không: embed câu hỏi, tra cache câu trả lời; trượt cache thì trộn
+           kết quả BM25 với kết quả vector (dùng chính embedding vừa tính)
+        Các ứng viên sau đó được ContextPacker chọn lại theo ngân sách token.
+
+        Args:
+            version (str): Phiên bản index của lượt này (khóa của cache câu trả lời)
+
+        Returns:
+            Tuple: (embedding hoặc None, câu trả lời trong cache hoặc None, tài liệu, meta)
+        """
+        lexical_hits, confident = self.hybrid.lexical(question)
+        if confident:
+            return self._lexical_lookup(question, version, lexical_hits)
+        vector = self.embeddings.embed_query(question)
+        cached, meta = self._check_cache(vector, version)
+        docs = []
+        if cached is None:
+            candidates, meta["retrieval"] = self.hybrid.search(vector, lexical_hits)
+            docs, meta = self._pack(candidates, meta)
+        return vector, cached, docs, meta
+
+    async def _alookup(self, question: str, version: str) -> Tuple[list, str, list, Dict]:
+        lexical_hits, confident = self.hybrid.lexical(question)
+        if confident:
+            return self._lexical_lookup(question, version, lexical_hits)
+        vector = await self.embeddings.aembed_query(question)
+        cached, meta = self._check_cache(vector, version)
+        docs = []
+        if cached is None:
+            candidates, meta["retrieval"] = await asyncio.to_thread(self.hybrid.search, vector, lexical_hits)
+            docs, meta = self._pack(candidates, meta)
+        return vector, cached, docs, meta
+
+    def _lexical_lookup(self, question: str, version: str, lexical_hits) -> Tuple[list, str, list, Dict]:
+        cached = self.answer_cache.get_exact(question, version)
+        meta = {"retrieval": "lexical", "cache": "hit" if cached is not None else "miss"}
+        if cached is not None:
+            return None, cached, [], meta
+        return (None, None) + self._pack(self.hybrid.lexical_documents(lexical_hits), meta)
+
+    def _pack(self, candidates: list, meta: Dict) -> Tuple[list, Dict]:
+        docs, context = self.packer.pack(candidates)
+        return docs, {**meta, **context}
+
+    def _check_cache(self, vector, version: str) -> Tuple[str, Dict]:
+        cached, similarity = self.answer_cache.get(vector, version)
+        return cached, {"cache": "hit" if cached is not None else "miss", "similarity": round(similarity, 4)}
+
+    def _remember_answer(self, chat_history: list, vector, question: str, answer: str, version: str):
+        # Chỉ lưu câu trả lời không phụ thuộc lịch sử (lượt đầu tiên của session);
+        # lượt trả lời bằng BM25 không có embedding, chỉ lưu vào tầng khớp chính xác
+        if not chat_history:
+            self.answer_cache.put(vector, question, answer, version)
 
     def create_session(self) -> str:
         """Tạo một session chat mới và trả về session_id."""
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {"chat_history": []}
+        now = time.time()
+        self.store.put(session_id, {"created_at": now, "last_activity": now, "history": []})
         return session_id
 
-    def send_message(self, session_id: str, message: str) -> str:
-        """Xử lý tin nhắn từ người dùng và trả về câu trả lời của chatbot."""
-        if session_id not in self.sessions:
+    def _get_record(self, session_id: str) -> dict:
+        record = self.store.get(session_id)
+        if record is None:
             raise ValueError("Session ID không hợp lệ.")
+        return record
 
-        chat_history = self.sessions[session_id]["chat_history"]
+    def _get_chat_history_for_send(self, session_id: str, message: str):
+        """
+        Dựng lại danh sách Message của LangChain từ lịch sử đã lưu
+        (bản tóm tắt + các lượt gần nhất) và ước lượng số token prompt.
+        """
+        record = self._get_record(session_id)
+        self.history_policy.check_budget(record, message)
+        messages, tokens = self.history_policy.prompt_messages(record)
+        chat_history = [
+            HumanMessage(content=text) if role in ("human", "user") else AIMessage(content=text)
+            for role, text in messages
+        ]
+        return chat_history, tokens + estimate_tokens(message)
 
-        # Gọi RAG chain để xử lý
-        
-        response = self.conversational_rag_chain.invoke({
-            "chat_history": chat_history,
-            "input": message
-        })
+    async def _summarize(self, prompt: str) -> str:
+        return (await self.summary_llm.ainvoke(prompt)).content
 
-        answer = response["answer"]
+    def _save_turn(self, session_id: str, message: str, answer: str, prompt_tokens: int, rewrite: str,
+                   meta: Dict):
+        """Ghi lượt hội thoại và thống kê vào session store (blocking)"""
+        cache = meta["cache"]
+        # Trúng cache hoặc trả lời trực tiếp từ dữ liệu có cấu trúc thì không gọi LLM trả lời
+        answered_by_llm = cache != "hit" and meta.get("retrieval") != "structured"
 
         # Cập nhật lịch sử chat
-        chat_history.append(HumanMessage(content=message))
-        chat_history.append(AIMessage(content=answer))
-        
-        self.sessions[session_id]["chat_history"] = chat_history
+        def apply(record: dict):
+            record["history"].append(["human", message])
+            record["history"].append(["ai", answer])
+            record["last_activity"] = time.time()
+            # Lịch sử được gửi thêm một lần nữa nếu phải gọi LLM để viết lại câu hỏi
+            calls = (1 if rewrite == "llm" else 0) + (1 if answered_by_llm else 0)
+            HistoryPolicy.add_usage(record, prompt_tokens * calls, answer if answered_by_llm else "")
+
+        try:
+            record = self.store.update(session_id, apply)
+        except KeyError:
+            raise ValueError("Session ID không hợp lệ.")
+        logger.info(f"Session {session_id} - rewrite: {rewrite}, cache: {cache}, "
+                    f"retrieval: {meta.get('retrieval')}")
+        return record
+
+    def _record_turn(self, session_id: str, message: str, answer: str, prompt_tokens: int, rewrite: str,
+                     meta: Dict):
+        record = self._save_turn(session_id, message, answer, prompt_tokens, rewrite, meta)
+        self.history_policy.schedule_summary(self.store, session_id, record, self._summarize)
+
+    async def _arecord_turn(self, session_id: str, message: str, answer: str, prompt_tokens: int, rewrite: str,
+                            meta: Dict):
+        # Ghi session store (SQLite / Redis) trên executor, không chặn event loop
+        record = await run_blocking(self._save_turn, session_id, message, answer, prompt_tokens, rewrite, meta)
+        self.history_policy.schedule_summary(self.store, session_id, record, self._summarize)
+
+    def send_message(self, session_id: str, message: str) -> Dict:
+        """
+        Xử lý tin nhắn từ người dùng và trả về câu trả lời của chatbot.
 
-        return answer
+        Returns:
+            Dict: {"answer": câu trả lời, "meta": thông tin cách xử lý lượt này}
+        """
+        chat_history, prompt_tokens = self._get_chat_history_for_send(session_id, message)
+
+        # Viết lại câu hỏi (nếu cần), tra cache / truy xuất tài liệu rồi trả lời
+        question, rewrite = self._contextualize(chat_history, message)
+        version = self._current_index_version()
+        answer, meta = self._structured_answer(question)
+        if answer is None:
+            vector, answer, docs, meta = self._lookup(question, version)
+        if answer is None:
+            answer = self.question_answer_chain.invoke({
+                "context": docs,
+                "chat_history": chat_history,
+                "input": message
+            })
+            self._remember_answer(chat_history, vector, question, answer, version)
+
+        self._record_turn(session_id, message, answer, prompt_tokens, rewrite, meta)
+        return {"answer": answer, "meta": {"rewrite": rewrite, **meta}}
+
+    async def send_message_async(self, session_id: str, message: str) -> Dict:
+        """
+        Phiên bản async của send_message: dùng ainvoke của LangChain nên
+        không chặn event loop trong lúc chờ Gemini.
+        """
+        chat_history, prompt_tokens = await run_blocking(self._get_chat_history_for_send, session_id, message)
+
+        question, rewrite = await self._acontextualize(chat_history, message)
+        version = await self._acurrent_index_version()
+        answer, meta = self._structured_answer(question)
+        if answer is None:
+            vector, answer, docs, meta = await self._alookup(question, version)
+        if answer is None:
+            answer = await self.question_answer_chain.ainvoke({
+                "context": docs,
+                "chat_history": chat_history,
+                "input": message
+            })
+            self._remember_answer(chat_history, vector, question, answer, version)
+
+        await self._arecord_turn(session_id, message, answer, prompt_tokens, rewrite, meta)
+        return {"answer": answer, "meta": {"rewrite": rewrite, **meta}}
     
+    def send_message_stream(self, session_id: str, message: str, meta: Dict = None) -> AsyncIterator[str]:
+        """
+        Trả lời dạng stream bằng astream của chain trả lời.
+        Session được kiểm tra ngay khi gọi (đọc session store, blocking: route async
+        gọi hàm này qua run_blocking); lịch sử chat chỉ được cập nhật khi stream
+        kết thúc trọn vẹn.
+
+        Args:
+            meta (Dict): Nếu truyền vào, được điền thông tin cách xử lý lượt này
+        """
+        chat_history, prompt_tokens = self._get_chat_history_for_send(session_id, message)
+        return self._stream_answer(session_id, chat_history, message, prompt_tokens,
+                                   meta if meta is not None else {})
+
+    async def _stream_answer(self, session_id: str, chat_history: list, message: str,
+                             prompt_tokens: int, meta: Dict) -> AsyncIterator[str]:
+        question, rewrite = await self._acontextualize(chat_history, message)
+        version = await self._acurrent_index_version()
+        cached, lookup_meta = self._structured_answer(question)
+        if cached is None:
+            vector, cached, docs, lookup_meta = await self._alookup(question, version)
+        meta.update(rewrite=rewrite, **lookup_meta)
+
+        if cached is not None:
+            # Trúng cache hoặc trả lời trực tiếp: trả cả câu trả lời trong một lần
+            yield cached
+            await self._arecord_turn(session_id, message, cached, prompt_tokens, rewrite, lookup_meta)
+            return
+
+        parts = []
+        async for text in self.question_answer_chain.astream({
+            "context": docs,
+            "chat_history": chat_history,
+            "input": message
+        }):
+            if text:
+                parts.append(text)
+                yield text
+
+        answer = "".join(parts)
+        self._remember_answer(chat_history, vector, question, answer, version)
+        await self._arecord_turn(session_id, message, answer, prompt_tokens, rewrite, lookup_meta)
+
     def get_chat_history(self, session_id: str) -> list:
         """Lấy lịch sử của một phiên chat."""
-        if session_id not in self.sessions:
-            raise ValueError("Session ID không hợp lệ.")
-        
-        # Chuyển đổi object Message thành dict để dễ serialize qua JSON
         return [
-            {"type": "human", "content": msg.content} if isinstance(msg, HumanMessage) 
-            else {"type": "ai", "content": msg.content}
-            for msg in self.sessions[session_id]["chat_history"]
+            {"type": role, "content": text}
+            for role, text in self._get_record(session_id)["history"]
         ]
 
     def get_session_info(self, session_id: str):
-        if session_id not in self.sessions:
-            raise ValueError("Session ID không hợp lệ.")
         return {
             "session_id": session_id,
-            "history_length": len(self.sessions[session_id]["chat_history"])
+            "history_length": len(self._get_record(session_id)["history"])
+        }
+
+    def health(self) -> dict:
+        """Trạng thái các thành phần, dùng cho /readyz."""
+        return {
+            "index_loaded": self.vector_store is not None,
+            "documents": self.vector_store.index.ntotal if self.vector_store is not None else 0,
+            "index_type": getattr(self.vector_store, "meta", {}).get("index_type", "flat"),
+            "vector_dtype": getattr(self.vector_store, "meta", {}).get("vector_dtype", "float32"),
+            "llm_ready": self.llm is not None,
+            "embeddings_ready": self.embeddings is not None,
+        }
+
+    def cache_stats(self) -> dict:
+        """Thống kê các cache của chatbot và tỷ lệ câu hỏi được trả lời trực tiếp."""
+        return {
+            "structured_lookup": self.structured.stats(),
+            "context_packer": self.packer.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "rewrite_cache": self.rewrite_cache.stats(),
+            "embedding_cache": self.embeddings.stats(),
         }
 
     def list_sessions(self) -> list:
-        return list(self.sessions.keys())
+        return self.store.list_ids()
 
     def delete_session(self, session_id: str):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-        else:
-            raise ValueError("Session ID không hợp lệ.")
\ No newline at end of file
+        if not self.store.delete(session_id):
+            raise ValueError("Session ID không hợp lệ.")
+
+    def cleanup_old_sessions(self, max_age_hours: float = 24, max_sessions: int = None, max_bytes: int = None) -> list:
+        """Xóa session quá hạn, rồi xóa theo LRU nếu vượt giới hạn số lượng/dung lượng."""
+        return self.store.sweep(max_age_hours * 3600, max_sessions, max_bytes)
\ No newline at end of file
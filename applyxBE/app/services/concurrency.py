@@ -0,0 +1,25 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Số lời gọi LLM tối đa được chạy đồng thời trong một worker
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Executor giới hạn dùng khi SDK không có API async
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Chạy một hàm đồng bộ (blocking) trên executor giới hạn, không chặn event loop
+
+    Args:
+        func: Hàm đồng bộ cần chạy
+        *args, **kwargs: Tham số truyền cho hàm
+
+    Returns:
+        Kết quả của hàm
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
@@ -0,0 +1,145 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Set, Tuple
+
+from langchain_core.documents import Document
+
+from app.services.history_policy import estimate_tokens
+from app.services.text_normalize import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Số tài liệu ứng viên lấy từ bước truy xuất (nhiều hơn số tài liệu thực sự đưa vào prompt)
+PACK_FETCH_K = int(os.getenv("PACK_FETCH_K", "12"))
+# Số token tối đa của phần context gửi cho model trả lời
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Số tài liệu tối đa trong context
+PACK_MAX_DOCS = int(os.getenv("PACK_MAX_DOCS", "8"))
+# MMR: trọng số độ liên quan (1 = chỉ theo thứ hạng, 0 = chỉ theo độ đa dạng)
+PACK_MMR_LAMBDA = float(os.getenv("PACK_MMR_LAMBDA", "0.7"))
+# Hai tài liệu có độ trùng từ (Jaccard) từ ngưỡng này được coi là trùng lặp
+PACK_DUPLICATE_THRESHOLD = float(os.getenv("PACK_DUPLICATE_THRESHOLD", "0.8"))
+# Phần còn lại của ngân sách nhỏ hơn mức này thì không cắt thêm tài liệu để chèn vào
+PACK_MIN_TOKENS = int(os.getenv("PACK_MIN_TOKENS", "80"))
+
+# Ranh giới câu: sau dấu kết câu hoặc xuống dòng
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;])\s+|\n")
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """
+    Giữ các câu đầu của văn bản sao cho không vượt quá budget token
+
+    Returns:
+        str: Phần đầu của văn bản (rỗng nếu câu đầu tiên đã vượt budget)
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    end, kept = 0, ""
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        candidate = text[:match.start()].rstrip()
+        if estimate_tokens(candidate) > budget:
+            break
+        end, kept = match.end(), candidate
+    return kept if end else ""
+
+
+class ContextPacker:
+    """
+    Chọn tài liệu đưa vào prompt trả lời từ danh sách ứng viên đã xếp hạng:
+    1. Bỏ tài liệu gần trùng với tài liệu đã chọn
+    2. Chọn lần lượt theo MMR (thứ hạng truy xuất trừ độ giống với tài liệu đã chọn)
+    3. Dừng khi hết ngân sách token; tài liệu không vừa được cắt ở ranh giới câu
+
+    Độ giống giữa hai tài liệu là Jaccard trên tập từ đã bỏ dấu, nên không cần thêm
+    embedding và dùng được cho cả kết quả BM25 lẫn vector.
+    """
+
+    def __init__(self, baseline_k: int, token_budget: int = CONTEXT_TOKEN_BUDGET, max_docs: int = PACK_MAX_DOCS,
+                 mmr_lambda: float = PACK_MMR_LAMBDA, duplicate_threshold: float = PACK_DUPLICATE_THRESHOLD,
+                 min_tokens: int = PACK_MIN_TOKENS):
+        # Số tài liệu trước đây được đưa thẳng vào prompt, dùng để tính số token tiết kiệm
+        self.baseline_k = baseline_k
+        self.token_budget = token_budget
+        self.max_docs = max_docs
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.baseline_tokens = 0
+        self.packed_tokens = 0
+        self.duplicates = 0
+        self.truncated = 0
+
+    def pack(self, candidates: List[Document]) -> Tuple[List[Document], Dict]:
+        """
+        Args:
+            candidates (List[Document]): Tài liệu ứng viên, tốt nhất đứng đầu
+
+        Returns:
+            Tuple: (tài liệu đưa vào prompt, {"context_tokens", "tokens_saved"})
+        """
+        baseline = sum(estimate_tokens(doc.page_content) for doc in candidates[:self.baseline_k])
+        terms = [set(tokenize(doc.page_content)) for doc in candidates]
+        count = len(candidates)
+        remaining = list(range(count))
+        chosen: List[int] = []
+        packed: List[Document] = []
+        used = duplicates = truncated = 0
+
+        while remaining and len(packed) < self.max_docs and self.token_budget - used >= self.min_tokens:
+            best, best_score = None, None
+            for i in remaining:
+                similarity = max((_jaccard(terms[i], terms[j]) for j in chosen), default=0.0)
+                score = self.mmr_lambda * (1 - i / count) - (1 - self.mmr_lambda) * similarity
+                if best_score is None or score > best_score:
+                    best, best_score = i, score
+            remaining.remove(best)
+            if any(_jaccard(terms[best], terms[j]) >= self.duplicate_threshold for j in chosen):
+                duplicates += 1
+                continue
+
+            doc = candidates[best]
+            tokens = estimate_tokens(doc.page_content)
+            if used + tokens > self.token_budget:
+                text = truncate_to_tokens(doc.page_content, self.token_budget - used)
+                if not text:
+                    continue
+                doc = Document(page_content=text, metadata=doc.metadata)
+                tokens = estimate_tokens(text)
+                truncated += 1
+            chosen.append(best)
+            packed.append(doc)
+            used += tokens
+
+        saved = baseline - used
+        with self._lock:
+            self.requests += 1
+            self.baseline_tokens += baseline
+            self.packed_tokens += used
+            self.duplicates += duplicates
+            self.truncated += truncated
+        logger.info(f"Context: {len(packed)}/{count} tài liệu, {used} token "
+                    f"(top-{self.baseline_k}: {baseline}, tiết kiệm {saved}), "
+                    f"bỏ {duplicates} trùng lặp, cắt {truncated}")
+        return packed, {"context_tokens": used, "tokens_saved": saved}
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "token_budget": self.token_budget,
+            "baseline_tokens": self.baseline_tokens,
+            "packed_tokens": self.packed_tokens,
+            "tokens_saved": self.baseline_tokens - self.packed_tokens,
+            "duplicates_dropped": self.duplicates,
+            "truncated": self.truncated,
+        }
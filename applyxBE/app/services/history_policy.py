@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.services.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Số lượt (1 lượt = 1 tin nhắn user + 1 phản hồi) giữ nguyên văn trong prompt
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "24"))
+# Số token tối đa cho phần tóm tắt + lịch sử gửi kèm mỗi request
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+# Tổng số token tối đa một session được dùng (prompt + phản hồi, cộng dồn)
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "300000"))
+# Model dùng để tóm tắt lịch sử (chạy nền, nên dùng model nhanh/rẻ)
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gemini-2.5-flash")
+
+SUMMARY_INSTRUCTION = (
+    "Bạn tóm tắt một đoạn hội thoại giữa người dùng và chatbot tư vấn tuyển sinh ApplyX. "
+    "Viết bản tóm tắt ngắn gọn bằng tiếng Việt, giữ lại mọi thông tin người dùng đã cung cấp "
+    "(câu trả lời khảo sát kèm số câu và lựa chọn, sở thích, điểm số, ngành quan tâm) "
+    "và các kết luận chatbot đã đưa ra. Chỉ trả về bản tóm tắt."
+)
+
+# Cặp tin nhắn mở đầu đưa bản tóm tắt vào prompt (model yêu cầu user/model xen kẽ)
+SUMMARY_PREAMBLE = "Tóm tắt phần hội thoại trước đó:\n{summary}"
+SUMMARY_ACK = "Đã nắm được nội dung trước đó."
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (khoảng 4 ký tự / token), đủ dùng để áp giới hạn"""
+    return len(text) // 4 + 1
+
+
+class HistoryPolicy:
+    """
+    Chính sách lịch sử hội thoại cho mỗi request:
+    - Giữ nguyên văn max_turns lượt gần nhất
+    - Các lượt cũ hơn được gộp vào một bản tóm tắt (cập nhật nền, ngoài request)
+    - Phần tóm tắt + lịch sử không vượt quá token_budget
+    - Tổng token của session không vượt quá session_token_budget
+
+    Session lưu thêm các trường:
+        summary (str): bản tóm tắt các lượt cũ
+        summary_upto (int): số tin nhắn đầu của history đã nằm trong summary
+        tokens_used (int): tổng token ước lượng đã dùng
+    """
+
+    def __init__(self, max_turns: int = HISTORY_MAX_TURNS, token_budget: int = HISTORY_TOKEN_BUDGET,
+                 session_token_budget: int = SESSION_TOKEN_BUDGET):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.session_token_budget = session_token_budget
+        # session_id -> task tóm tắt đang chạy (giữ tham chiếu để task không bị thu hồi)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def window(self, record: Dict) -> Tuple[str, List[List[str]], int]:
+        """
+        Chọn phần lịch sử gửi cho model
+
+        Returns:
+            Tuple[str, List, int]: (bản tóm tắt, các tin nhắn [role, text] giữ nguyên văn,
+                vị trí trong history của tin nhắn nguyên văn đầu tiên)
+        """
+        history = record["history"]
+        summary = record.get("summary", "")
+        start = max(record.get("summary_upto", 0), len(history) - 2 * self.max_turns)
+
+        # Bỏ bớt từng cặp tin nhắn cũ nhất nếu vượt ngân sách token; các cặp này
+        # được tóm tắt ở lần tóm tắt kế tiếp (xem pending_summary)
+        tokens = estimate_tokens(summary) + sum(estimate_tokens(text) for _, text in history[start:])
+        while start < len(history) and tokens > self.token_budget:
+            tokens -= sum(estimate_tokens(text) for _, text in history[start:start + 2])
+            start += 2
+        start = min(start, len(history))
+        return summary, history[start:], start
+
+    def prompt_messages(self, record: Dict) -> Tuple[List[List[str]], int]:
+        """
+        Dựng danh sách tin nhắn [role, text] gửi cho model (tóm tắt + cửa sổ)
+
+        Returns:
+            Tuple[List, int]: (các tin nhắn với role "user"/"model", số token ước lượng)
+        """
+        summary, recent, _ = self.window(record)
+        messages = []
+        if summary:
+            messages.append(["user", SUMMARY_PREAMBLE.format(summary=summary)])
+            messages.append(["model", SUMMARY_ACK])
+        messages.extend(recent)
+        return messages, sum(estimate_tokens(text) for _, text in messages)
+
+    def check_budget(self, record: Dict, message: str):
+        """Báo lỗi nếu session đã dùng hết ngân sách token"""
+        if record.get("tokens_used", 0) + estimate_tokens(message) > self.session_token_budget:
+            raise ValueError("Phiên trò chuyện đã vượt quá giới hạn, vui lòng tạo phiên mới.")
+
+    def pending_summary(self, record: Dict) -> Optional[Tuple[int, int]]:
+        """
+        Trả về khoảng tin nhắn [start, end) đã rơi ra khỏi cửa sổ (do max_turns hoặc
+        do ngân sách token) nhưng chưa được tóm tắt, hoặc None nếu không cần tóm tắt
+        """
+        start = record.get("summary_upto", 0)
+        _, _, end = self.window(record)
+        return (start, end) if end > start else None
+
+    def summary_prompt(self, record: Dict, start: int, end: int) -> str:
+        lines = [f"{role}: {text}" for role, text in record["history"][start:end]]
+        previous = record.get("summary", "")
+        return (
+            f"{SUMMARY_INSTRUCTION}\n\n"
+            + (f"Tóm tắt trước đó:\n{previous}\n\n" if previous else "")
+            + "Đoạn hội thoại cần gộp vào tóm tắt:\n"
+            + "\n".join(lines)
+        )
+
+    def schedule_summary(self, store, session_id: str, record: Dict, summarize: Callable[[str], Awaitable[str]]):
+        """
+        Nếu có lượt cũ cần tóm tắt, chạy tóm tắt trong một task nền (không
+        làm chậm request hiện tại). Gọi ngoài event loop thì bỏ qua; lượt
+        async tiếp theo sẽ tóm tắt. Bản tóm tắt được ghi vào session store
+        qua run_blocking nên task không chặn event loop.
+
+        Args:
+            store: SessionStore chứa session
+            session_id (str): ID của session
+            record (Dict): Dữ liệu session vừa cập nhật (giá trị trả về của store.update)
+            summarize: Hàm async nhận prompt, trả về bản tóm tắt
+        """
+        if session_id in self._tasks:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        pending = self.pending_summary(record)
+        if pending is None:
+            return
+        task = loop.create_task(self._refresh_summary(store, session_id, record, *pending, summarize))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _refresh_summary(self, store, session_id: str, record: Dict, start: int, end: int,
+                               summarize: Callable[[str], Awaitable[str]]):
+        try:
+            summary = (await summarize(self.summary_prompt(record, start, end))).strip()
+            if summary:
+                await run_blocking(store.update, session_id,
+                                   lambda current: self.apply_summary(current, summary, start, end))
+                logger.info(f"Session {session_id}: đã gộp {end - start} tin nhắn vào bản tóm tắt")
+        except KeyError:
+            # Session đã bị xóa trong lúc tóm tắt
+            pass
+        except Exception as e:
+            logger.warning(f"Lỗi tóm tắt lịch sử session {session_id}: {e}")
+
+    @staticmethod
+    def apply_summary(record: Dict, summary: str, start: int, end: int):
+        """Ghi bản tóm tắt mới nếu session chưa bị tóm tắt bởi task khác"""
+        if record.get("summary_upto", 0) != start:
+            return
+        record["summary"] = summary
+        record["summary_upto"] = end
+
+    @staticmethod
+    def add_usage(record: Dict, prompt_tokens: int, response: str):
+        record["tokens_used"] = record.get("tokens_used", 0) + prompt_tokens + estimate_tokens(response)
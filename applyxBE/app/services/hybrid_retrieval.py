@@ -0,0 +1,96 @@
+import os
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from app.services.text_normalize import query_terms, tokenize
+
+# Số ứng viên lấy từ mỗi nguồn (BM25, vector) trước khi trộn
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+# Hằng số k của reciprocal rank fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Kết quả BM25 được coi là chắc chắn (bỏ qua embedding) khi điểm top-1 đạt ít nhất
+# LEXICAL_MIN_SCORE, gấp ít nhất LEXICAL_CONFIDENT_MARGIN lần top-2 và chứa đủ
+# LEXICAL_MIN_COVERAGE các từ của câu hỏi
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "3.0"))
+LEXICAL_CONFIDENT_MARGIN = float(os.getenv("LEXICAL_CONFIDENT_MARGIN", "1.5"))
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "1.0"))
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[int]:
+    """
+    Trộn nhiều danh sách xếp hạng: điểm của một id = tổng 1 / (k + hạng)
+
+    Args:
+        rankings: Các danh sách id, id tốt nhất đứng đầu
+        k (int): Hằng số làm mượt (60 theo bài báo gốc)
+
+    Returns:
+        List[int]: Các id theo điểm giảm dần
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever:
+    """
+    Truy xuất kết hợp BM25 (trên docs_fts của index) và vector (FAISS):
+    - BM25 chạy trước, hoàn toàn cục bộ; nếu kết quả chắc chắn thì dùng luôn,
+      không cần gọi API embedding
+    - Nếu không, kết quả BM25 và vector được trộn bằng reciprocal rank fusion
+    Index định dạng cũ (không có BM25) chỉ dùng vector.
+    """
+
+    def __init__(self, store, k: int, fetch_k: int = HYBRID_FETCH_K, min_score: float = LEXICAL_MIN_SCORE,
+                 margin: float = LEXICAL_CONFIDENT_MARGIN, min_coverage: float = LEXICAL_MIN_COVERAGE):
+        self.store = store
+        self.k = k
+        self.fetch_k = max(fetch_k, k)
+        self.min_score = min_score
+        self.margin = margin
+        self.min_coverage = min_coverage
+        self.supports_lexical = getattr(store, "has_lexical", False)
+
+    def lexical(self, question: str) -> Tuple[List[Tuple[int, float]], bool]:
+        """
+        Returns:
+            Tuple: (các (id, điểm BM25), kết quả có đủ chắc chắn để bỏ qua vector không)
+        """
+        if not self.supports_lexical:
+            return [], False
+        terms = query_terms(question)
+        hits = self.store.lexical_search(terms, self.fetch_k)
+        return hits, self._is_confident(terms, hits)
+
+    def _is_confident(self, terms: List[str], hits: List[Tuple[int, float]]) -> bool:
+        if not hits or hits[0][1] < self.min_score:
+            return False
+        if len(hits) > 1 and hits[0][1] < self.margin * max(hits[1][1], 1e-9):
+            return False
+        tokens = set(tokenize(self.store.folded_text(hits[0][0])))
+        coverage = sum(1 for term in terms if term in tokens) / len(terms)
+        return coverage >= self.min_coverage
+
+    def documents(self, ids: List[int]) -> List[Document]:
+        docs = self.store.get_documents(ids)
+        return [docs[i] for i in ids if i in docs]
+
+    def lexical_documents(self, hits: List[Tuple[int, float]]) -> List[Document]:
+        return self.documents([doc_id for doc_id, _ in hits[:self.k]])
+
+    def search(self, vector: List[float], lexical_hits: List[Tuple[int, float]]) -> Tuple[List[Document], str]:
+        """
+        Returns:
+            Tuple: (k document tốt nhất, cách truy xuất "hybrid" hoặc "vector")
+        """
+        if not self.supports_lexical:
+            return self.store.similarity_search_by_vector(vector, k=self.k), "vector"
+        vector_hits = self.store.vector_search(vector, self.fetch_k)
+        if not lexical_hits:
+            return self.documents([doc_id for doc_id, _ in vector_hits[:self.k]]), "vector"
+        fused = reciprocal_rank_fusion([[doc_id for doc_id, _ in lexical_hits],
+                                        [doc_id for doc_id, _ in vector_hits]])
+        return self.documents(fused[:self.k]), "hybrid"
@@ -1,106 +1,247 @@
-import json
+import logging
 import os
+import threading
+import time
+import uuid
 from typing import Dict, Any, Optional
 
+from app.services.lru_cache import LRUCache
+from app.services.profile_store import PROFILE_DIR, PreconditionFailed, ProfileStore, now_iso
+
+logger = logging.getLogger(__name__)
+
+# Profile mà các route cũ (/profile/save, /profile/get...) dùng khi không truyền profile_id:
+# trước đây toàn bộ người dùng chung một file profile_data/huy.json
+LEGACY_PROFILE_ID = os.getenv("PROFILE_LEGACY_ID", "huy")
+# Số profile tối đa giữ trong cache đọc của mỗi worker (0 = tắt cache)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1024"))
+
+
+class ProfileNotFound(Exception):
+    """Cập nhật một phần profile chưa tồn tại"""
+
+
 class ProfileService:
-    def __init__(self):
-        self.profile_dir = os.path.join(os.path.dirname(__file__), '..', 'profile_data')
-        self.profile_file = os.path.join(self.profile_dir, 'huy.json')
-        
-    def save_profile(self, profile_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Lưu profile vào folder profile_data dạng file huy.json"""
+    """
+    Quản lý profile của nhiều người dùng, mỗi profile có một id riêng (xem ProfileStore).
+    Lần khởi động đầu tiên (store rỗng) các file profile_data/<id>.json cũ được chuyển vào store.
+
+    Kết quả lỗi có thêm 'error': 'not_found' hoặc 'precondition_failed' (If-Match không khớp).
+    Các thao tác ghi nhận if_match (header If-Match) để chỉ ghi khi profile chưa bị ai sửa.
+
+    Profile đã đọc được giữ trong một LRU cache của worker. Mỗi lần ghi qua service
+    cập nhật luôn bản trong cache; khi worker khác ghi vào cùng file (PRAGMA
+    data_version của connection ghi đổi) thì toàn bộ cache được xóa trước khi đọc.
+    """
+
+    def __init__(self, store: Optional[ProfileStore] = None, cache_size: int = PROFILE_CACHE_SIZE):
+        self.store = store or ProfileStore()
+        if self.store.count() == 0:
+            self.store.import_json_files(PROFILE_DIR)
+        self.cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self.external_invalidations = 0
+        # Tăng sau mỗi lần ghi: bản đọc từ SQLite trước một lần ghi xen giữa không được đưa vào cache
+        self._generation = 0
+        # "hit"/"miss" -> [số lần đọc, tổng thời gian (giây)]
+        self._read_time = {"hit": [0, 0.0], "miss": [0, 0.0]}
+
+    def _sync_cache(self):
+        """Xóa cache nếu worker / connection khác đã ghi vào store"""
+        if self.store.changed_externally() and len(self.cache):
+            self.cache.clear()
+            with self._lock:
+                self.external_invalidations += 1
+
+    def _read(self, profile_id: str) -> Optional[Dict]:
+        """Đọc profile qua cache (read-through)"""
+        start = time.perf_counter()
+        self._sync_cache()
+        record = self.cache.get(profile_id)
+        outcome = "hit"
+        if record is None:
+            outcome = "miss"
+            generation = self._generation
+            record = self.store.get(profile_id)
+        with self._lock:
+            if outcome == "miss" and record is not None and generation == self._generation:
+                self.cache.put(profile_id, record)
+            entry = self._read_time[outcome]
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+        return record
+
+    def _written(self, record: Dict) -> Dict:
+        # Ghi xuyên: lần đọc ngay sau khi lưu không phải đọc lại từ SQLite
+        with self._lock:
+            self._generation += 1
+            cached = self.cache.peek(record['id'])
+            # Hai lần ghi đồng thời: giữ bản mới hơn
+            if (cached is None or cached['created_at'] != record['created_at']
+                    or cached['version'] < record['version']):
+                self.cache.put(record['id'], record)
+        return record
+
+    @staticmethod
+    def _result(record: Dict, message: str) -> Dict[str, Any]:
+        return {
+            'success': True,
+            'message': message,
+            'profile_id': record['id'],
+            'version': record['version'],
+            'etag': record['etag'],
+            'data': record['data']
+        }
+
+    @staticmethod
+    def _precondition_failed(e: PreconditionFailed) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error': 'precondition_failed',
+            'message': str(e)
+        }
+
+    @staticmethod
+    def _stamp(data: Dict[str, Any], current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Điền createdAt (giữ nguyên nếu profile đã có) và updatedAt theo giờ server"""
+        now = now_iso()
+        data['createdAt'] = (current or {}).get('createdAt') or data.get('createdAt') or now
+        data['updatedAt'] = now
+        return data
+
+    def create_profile(self, profile_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Tạo profile mới với id ngẫu nhiên"""
         try:
-            # Tạo thư mục nếu chưa tồn tại
-            os.makedirs(self.profile_dir, exist_ok=True)
-            
-            # Lưu vào file JSON
-            with open(self.profile_file, 'w', encoding='utf-8') as f:
-                json.dump(profile_data, f, ensure_ascii=False, indent=2)
-            
+            record = self._written(self.store.create(uuid.uuid4().hex, self._stamp(dict(profile_data), None)))
+            return self._result(record, 'Profile đã được tạo thành công')
+        except Exception as e:
             return {
-                'success': True,
-                'message': 'Profile đã được lưu thành công',
-                'data': profile_data
+                'success': False,
+                'message': f'Lỗi khi tạo profile: {str(e)}'
             }
-            
+
+    def save_profile(self, profile_id: str, profile_data: Dict[str, Any],
+                     if_match: Optional[str] = None) -> Dict[str, Any]:
+        """Lưu (ghi đè hoặc tạo mới) toàn bộ profile"""
+        try:
+            record = self._written(
+                self.store.update(profile_id, lambda current: self._stamp(dict(profile_data), current), if_match))
+            return self._result(record, 'Profile đã được lưu thành công')
+        except PreconditionFailed as e:
+            return self._precondition_failed(e)
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Lỗi khi lưu profile: {str(e)}'
             }
 
-    def get_profile(self) -> Dict[str, Any]:
-        """Lấy thông tin profile từ file"""
+    def get_profile(self, profile_id: str) -> Dict[str, Any]:
+        """Lấy thông tin profile theo id"""
         try:
-            # Kiểm tra file có tồn tại không
-            if not os.path.exists(self.profile_file):
+            record = self._read(profile_id)
+            if record is None:
                 return {
                     'success': False,
+                    'error': 'not_found',
                     'message': 'Profile chưa được tạo',
                     'data': None
                 }
-            
-            # Đọc dữ liệu từ file JSON
-            with open(self.profile_file, 'r', encoding='utf-8') as f:
-                profile_data = json.load(f)
-            
+            return self._result(record, 'Lấy profile thành công')
+        except Exception as e:
             return {
-                'success': True,
-                'message': 'Lấy profile thành công',
-                'data': profile_data
+                'success': False,
+                'message': f'Lỗi khi đọc profile: {str(e)}'
             }
-            
-        except json.JSONDecodeError:
+
+    def etag(self, profile_id: str) -> Optional[str]:
+        """ETag hiện tại của profile (từ cache, hoặc không đọc nội dung), None nếu chưa có"""
+        self._sync_cache()
+        record = self.cache.peek(profile_id)
+        return record['etag'] if record is not None else self.store.etag(profile_id)
+
+    def find_profiles(self, email: Optional[str] = None, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """Tìm profile theo email, hoặc liệt kê các profile sửa gần đây nhất"""
+        try:
+            records = self.store.find_by_email(email) if email else self.store.recent(limit, offset)
             return {
-                'success': False,
-                'message': 'File profile bị lỗi định dạng'
+                'success': True,
+                'message': f'Tìm thấy {len(records)} profile',
+                'data': [{'profile_id': r['id'], 'version': r['version'], **r['data']} for r in records]
             }
         except Exception as e:
             return {
                 'success': False,
-                'message': f'Lỗi khi đọc profile: {str(e)}'
+                'message': f'Lỗi khi tìm profile: {str(e)}'
             }
-    
-    def update_profile(self, updated_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Cập nhật một phần thông tin profile"""
+
+    def update_profile(self, profile_id: str, updated_data: Dict[str, Any],
+                       if_match: Optional[str] = None, create: bool = False) -> Dict[str, Any]:
+        """
+        Cập nhật một phần profile
+
+        Args:
+            profile_id (str): ID của profile
+            updated_data (Dict): Chỉ các trường cần sửa; trường không có trong dict được giữ nguyên
+            if_match (str): Header If-Match của request (nếu có)
+            create (bool): Tạo mới nếu chưa có (route cũ /profile/update); False thì trả 'not_found'
+        """
         try:
-            # Lấy dữ liệu hiện tại
-            current_profile = self.get_profile()
-            
-            if not current_profile['success']:
-                # Nếu chưa có profile, tạo mới
-                return self.save_profile(updated_data)
-            
-            # Merge dữ liệu cũ với dữ liệu mới
-            current_data = current_profile['data']
-            current_data.update(updated_data)
-            
-            # Lưu lại
-            return self.save_profile(current_data)
-            
+            def merge(current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+                # Đọc và ghi trong cùng một transaction: không mất thay đổi của request đồng thời
+                if current is None and not create:
+                    raise ProfileNotFound(f"Profile '{profile_id}' không tồn tại")
+                merged = dict(current or {})
+                merged.update(updated_data)
+                return self._stamp(merged, current)
+
+            record = self._written(self.store.update(profile_id, merge, if_match))
+            return self._result(record, 'Profile đã được cập nhật thành công')
+        except ProfileNotFound as e:
+            return {
+                'success': False,
+                'error': 'not_found',
+                'message': str(e)
+            }
+        except PreconditionFailed as e:
+            return self._precondition_failed(e)
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Lỗi khi cập nhật profile: {str(e)}'
             }
-    
-    def delete_profile(self) -> Dict[str, Any]:
+
+    def delete_profile(self, profile_id: str, if_match: Optional[str] = None) -> Dict[str, Any]:
         """Xóa profile"""
         try:
-            if os.path.exists(self.profile_file):
-                os.remove(self.profile_file)
+            deleted = self.store.delete(profile_id, if_match)
+            with self._lock:
+                self._generation += 1
+                self.cache.pop(profile_id)
+            if deleted:
                 return {
                     'success': True,
                     'message': 'Profile đã được xóa thành công'
                 }
-            else:
-                return {
-                    'success': False,
-                    'message': 'Profile không tồn tại'
-                }
-                
+            return {
+                'success': False,
+                'error': 'not_found',
+                'message': 'Profile không tồn tại'
+            }
+        except PreconditionFailed as e:
+            return self._precondition_failed(e)
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Lỗi khi xóa profile: {str(e)}'
             }
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Tỷ lệ trúng cache và thời gian đọc profile trung bình (ms) khi trúng / trượt"""
+        with self._lock:
+            read_ms = {outcome: round(total / count * 1000, 4) if count else None
+                       for outcome, (count, total) in self._read_time.items()}
+        return {
+            **self.cache.stats(),
+            "external_invalidations": self.external_invalidations,
+            "avg_read_ms": read_ms,
+        }
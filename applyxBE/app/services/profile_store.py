@@ -0,0 +1,264 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parents[1]
+PROFILE_DIR = APP_DIR / "profile_data"
+PROFILE_DB_PATH = os.getenv("PROFILE_DB_PATH", str(PROFILE_DIR / "profiles.db"))
+
+
+def now_iso() -> str:
+    """Thời điểm hiện tại theo định dạng frontend dùng cho updatedAt: 2025-08-17T05:27:10.459Z"""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class PreconditionFailed(ValueError):
+    """If-Match không khớp với phiên bản hiện tại của profile"""
+
+
+def make_etag(profile_id: str, version: int, created_at: str) -> str:
+    """
+    ETag (strong, đã có dấu nháy) của một phiên bản profile. created_at được đưa vào
+    để profile bị xóa rồi tạo lại (version quay về 1) không trùng ETag với bản cũ.
+    """
+    digest = hashlib.sha1(f"{profile_id}|{created_at}|{version}".encode("utf-8")).hexdigest()[:16]
+    return f'"{digest}"'
+
+
+def etag_matches(header: Optional[str], etag: Optional[str], weak: bool = False) -> bool:
+    """
+    So khớp header If-Match / If-None-Match (danh sách ETag hoặc "*") với ETag hiện tại.
+    If-None-Match so khớp kiểu weak (bỏ qua tiền tố W/), If-Match so khớp kiểu strong.
+    """
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    return any((tag.removeprefix("W/") if weak else tag) == etag for tag in tags)
+
+
+def _row_to_record(row) -> Dict:
+    profile_id, data, version, created_at, updated_at = row
+    return {"id": profile_id, "data": json.loads(data), "version": version,
+            "created_at": created_at, "updated_at": updated_at,
+            "etag": make_etag(profile_id, version, created_at)}
+
+
+class ProfileStore:
+    """
+    Lưu profile của nhiều người dùng trong một file SQLite ở chế độ WAL.
+
+    Mỗi profile là một dòng: id, email và updated_at là cột có chỉ mục (tra cứu theo
+    email, liệt kê theo thời gian sửa), toàn bộ profile nằm trong cột JSON data.
+    Cột version tăng 1 sau mỗi lần ghi và quyết định ETag của profile (If-Match /
+    If-None-Match).
+
+    Đọc: mỗi thread giữ một connection riêng, dùng lại cho mọi request.
+    Ghi: mọi lần ghi của process đi qua một connection ghi chung (có khóa); thao tác
+    đọc - sửa - ghi chạy trong BEGIN IMMEDIATE nên các lần lưu đồng thời (kể cả từ
+    worker khác) không ghi đè mất dữ liệu của nhau. Vì commit của chính connection
+    không làm đổi PRAGMA data_version của nó, data_version của connection ghi chỉ
+    đổi khi process khác ghi vào file (xem changed_externally).
+    """
+
+    def __init__(self, path: str = PROFILE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._writer = self._connect()
+        self._write_lock = threading.Lock()
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " id TEXT PRIMARY KEY,"
+            " email TEXT NOT NULL DEFAULT '',"
+            " data TEXT NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " created_at TEXT NOT NULL,"
+            " updated_at TEXT NOT NULL)"
+        )
+        self._writer.execute("CREATE INDEX IF NOT EXISTS idx_profiles_email ON profiles (email)")
+        self._writer.execute("CREATE INDEX IF NOT EXISTS idx_profiles_updated_at ON profiles (updated_at)")
+        self._data_version = self._writer.execute("PRAGMA data_version").fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        """Connection đọc của thread hiện tại"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction ghi trên connection ghi chung của process"""
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._writer
+                self._writer.execute("COMMIT")
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _get(conn: sqlite3.Connection, profile_id: str) -> Optional[Dict]:
+        row = conn.execute(
+            "SELECT id, data, version, created_at, updated_at FROM profiles WHERE id = ?", (profile_id,)
+        ).fetchone()
+        return _row_to_record(row) if row else None
+
+    @staticmethod
+    def _etag(conn: sqlite3.Connection, profile_id: str) -> Optional[str]:
+        row = conn.execute("SELECT version, created_at FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        return make_etag(profile_id, *row) if row else None
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        """
+        Returns:
+            Optional[Dict]: {"id", "data", "version", "created_at", "updated_at", "etag"} hoặc None
+        """
+        return self._get(self._conn(), profile_id)
+
+    def changed_externally(self) -> bool:
+        """
+        Process khác có commit vào file kể từ lần gọi trước không. Lần ghi của
+        process này (qua connection ghi chung) không được tính.
+        """
+        with self._write_lock:
+            version = self._writer.execute("PRAGMA data_version").fetchone()[0]
+            changed = version != self._data_version
+            self._data_version = version
+        return changed
+
+    def etag(self, profile_id: str) -> Optional[str]:
+        """ETag hiện tại của profile mà không đọc / parse cột data (dùng cho If-None-Match)"""
+        return self._etag(self._conn(), profile_id)
+
+    def find_by_email(self, email: str) -> List[Dict]:
+        rows = self._conn().execute(
+            "SELECT id, data, version, created_at, updated_at FROM profiles WHERE email = ? "
+            "ORDER BY updated_at DESC", (email.strip().lower(),)
+        ).fetchall()
+        return [_row_to_record(row) for row in rows]
+
+    def recent(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """Các profile sửa gần đây nhất trước"""
+        rows = self._conn().execute(
+            "SELECT id, data, version, created_at, updated_at FROM profiles "
+            "ORDER BY updated_at DESC LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+        return [_row_to_record(row) for row in rows]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def _write(self, conn: sqlite3.Connection, verb: str, profile_id: str, data: Dict, version: int,
+               created_at: str, updated_at: str) -> int:
+        return conn.execute(
+            f"{verb} INTO profiles (id, email, data, version, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (profile_id, str(data.get("email") or "").strip().lower(),
+             json.dumps(data, ensure_ascii=False, separators=(",", ":")), version, created_at, updated_at),
+        ).rowcount
+
+    def create(self, profile_id: str, data: Dict) -> Optional[Dict]:
+        """
+        Tạo profile mới
+
+        Returns:
+            Optional[Dict]: Record vừa tạo, hoặc None nếu id đã tồn tại
+        """
+        now = now_iso()
+        with self._transaction() as conn:
+            created = self._write(conn, "INSERT OR IGNORE", profile_id, data, 1, now, now)
+        if not created:
+            return None
+        return {"id": profile_id, "data": data, "version": 1, "created_at": now, "updated_at": now,
+                "etag": make_etag(profile_id, 1, now)}
+
+    def update(self, profile_id: str, fn: Callable[[Optional[Dict]], Dict], if_match: Optional[str] = None) -> Dict:
+        """
+        Đọc - sửa - ghi một profile một cách nguyên tử
+
+        Args:
+            profile_id (str): ID của profile
+            fn: Nhận data hiện tại (None nếu chưa có), trả về data mới
+            if_match (str): Header If-Match; nếu có thì chỉ ghi khi khớp ETag hiện tại
+
+        Returns:
+            Dict: Record sau khi ghi
+
+        Raises:
+            PreconditionFailed: If-Match không khớp (hoặc profile chưa tồn tại)
+        """
+        with self._transaction() as conn:
+            current = self._get(conn, profile_id)
+            # Kiểm tra trong cùng transaction với lần ghi: không có request nào chen vào giữa
+            if if_match is not None and not etag_matches(if_match, current["etag"] if current else None):
+                raise PreconditionFailed(f"Profile '{profile_id}' đã bị thay đổi (If-Match không khớp)")
+            data = fn(current["data"] if current else None)
+            now = now_iso()
+            version = current["version"] + 1 if current else 1
+            created_at = current["created_at"] if current else now
+            self._write(conn, "INSERT OR REPLACE", profile_id, data, version, created_at, now)
+        return {"id": profile_id, "data": data, "version": version, "created_at": created_at, "updated_at": now,
+                "etag": make_etag(profile_id, version, created_at)}
+
+    def put(self, profile_id: str, data: Dict, if_match: Optional[str] = None) -> Dict:
+        """Ghi đè (hoặc tạo) toàn bộ profile"""
+        return self.update(profile_id, lambda _: data, if_match)
+
+    def delete(self, profile_id: str, if_match: Optional[str] = None) -> bool:
+        """
+        Returns:
+            bool: False nếu profile không tồn tại
+
+        Raises:
+            PreconditionFailed: If-Match không khớp
+        """
+        with self._transaction() as conn:
+            if if_match is not None:
+                etag = self._etag(conn, profile_id)
+                if etag is not None and not etag_matches(if_match, etag):
+                    raise PreconditionFailed(f"Profile '{profile_id}' đã bị thay đổi (If-Match không khớp)")
+            return conn.execute("DELETE FROM profiles WHERE id = ?", (profile_id,)).rowcount > 0
+
+    def import_json_files(self, directory: Path) -> List[str]:
+        """
+        Chuyển các profile dạng file (profile_data/<id>.json, định dạng cũ) vào store.
+        Profile đã có trong store được giữ nguyên; file cũ không bị xóa.
+
+        Returns:
+            List[str]: Các id đã được thêm
+        """
+        imported = []
+        for path in sorted(Path(directory).glob("*.json")):
+            if self.get(path.stem) is not None:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Bỏ qua profile '{path.name}' không đọc được: {e}")
+                continue
+            # Nhiều worker cùng khởi động: chỉ worker chèn được dòng mới tính là đã chuyển
+            if self.create(path.stem, data) is not None:
+                imported.append(path.stem)
+        if imported:
+            logger.info(f"Đã chuyển {len(imported)} profile từ '{directory}' vào '{self.path}': {imported}")
+        return imported
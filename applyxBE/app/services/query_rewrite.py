@@ -0,0 +1,38 @@
+import hashlib
+import os
+import re
+
+# Số tin nhắn cuối của lịch sử dùng làm khóa cache cho câu hỏi đã viết lại
+REWRITE_KEY_MESSAGES = int(os.getenv("REWRITE_KEY_MESSAGES", "4"))
+# Câu hỏi ngắn hơn số từ này thường là câu nối tiếp ("còn học phí?")
+MIN_SELF_CONTAINED_WORDS = 5
+
+# Các từ/cụm từ tham chiếu tới ngữ cảnh trước (đại từ, từ nối tiếp)
+_REFERENCE_PATTERN = re.compile(
+    r"\b(nó|đó|này|kia|ấy|vậy|thế|họ|cái đấy|như vậy|như trên|ở trên|thì sao|còn|"
+    r"ngành đấy|trường đấy|it|that|this|they|those|these)\b",
+    re.IGNORECASE,
+)
+
+
+def is_self_contained(message: str) -> bool:
+    """
+    Heuristic rẻ: câu hỏi đủ dài và không chứa từ tham chiếu tới ngữ cảnh
+    trước thì có thể dùng trực tiếp để truy xuất, không cần viết lại.
+    """
+    text = message.strip().lower()
+    if len(text.split()) < MIN_SELF_CONTAINED_WORDS:
+        return False
+    return _REFERENCE_PATTERN.search(text) is None
+
+
+def rewrite_cache_key(chat_history: list, message: str) -> str:
+    """Khóa cache: hash của vài tin nhắn cuối trong lịch sử + câu hỏi đã chuẩn hóa"""
+    digest = hashlib.sha1()
+    for msg in chat_history[-REWRITE_KEY_MESSAGES:]:
+        digest.update(msg.type.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(msg.content.encode("utf-8"))
+        digest.update(b"\x00")
+    digest.update(" ".join(message.lower().split()).encode("utf-8"))
+    return digest.hexdigest()
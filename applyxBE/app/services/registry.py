@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    """
+    Bọc một service nặng (load FAISS, tạo client Google...) để chỉ khởi tạo
+    khi cần: lần dùng đầu tiên hoặc trong task warm-up lúc khởi động.
+    Nếu khởi tạo lỗi, lỗi được ghi lại và lần gọi sau sẽ thử lại.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], object]):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        """Trả về instance, khởi tạo (đồng bộ) nếu chưa có"""
+        if self._instance is not None:
+            return self._instance
+        with self._lock:
+            if self._instance is None:
+                start = time.perf_counter()
+                try:
+                    self._instance = self._factory()
+                except Exception as e:
+                    self.error = str(e)
+                    logger.error(f"Lỗi khởi tạo service {self.name}: {e}")
+                    raise
+                self.error = None
+                self.load_seconds = time.perf_counter() - start
+                logger.info(f"Đã khởi tạo service {self.name} trong {self.load_seconds:.2f}s")
+        return self._instance
+
+    async def aget(self):
+        """Như get() nhưng khởi tạo trên thread riêng để không chặn event loop"""
+        if self._instance is not None:
+            return self._instance
+        return await asyncio.to_thread(self.get)
+
+    async def warm_up(self):
+        """Khởi tạo trước service; lỗi chỉ được ghi log, không làm dừng ứng dụng"""
+        try:
+            await self.aget()
+        except Exception:
+            pass
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
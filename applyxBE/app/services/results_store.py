@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa file, chỉ dùng được với 1 worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parents[1]
+RESULTS_LOG_PATH = os.getenv("RESULTS_LOG_PATH", str(APP_DIR / "session" / "results.jsonl"))
+# Định dạng cũ: một file duy nhất chứa kết quả lưu gần nhất (của bất kỳ session nào)
+LEGACY_RESULTS_FILE = APP_DIR / "session" / "session_data.txt"
+# Compact file log khi có ít nhất RESULTS_COMPACT_MIN_RECORDS dòng và quá RESULTS_COMPACT_RATIO
+# trong số đó là bản cũ (đã bị lần lưu sau của cùng session thay thế)
+RESULTS_COMPACT_MIN_RECORDS = int(os.getenv("RESULTS_COMPACT_MIN_RECORDS", "1000"))
+RESULTS_COMPACT_RATIO = float(os.getenv("RESULTS_COMPACT_RATIO", "0.5"))
+
+SCORE_FIELDS = ("averageScore", "worldNeedsScore", "paidScore", "loveScore", "goodAtScore")
+TEXT_FIELDS = ("subtitle", "color", "explanation")
+
+_CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def _int(value, field: str, index: int) -> int:
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        raise ValueError(f"careers[{index}].{field} phải là số, nhận được {value!r}")
+
+
+def parse_careers(result: str) -> List[Dict]:
+    """
+    Đọc kết quả Ikigai do model trả về (JSON {"careers": [...]}, có thể nằm trong ```json ... ```)
+
+    Returns:
+        List[Dict]: Các nghề theo rank tăng dần, mỗi nghề có rank, title, các điểm
+            (số nguyên 0 - 100) và subtitle / color / explanation
+
+    Raises:
+        ValueError: Không có JSON hợp lệ hoặc thiếu / sai kiểu trường bắt buộc
+    """
+    fenced = _CODE_FENCE.search(result)
+    text = fenced.group(1) if fenced else result[result.find("{"):result.rfind("}") + 1]
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Kết quả không phải JSON hợp lệ: {e}")
+    careers = data.get("careers") if isinstance(data, dict) else None
+    if not isinstance(careers, list) or not careers:
+        raise ValueError("Kết quả không có danh sách \"careers\"")
+
+    parsed = []
+    for index, career in enumerate(careers):
+        if not isinstance(career, dict):
+            raise ValueError(f"careers[{index}] phải là object")
+        title = str(career.get("title") or "").strip()
+        if not title:
+            raise ValueError(f"careers[{index}] thiếu title")
+        item = {"rank": _int(career.get("rank", index + 1), "rank", index), "title": title}
+        for field in SCORE_FIELDS:
+            item[field] = min(max(_int(career.get(field), field, index), 0), 100)
+        for field in TEXT_FIELDS:
+            item[field] = str(career.get(field) or "")
+        parsed.append(item)
+    return sorted(parsed, key=lambda item: item["rank"])
+
+
+class ResultsStore:
+    """
+    Lưu kết quả Ikigai theo session trong một file log JSONL chỉ ghi nối (append-only).
+
+    Mỗi lần lưu là một dòng {"session_id", "profile_id", "saved_at", "result", "careers"}:
+    result là chuỗi gốc model trả về, careers là danh sách đã parse / kiểm tra lúc lưu.
+    Trong bộ nhớ giữ chỉ mục session_id -> vị trí dòng mới nhất trong file và
+    profile_id -> các session, nên mỗi lần tra cứu chỉ đọc đúng một dòng.
+
+    Nhiều worker dùng chung file: việc ghi nối và compact được khóa bằng flock;
+    trước mỗi lần tra cứu chỉ mục đọc thêm các dòng worker khác vừa ghi (hoặc dựng
+    lại nếu file đã được compact). Khi phần lớn file là bản cũ, file được viết lại
+    chỉ với bản mới nhất của mỗi session rồi đổi tên thay cho file cũ.
+    """
+
+    def __init__(self, path: str = RESULTS_LOG_PATH, compact_min_records: int = RESULTS_COMPACT_MIN_RECORDS,
+                 compact_ratio: float = RESULTS_COMPACT_RATIO):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        # session_id -> (vị trí, độ dài) của dòng mới nhất; profile_id -> các session (mới nhất cuối)
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._profile_index: Dict[str, List[str]] = {}
+        self._session_profile: Dict[str, str] = {}
+        self._records = 0
+        self._inode = None
+        self._end = 0
+        # File descriptor đọc giữ mở, mở lại khi file bị thay bằng file đã compact
+        self._fd = None
+        self.compactions = 0
+
+    @contextmanager
+    def _file_lock(self):
+        """Khóa giữa các worker (file .lock cạnh file log) và giữa các thread"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reset_index(self):
+        self._index, self._profile_index, self._session_profile = {}, {}, {}
+        self._records, self._end = 0, 0
+
+    def _index_record(self, record: Dict, offset: int, length: int):
+        session_id = record["session_id"]
+        self._index[session_id] = (offset, length)
+        self._records += 1
+        profile_id = record.get("profile_id")
+        previous = self._session_profile.get(session_id)
+        if previous is not None and session_id in self._profile_index.get(previous, []):
+            self._profile_index[previous].remove(session_id)
+        if profile_id:
+            self._session_profile[session_id] = profile_id
+            self._profile_index.setdefault(profile_id, []).append(session_id)
+
+    def _refresh(self):
+        """Đọc các dòng mới được ghi vào file (bởi worker này hoặc worker khác) vào chỉ mục"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset_index()
+            self._inode = None
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._end:
+            # File đã được compact (thay bằng file mới): dựng lại chỉ mục từ đầu
+            self._reset_index()
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDONLY)
+            self._inode = os.fstat(self._fd).st_ino
+        if stat.st_size == self._end:
+            return
+        with os.fdopen(os.dup(self._fd), "rb") as f:
+            f.seek(self._end)
+            offset = self._end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Dòng đang được ghi dở: đọc lại ở lần sau
+                    break
+                try:
+                    self._index_record(json.loads(line), offset, len(line))
+                except (ValueError, KeyError):
+                    logger.warning(f"Bỏ qua dòng lỗi trong '{self.path}' tại vị trí {offset}")
+                offset += len(line)
+            self._end = offset
+
+    def _read_at(self, offset: int, length: int) -> Dict:
+        return json.loads(os.pread(self._fd, length, offset))
+
+    def save(self, session_id: str, result: str, profile_id: Optional[str] = None,
+             saved_at: Optional[float] = None) -> Dict:
+        """
+        Parse, kiểm tra rồi ghi nối kết quả của một session
+
+        Args:
+            saved_at (float): Thời điểm lưu (timestamp); None là thời điểm hiện tại
+
+        Raises:
+            ValueError: Kết quả không phải JSON careers hợp lệ (xem parse_careers)
+        """
+        record = {
+            "session_id": session_id,
+            "profile_id": profile_id,
+            "saved_at": time.time() if saved_at is None else saved_at,
+            "result": result,
+            "careers": parse_careers(result),
+        }
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._file_lock():
+            self._refresh()
+            with open(self.path, "ab") as f:
+                f.write(line)
+            self._refresh()
+            if self._should_compact():
+                self._compact()
+        return record
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Kết quả mới nhất của session (None nếu chưa lưu)"""
+        with self._lock:
+            self._refresh()
+            position = self._index.get(session_id)
+            if position is None:
+                return None
+            # fd vẫn trỏ tới file mà chỉ mục được dựng từ đó, kể cả khi worker khác vừa compact
+            return self._read_at(*position)
+
+    def by_profile(self, profile_id: str) -> List[Dict]:
+        """Kết quả của các session gắn với profile, mới nhất trước"""
+        with self._lock:
+            self._refresh()
+            session_ids = list(reversed(self._profile_index.get(profile_id, [])))
+        return [record for record in map(self.get, session_ids) if record is not None]
+
+    def records(self) -> Iterator[Dict]:
+        """Kết quả mới nhất của mọi session, theo thứ tự lưu"""
+        with self._lock:
+            self._refresh()
+            session_ids = [session_id for session_id, _ in sorted(self._index.items(), key=lambda item: item[1])]
+        for session_id in session_ids:
+            record = self.get(session_id)
+            if record is not None:
+                yield record
+
+    def _should_compact(self) -> bool:
+        stale = self._records - len(self._index)
+        return self._records >= self.compact_min_records and stale > self.compact_ratio * self._records
+
+    def _compact(self):
+        """Viết lại file chỉ với bản mới nhất của mỗi session (gọi khi đang giữ _file_lock)"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        before = self._records
+        positions = sorted(self._index.values())
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            for offset, length in positions:
+                src.seek(offset)
+                dst.write(src.read(length))
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, self.path)
+        self._inode = None
+        self._refresh()
+        self.compactions += 1
+        logger.info(f"Đã compact '{self.path}': {before} -> {self._records} dòng")
+
+    def compact(self):
+        with self._file_lock():
+            self._refresh()
+            self._compact()
+
+    def import_legacy(self, path: Path) -> bool:
+        """
+        Chuyển kết quả trong file session_data.txt cũ ("session_id: ...\\nresult: ...") vào store
+        nếu session đó chưa có kết quả. File cũ được giữ nguyên; saved_at là thời điểm sửa
+        file (lúc kết quả được lưu), không phải lúc chuyển.
+        """
+        try:
+            text = Path(path).read_text(encoding="utf-8")
+            saved_at = os.stat(path).st_mtime
+        except OSError:
+            return False
+        match = re.match(r"session_id: (.*)\nresult: (.*)", text, re.DOTALL)
+        if not match or self.get(match.group(1).strip()) is not None:
+            return False
+        try:
+            self.save(match.group(1).strip(), match.group(2).strip(), saved_at=saved_at)
+        except ValueError as e:
+            logger.warning(f"Không chuyển được kết quả trong '{path}': {e}")
+            return False
+        logger.info(f"Đã chuyển kết quả của session {match.group(1).strip()} từ '{path}'")
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refresh()
+            return {
+                "sessions": len(self._index),
+                "profiles": len(self._profile_index),
+                "records": self._records,
+                "file_bytes": self._end,
+                "compactions": self.compactions,
+            }
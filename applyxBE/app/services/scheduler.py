@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from app.services.concurrency import LLM_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Số request tối đa được phép chờ (chờ lock của session hoặc chờ slot chung)
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+# Thời gian chờ tối đa (giây) trước khi trả về 503
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+
+class SchedulerOverloaded(Exception):
+    """Request bị từ chối do hệ thống quá tải (hàng đợi đầy hoặc chờ quá lâu)"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Quyền chạy một lượt chat: giữ lock của session và một slot chung"""
+
+    def __init__(self, scheduler: "LLMScheduler", session_id: str):
+        self._scheduler = scheduler
+        self._session_id = session_id
+        self._started = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._scheduler._release(self._session_id, time.perf_counter() - self._started)
+
+
+class LLMScheduler:
+    """
+    Điều phối các lời gọi LLM:
+    - Lock theo session: các lượt chat của cùng một session chạy tuần tự
+    - Giới hạn số lời gọi đang chạy (max_in_flight) với hàng đợi có giới hạn
+    - Hàng đợi đầy -> 429, chờ quá queue_timeout -> 503, kèm Retry-After
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._slots = None
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._session_refs: Dict[str, int] = {}
+        self._in_flight = 0
+        # Số request đã nhận (đang chạy + đang chờ), tăng ngay khi vào acquire trước lần await đầu tiên
+        self._pending = 0
+        # Thời gian phục vụ trung bình (EWMA), dùng để ước lượng Retry-After
+        self._avg_service_time = 1.0
+        self._stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Tạo lười để semaphore gắn với event loop đang chạy
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._slots
+
+    def _retry_after(self) -> int:
+        backlog = self._pending / max(self.max_in_flight, 1)
+        return max(1, min(60, math.ceil(self._avg_service_time * backlog)))
+
+    async def acquire(self, session_id: str) -> Ticket:
+        """
+        Chờ tới lượt cho một request của session
+
+        Args:
+            session_id (str): ID của session
+
+        Returns:
+            Ticket: Phải gọi ticket.release() khi xong
+
+        Raises:
+            SchedulerOverloaded: Hàng đợi đầy (429) hoặc chờ quá lâu (503)
+        """
+        slots = self._get_slots()
+        # Đếm chỗ đồng bộ trước lần await đầu tiên: một loạt request đến cùng lúc không thể
+        # cùng thấy slot còn trống rồi vượt quá giới hạn hàng đợi
+        if self._pending >= self.max_in_flight + self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            logger.warning(f"Từ chối request của {session_id}: hàng đợi đầy "
+                           f"({self._pending - self._in_flight}/{self.max_queue})")
+            raise SchedulerOverloaded("Hệ thống đang quá tải, vui lòng thử lại sau.", 429, self._retry_after())
+
+        self._pending += 1
+        lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        self._session_refs[session_id] = self._session_refs.get(session_id, 0) + 1
+        deadline = time.monotonic() + self.queue_timeout
+        lock_acquired = False
+        try:
+            # Mọi request đều chờ có giới hạn: lock / slot rảnh lúc kiểm tra vẫn có thể bị
+            # request đang xếp hàng lấy trước, khi đó request này cũng phải nhận 503 đúng hạn
+            await asyncio.wait_for(lock.acquire(), self.queue_timeout)
+            lock_acquired = True
+            await asyncio.wait_for(slots.acquire(), max(deadline - time.monotonic(), 0))
+        except BaseException as e:
+            if lock_acquired:
+                lock.release()
+            self._pending -= 1
+            self._drop_session_ref(session_id)
+            if isinstance(e, asyncio.TimeoutError):
+                self._stats["rejected_timeout"] += 1
+                logger.warning(f"Từ chối request của {session_id}: chờ quá {self.queue_timeout}s")
+                raise SchedulerOverloaded("Hết thời gian chờ xử lý, vui lòng thử lại sau.", 503,
+                                          self._retry_after()) from None
+            raise
+
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+        return Ticket(self, session_id)
+
+    @asynccontextmanager
+    async def slot(self, session_id: str):
+        """Dùng với `async with scheduler.slot(session_id): ...`"""
+        ticket = await self.acquire(session_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _release(self, session_id: str, service_time: float):
+        self._in_flight -= 1
+        self._pending -= 1
+        self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+        self._get_slots().release()
+        self._session_locks[session_id].release()
+        self._drop_session_ref(session_id)
+
+    def _drop_session_ref(self, session_id: str):
+        # Xóa lock khi không còn request nào của session để dict không phình ra
+        refs = self._session_refs.get(session_id, 0) - 1
+        if refs <= 0:
+            self._session_refs.pop(session_id, None)
+            self._session_locks.pop(session_id, None)
+        else:
+            self._session_refs[session_id] = refs
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._pending - self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "avg_service_time_s": round(self._avg_service_time, 3),
+            **self._stats,
+        }
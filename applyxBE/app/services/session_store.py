@@ -0,0 +1,341 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # redis là tùy chọn, chỉ cần khi SESSION_STORE=redis
+    redis = None
+
+APP_DIR = Path(__file__).resolve().parents[1]
+
+# Backend lưu session: memory | sqlite | redis
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", str(APP_DIR / "session" / "sessions.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def dumps(record: Dict) -> str:
+    """Serialize một session ở dạng JSON gọn (không khoảng trắng thừa)"""
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data) -> Dict:
+    return json.loads(data)
+
+
+class SessionStore:
+    """
+    Giao diện lưu trữ session dùng chung cho các chatbot.
+
+    Mỗi session là một dict JSON được, ví dụ:
+        {"created_at": 1700000000.0, "last_activity": 1700000100.0,
+         "message_count": 2, "history": [["user", "..."], ["model", "..."]]}
+    Không lưu object ChatSession của Gemini; chat được dựng lại từ history.
+    """
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, record: Dict):
+        raise NotImplementedError
+
+    def update(self, session_id: str, fn: Callable[[Dict], None]) -> Dict:
+        """
+        Đọc - sửa - ghi một session một cách nguyên tử
+
+        Args:
+            session_id (str): ID của session
+            fn: Hàm sửa record tại chỗ
+
+        Returns:
+            Dict: Record sau khi sửa
+
+        Raises:
+            KeyError: Session không tồn tại
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def list_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    def exists(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def _entries(self) -> Iterable[Tuple[str, float, int]]:
+        """Trả về (session_id, last_activity, số byte đã serialize) của mọi session"""
+        raise NotImplementedError
+
+    def sweep(self, max_idle_seconds: float = None, max_sessions: int = None,
+              max_bytes: int = None) -> List[str]:
+        """
+        Dọn session: xóa session không hoạt động quá max_idle_seconds, sau đó
+        xóa session ít dùng gần đây nhất (LRU) cho tới khi số session và tổng
+        dung lượng nằm trong giới hạn.
+
+        Args:
+            max_idle_seconds (float): Thời gian không hoạt động tối đa
+            max_sessions (int): Số session tối đa
+            max_bytes (int): Tổng dung lượng (ước lượng theo JSON) tối đa
+
+        Returns:
+            List[str]: Các session_id đã bị xóa
+        """
+        now = time.time()
+        evicted = []
+        kept = []
+        # Sắp theo last_activity tăng dần: session ít dùng gần đây nhất đứng đầu
+        for session_id, last_activity, size in sorted(self._entries(), key=lambda entry: entry[1]):
+            if max_idle_seconds is not None and now - last_activity > max_idle_seconds:
+                evicted.append(session_id)
+            else:
+                kept.append((session_id, size))
+
+        total_bytes = sum(size for _, size in kept)
+        index = 0
+        while index < len(kept) and (
+            (max_sessions is not None and len(kept) - index > max_sessions)
+            or (max_bytes is not None and total_bytes > max_bytes)
+        ):
+            session_id, size = kept[index]
+            evicted.append(session_id)
+            total_bytes -= size
+            index += 1
+
+        for session_id in evicted:
+            self.delete(session_id)
+        return evicted
+
+
+class InMemorySessionStore(SessionStore):
+    """Lưu trong bộ nhớ của process (hành vi cũ, chỉ dùng được với 1 worker)"""
+
+    def __init__(self):
+        self._data: Dict[str, str] = {}
+        # session_id -> (last_activity, số byte), để dọn session mà không phải parse JSON
+        self._meta: Dict[str, Tuple[float, int]] = {}
+        # Mọi thao tác ghi (kể cả dọn session) đi qua lock: lần xóa của sweeper không bị
+        # một update() đang đọc - sửa - ghi ghi đè lại. RLock vì update() gọi put()
+        self._lock = threading.RLock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        data = self._data.get(session_id)
+        return loads(data) if data is not None else None
+
+    def put(self, session_id: str, record: Dict):
+        data = dumps(record)
+        with self._lock:
+            self._data[session_id] = data
+            self._meta[session_id] = (record.get("last_activity", 0), len(data.encode("utf-8")))
+
+    def update(self, session_id: str, fn: Callable[[Dict], None]) -> Dict:
+        with self._lock:
+            record = self.get(session_id)
+            if record is None:
+                raise KeyError(session_id)
+            fn(record)
+            self.put(session_id, record)
+            return record
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._meta.pop(session_id, None)
+            return self._data.pop(session_id, None) is not None
+
+    def sweep(self, max_idle_seconds: float = None, max_sessions: int = None,
+              max_bytes: int = None) -> List[str]:
+        # Giữ lock trong cả lần dọn: session không thể được dùng lại giữa lúc chọn và lúc xóa
+        with self._lock:
+            return super().sweep(max_idle_seconds, max_sessions, max_bytes)
+
+    def list_ids(self) -> List[str]:
+        return list(self._data.keys())
+
+    def _entries(self) -> Iterable[Tuple[str, float, int]]:
+        return [(session_id, last_activity, size) for session_id, (last_activity, size) in list(self._meta.items())]
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Lưu trong một file SQLite cục bộ ở chế độ WAL, dùng chung được giữa
+    nhiều worker trên cùng một máy. Mỗi thread giữ một connection riêng.
+    """
+
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " namespace TEXT NOT NULL,"
+            " session_id TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " last_activity REAL NOT NULL,"
+            " PRIMARY KEY (namespace, session_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_activity ON sessions (namespace, last_activity)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: tự quản lý transaction bằng BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE namespace = ? AND session_id = ?",
+            (self.namespace, session_id),
+        ).fetchone()
+        return loads(row[0]) if row else None
+
+    def put(self, session_id: str, record: Dict):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (namespace, session_id, data, last_activity) VALUES (?, ?, ?, ?)",
+            (self.namespace, session_id, dumps(record), record.get("last_activity", 0)),
+        )
+
+    def update(self, session_id: str, fn: Callable[[Dict], None]) -> Dict:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            record = self.get(session_id)
+            if record is None:
+                raise KeyError(session_id)
+            fn(record)
+            self.put(session_id, record)
+            conn.execute("COMMIT")
+            return record
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, session_id: str) -> bool:
+        cursor = self._conn().execute(
+            "DELETE FROM sessions WHERE namespace = ? AND session_id = ?",
+            (self.namespace, session_id),
+        )
+        return cursor.rowcount > 0
+
+    def list_ids(self) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT session_id FROM sessions WHERE namespace = ?", (self.namespace,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _entries(self) -> Iterable[Tuple[str, float, int]]:
+        return self._conn().execute(
+            "SELECT session_id, last_activity, length(CAST(data AS BLOB)) FROM sessions WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchall()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Lưu trong Redis (hoặc server tương thích Redis), dùng chung giữa nhiều
+    replica. Có thể truyền sẵn `client` (ví dụ fakeredis) để chạy thử cục bộ.
+    """
+
+    def __init__(self, namespace: str, url: str = REDIS_URL, client=None):
+        if client is None:
+            if redis is None:
+                raise ImportError("Cần cài package 'redis' để dùng SESSION_STORE=redis")
+            client = redis.Redis.from_url(url)
+        # Lớp lỗi WATCH lấy một lần: từ package redis, hoặc từ package của client truyền vào
+        watch_error = getattr(redis, "WatchError", None) or getattr(
+            sys.modules.get(type(client).__module__.split(".")[0]), "WatchError", None)
+        if watch_error is None:
+            raise ImportError("Cần cài package 'redis' (hoặc client có WatchError) để dùng RedisSessionStore")
+        self._watch_error = watch_error
+        self.client = client
+        self.prefix = f"applyx:{namespace}"
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}:session:{session_id}"
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        data = self.client.get(self._key(session_id))
+        return loads(data) if data is not None else None
+
+    def put(self, session_id: str, record: Dict):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(session_id), dumps(record))
+        pipe.zadd(f"{self.prefix}:activity", {session_id: record.get("last_activity", 0)})
+        pipe.execute()
+
+    def update(self, session_id: str, fn: Callable[[Dict], None]) -> Dict:
+        key = self._key(session_id)
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    # WATCH: nếu worker khác sửa session trong lúc này thì thử lại
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    if data is None:
+                        raise KeyError(session_id)
+                    record = loads(data)
+                    fn(record)
+                    pipe.multi()
+                    pipe.set(key, dumps(record))
+                    pipe.zadd(f"{self.prefix}:activity", {session_id: record.get("last_activity", 0)})
+                    pipe.execute()
+                    return record
+                except self._watch_error:
+                    continue
+
+    def delete(self, session_id: str) -> bool:
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.zrem(f"{self.prefix}:activity", session_id)
+        deleted, _ = pipe.execute()
+        return deleted > 0
+
+    def list_ids(self) -> List[str]:
+        return [session_id for session_id, _ in self._activity()]
+
+    def _activity(self) -> List[Tuple[str, float]]:
+        # Sorted set session_id -> last_activity, vừa là danh sách id vừa dùng để dọn LRU
+        return [
+            (session_id.decode() if isinstance(session_id, bytes) else session_id, score)
+            for session_id, score in self.client.zrange(f"{self.prefix}:activity", 0, -1, withscores=True)
+        ]
+
+    def _entries(self) -> Iterable[Tuple[str, float, int]]:
+        activity = self._activity()
+        pipe = self.client.pipeline()
+        for session_id, _ in activity:
+            pipe.strlen(self._key(session_id))
+        sizes = pipe.execute()
+        return [(session_id, score, size) for (session_id, score), size in zip(activity, sizes)]
+
+
+def create_session_store(namespace: str) -> SessionStore:
+    """
+    Tạo session store theo biến môi trường SESSION_STORE
+
+    Args:
+        namespace (str): Tên nhóm session (mỗi chatbot một namespace)
+
+    Returns:
+        SessionStore: Backend tương ứng
+    """
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH, namespace)
+    if SESSION_STORE == "redis":
+        return RedisSessionStore(namespace)
+    if SESSION_STORE == "memory":
+        return InMemorySessionStore()
+    raise ValueError(f"SESSION_STORE không hợp lệ: {SESSION_STORE}")
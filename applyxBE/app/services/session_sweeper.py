@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List
+
+from app.services.registry import LazyService
+
+logger = logging.getLogger(__name__)
+
+# Session không hoạt động quá thời gian này (giây) sẽ bị xóa
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+# Giới hạn cứng cho mỗi chatbot; vượt quá thì xóa session ít dùng gần đây nhất
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+
+class SessionSweeper:
+    """
+    Task nền định kỳ gọi cleanup_old_sessions của các chatbot để giữ bộ nhớ
+    ổn định: xóa theo TTL, rồi theo LRU khi vượt giới hạn số lượng/dung lượng.
+    Chỉ dọn các service đã được khởi tạo.
+    """
+
+    def __init__(self, services: List[LazyService], interval: float = SESSION_SWEEP_INTERVAL,
+                 ttl_seconds: float = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_COUNT,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        self.services = services
+        self.interval = interval
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._evicted: Dict[str, int] = {service.name: 0 for service in services}
+        self._last_run = None
+        self._last_evicted = 0
+
+    def sweep_once(self) -> int:
+        """Dọn một lượt, trả về tổng số session bị xóa"""
+        total = 0
+        for service in self.services:
+            if not service.ready:
+                continue
+            try:
+                evicted = service.get().cleanup_old_sessions(
+                    self.ttl_seconds / 3600, self.max_sessions, self.max_bytes
+                )
+            except Exception as e:
+                logger.error(f"Lỗi dọn session của {service.name}: {e}")
+                continue
+            if evicted:
+                logger.info(f"Đã dọn {len(evicted)} session của {service.name}")
+            self._evicted[service.name] += len(evicted)
+            total += len(evicted)
+        self._last_run = time.time()
+        self._last_evicted = total
+        return total
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Dọn trên thread riêng vì backend SQLite/Redis là I/O đồng bộ
+            await asyncio.to_thread(self.sweep_once)
+
+    def stats(self) -> Dict:
+        return {
+            "interval_seconds": self.interval,
+            "ttl_seconds": self.ttl_seconds,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "last_run": self._last_run,
+            "last_evicted": self._last_evicted,
+            "evicted_total": dict(self._evicted),
+        }
@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.services.text_normalize import tokenize
+
+logger = logging.getLogger(__name__)
+
+PROGRAMS_FILE = "Cac_nganh_dao_tao.json"
+SCHOOL_FILE = "Thong_tin_truong.json"
+
+# Cụm từ (đã bỏ dấu) cho biết câu hỏi hỏi về trường nào của một chương trình đào tạo
+PROGRAM_FIELDS = {
+    "duration": ("bao nhieu nam", "may nam", "bao lau", "thoi gian dao tao", "thoi gian hoc"),
+    "degree": ("van bang", "bang gi", "bang tot nghiep", "cu nhan", "ky su"),
+    "status": ("con tuyen", "dung tuyen", "ghi chu", "thi diem"),
+}
+PROGRAM_LIST_PHRASES = ("nhung nganh nao", "cac nganh", "danh sach nganh", "bao nhieu nganh",
+                        "nhung chuong trinh", "cac chuong trinh")
+
+# Thông tin về trường: (cụm từ, đường dẫn trong Thong_tin_truong.json, mẫu câu trả lời)
+SCHOOL_FACTS = (
+    (("ten truong", "truong ten"), ("gioi_thieu_truong", "ten_truong"), "Tên trường: {}."),
+    (("thanh lap",), ("gioi_thieu_truong", "thong_tin_thanh_lap", "ngay_thanh_lap"),
+     "Trường được thành lập ngày {}."),
+    (("quyet dinh thanh lap",), ("gioi_thieu_truong", "thong_tin_thanh_lap", "quyet_dinh_so"),
+     "Trường được thành lập theo Quyết định số {}."),
+    (("tien si",), ("gioi_thieu_truong", "phat_trien_va_thanh_tuu", "doi_ngu_giang_vien", "ty_le_tien_si"),
+     "Tỷ lệ giảng viên có trình độ tiến sĩ: {}."),
+    (("giao su",), ("gioi_thieu_truong", "phat_trien_va_thanh_tuu", "doi_ngu_giang_vien",
+                    "ty_le_giao_su_va_pho_giao_su"),
+     "Tỷ lệ giảng viên là giáo sư và phó giáo sư: {}."),
+    (("su mang",), ("gioi_thieu_truong", "su_mang", "chinh"), "Sứ mạng của trường: {}"),
+)
+
+# Câu hỏi có các cụm này cần suy luận / dữ liệu khác (điểm chuẩn, học phí...) nên luôn đi qua RAG
+FALLBACK_PHRASES = ("diem", "hoc phi", "hoc bong", "chi tieu", "to hop", "xet tuyen", "khac nhau", "so sanh",
+                    "nen chon", "nen hoc", "phu hop", "viec lam", "tai sao", "vi sao", "mon hoc")
+
+
+def _phrase_in(text: str, phrases) -> bool:
+    # text là các từ đã bỏ dấu nối bằng một dấu cách, có dấu cách ở hai đầu
+    return any(f" {phrase} " in text for phrase in phrases)
+
+
+def _initials(tokens: Tuple[str, ...]) -> str:
+    return "".join(token[0] for token in tokens)
+
+
+def _dig(data, path: Tuple[str, ...]):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class StructuredLookup:
+    """
+    Trả lời trực tiếp (không embedding, không LLM) các câu hỏi tra cứu trên dữ liệu
+    có cấu trúc: thời gian đào tạo / văn bằng / ghi chú của một chương trình đào tạo
+    và một số thông tin cố định về trường.
+
+    Tên chương trình được đánh chỉ mục theo dạng bỏ dấu, cả tên đầy đủ lẫn viết tắt
+    ("cntt", "khmt", "cntt clc"...). Câu hỏi chỉ được trả lời khi nhận ra chắc chắn
+    cả chương trình lẫn thông tin cần hỏi; các trường hợp khác trả về None để đi qua RAG.
+    """
+
+    def __init__(self, data_path: Path):
+        self.programs: List[Dict] = []
+        # alias (tuple các từ đã bỏ dấu) -> chỉ số các chương trình
+        self.aliases: Dict[Tuple[str, ...], set] = {}
+        self.max_alias_length = 0
+        self.school: Dict = {}
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.answered = 0
+        self.by_intent: Dict[str, int] = {}
+        self.load(data_path)
+
+    def load(self, data_path: Path):
+        """(Tải lại) dữ liệu từ thư mục data; file thiếu hoặc lỗi thì bỏ qua phần tra cứu tương ứng"""
+        data_path = Path(data_path)
+        programs, school = [], {}
+        try:
+            with open(data_path / PROGRAMS_FILE, "r", encoding="utf-8") as f:
+                programs = json.load(f).get("danh_sach_chuong_trinh_dao_tao", [])
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Không đọc được {PROGRAMS_FILE}, bỏ qua tra cứu chương trình đào tạo: {e}")
+        try:
+            with open(data_path / SCHOOL_FILE, "r", encoding="utf-8") as f:
+                school = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được {SCHOOL_FILE}, bỏ qua tra cứu thông tin trường: {e}")
+
+        aliases: Dict[Tuple[str, ...], set] = {}
+        for i, program in enumerate(programs):
+            major = tuple(tokenize(program.get("nganh_dao_tao") or ""))
+            name = tuple(tokenize(program.get("chuong_trinh_dao_tao") or ""))
+            names = {major, name, (_initials(major),), (_initials(name),)}
+            if major and name[:len(major)] == major:
+                # "Công nghệ thông tin CLC" -> "cntt clc"
+                names.add((_initials(major),) + name[len(major):])
+            for alias in names:
+                if alias and alias[0]:
+                    aliases.setdefault(alias, set()).add(i)
+        # Gán một lần để các luồng đang tra cứu không thấy dữ liệu dở dang
+        self.programs, self.school, self.aliases = programs, school, aliases
+        self.max_alias_length = max((len(alias) for alias in aliases), default=0)
+
+    def _match_programs(self, tokens: List[str]) -> List[int]:
+        """Các chương trình ứng với tên dài nhất xuất hiện trong câu hỏi"""
+        for length in range(min(self.max_alias_length, len(tokens)), 0, -1):
+            found = set()
+            for start in range(len(tokens) - length + 1):
+                found |= self.aliases.get(tuple(tokens[start:start + length]), set())
+            if found:
+                return sorted(found)
+        return []
+
+    def _describe(self, field: str, indices: List[int]) -> str:
+        lines = []
+        for i in indices:
+            program = self.programs[i]
+            name = program["chuong_trinh_dao_tao"]
+            if field == "duration":
+                lines.append(f"Chương trình {name} có thời gian đào tạo chuẩn "
+                             f"{program['thoi_gian_dao_tao_chuan']} năm.")
+            elif field == "degree":
+                lines.append(f"Chương trình {name} cấp văn bằng {program['van_bang_tot_nghiep']}.")
+            else:
+                note = program.get("ghi_chu")
+                lines.append(f"Chương trình {name}: {note}." if note else
+                             f"Chương trình {name} đang tuyển sinh bình thường.")
+        return "\n".join(lines)
+
+    def _answer_programs(self, text: str, tokens: List[str]) -> Tuple[Optional[str], Optional[str]]:
+        fields = [field for field, phrases in PROGRAM_FIELDS.items() if _phrase_in(text, phrases)]
+        indices = self._match_programs(tokens)
+        if indices and fields:
+            return "\n".join(self._describe(field, indices) for field in fields), "program"
+        if not indices and _phrase_in(text, PROGRAM_LIST_PHRASES) and self.programs:
+            names = "\n".join(f"- {p['chuong_trinh_dao_tao']} ({p['van_bang_tot_nghiep']}, "
+                              f"{p['thoi_gian_dao_tao_chuan']} năm)" for p in self.programs)
+            return f"Trường có {len(self.programs)} chương trình đào tạo:\n{names}", "program_list"
+        return None, None
+
+    def _answer_school(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        answers = []
+        for phrases, path, template in SCHOOL_FACTS:
+            value = _dig(self.school, path)
+            if value and _phrase_in(text, phrases):
+                answers.append(template.format(value))
+        if answers:
+            return "\n".join(answers), "school"
+        return None, None
+
+    def answer(self, question: str) -> Optional[str]:
+        """
+        Args:
+            question (str): Câu hỏi độc lập (đã viết lại nếu cần)
+
+        Returns:
+            Optional[str]: Câu trả lời, hoặc None nếu câu hỏi cần đi qua RAG
+        """
+        tokens = tokenize(question)
+        text = f" {' '.join(tokens)} "
+        answer, intent = None, None
+        if tokens and not _phrase_in(text, FALLBACK_PHRASES):
+            answer, intent = self._answer_programs(text, tokens)
+            if answer is None:
+                answer, intent = self._answer_school(text)
+        with self._lock:
+            self.queries += 1
+            if answer is not None:
+                self.answered += 1
+                self.by_intent[intent] = self.by_intent.get(intent, 0) + 1
+        return answer
+
+    def stats(self) -> Dict:
+        """Số câu hỏi đã qua bộ tra cứu và tỷ lệ được trả lời trực tiếp"""
+        return {
+            "programs": len(self.programs),
+            "queries": self.queries,
+            "answered": self.answered,
+            "share": round(self.answered / self.queries, 4) if self.queries else 0.0,
+            "by_intent": dict(self.by_intent),
+        }
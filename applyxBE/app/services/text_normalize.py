@@ -0,0 +1,35 @@
+import re
+import unicodedata
+from typing import List
+
+# Chữ và số; dấu gạch dưới là dấu phân cách (giống tokenizer unicode61 của FTS5)
+_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# Từ hư / từ hỏi phổ biến trong câu hỏi, không mang nội dung để tra cứu.
+# So khớp trên dạng CÓ dấu: bỏ dấu trước sẽ lẫn "có"/"cơ", "khi"/"khí"...
+STOPWORDS = frozenset({
+    "à", "ạ", "ai", "anh", "bao", "bạn", "các", "cái", "chị", "cho", "chứ", "có", "của", "đã",
+    "để", "đến", "được", "em", "gì", "hay", "hỏi", "khi", "không", "là", "làm", "mình", "một",
+    "nào", "này", "nhé", "nhiêu", "như", "những", "ở", "ơi", "sao", "sẽ", "thế", "thì", "tôi",
+    "trong", "từ", "và", "vậy", "về", "với", "xin",
+})
+
+
+def fold_diacritics(text: str) -> str:
+    """
+    Bỏ dấu tiếng Việt và chữ hoa: "Điểm chuẩn" -> "diem chuan".
+    Người dùng hay gõ không dấu, nên cả tài liệu lẫn câu hỏi đều được đưa về dạng này.
+    """
+    decomposed = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ (âm tiết) sau khi bỏ dấu"""
+    return _TOKEN_PATTERN.findall(fold_diacritics(text))
+
+
+def query_terms(text: str) -> List[str]:
+    """Các từ mang nội dung của câu hỏi, đã bỏ dấu (bỏ từ hư, giữ thứ tự, không trùng)"""
+    words = _TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+    return list(dict.fromkeys(fold_diacritics(word) for word in words if word not in STOPWORDS))
@@ -0,0 +1,73 @@
+"""
+Benchmark: thống kê nghề nghiệp - quét lại toàn bộ kết quả mỗi lần xem dashboard so với
+CareerAnalytics (bảng đếm cộng dồn khi lưu)
+
+Lưu --results kết quả (mẫu từ app/session/session_data.txt, tên nghề và điểm được
+xáo ngẫu nhiên trong --titles nghề), đo thời gian cộng vào thống kê mỗi lần lưu,
+thời gian một lần đọc thống kê của hai cách, và kiểm tra hai cách cho cùng kết quả.
+
+Chạy: python -m benchmarks.bench_career_analytics --results 5000
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from app.services.career_analytics import CareerAnalytics
+from app.services.results_store import LEGACY_RESULTS_FILE, ResultsStore, parse_careers
+
+
+def make_result(sample: dict, titles: int) -> str:
+    careers = []
+    for rank, career in enumerate(sample["careers"], start=1):
+        scores = {field: random.randint(40, 100) for field in
+                  ("averageScore", "worldNeedsScore", "paidScore", "loveScore", "goodAtScore")}
+        careers.append({**career, **scores, "rank": rank, "title": f"Nghề {random.randrange(titles)}"})
+    return "```json\n" + json.dumps({"careers": careers}, ensure_ascii=False) + "\n```"
+
+
+def scan(store: ResultsStore) -> Counter:
+    """Cách không có thống kê: đọc và parse lại mọi kết quả"""
+    counts = Counter()
+    for record in store.records():
+        counts.update(career["title"] for career in parse_careers(record["result"]))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=int, default=5000)
+    parser.add_argument("--titles", type=int, default=200, help="số tên nghề khác nhau")
+    parser.add_argument("--reads", type=int, default=200, help="số lần đọc thống kê")
+    args = parser.parse_args()
+
+    raw = LEGACY_RESULTS_FILE.read_text(encoding="utf-8").split("result: ", 1)[1]
+    sample = {"careers": parse_careers(raw)}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ResultsStore(str(Path(tmp) / "results.jsonl"))
+        analytics = CareerAnalytics(str(Path(tmp) / "analytics.db"))
+        record_seconds = 0.0
+        for i in range(args.results):
+            record = store.save(f"session_{i}", make_result(sample, args.titles))
+            start = time.perf_counter()
+            analytics.record(record, random.choice("abcde"))
+            record_seconds += time.perf_counter() - start
+
+        print(f"{args.results} kết quả, {args.titles} tên nghề\n")
+        print(f"cộng vào thống kê khi lưu: {record_seconds / args.results * 1000:.3f} ms / kết quả")
+        start = time.perf_counter()
+        counts = scan(store)
+        print(f"quét lại toàn bộ kết quả: {(time.perf_counter() - start) * 1000:.1f} ms / lần xem")
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            summary = analytics.summary(limit=args.titles)
+        print(f"CareerAnalytics.summary:  {(time.perf_counter() - start) / args.reads * 1000:.2f} ms / lần xem")
+        same = {c["title"]: c["results"] for c in summary["careers"]} == dict(counts)
+        print(f"số lần xuất hiện mỗi nghề khớp với quét lại: {'đúng' if same else 'SAI'}")
+
+
+if __name__ == "__main__":
+    main()
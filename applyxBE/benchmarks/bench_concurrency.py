@@ -0,0 +1,76 @@
+"""
+Benchmark: N cuộc hội thoại đồng thời trên một worker
+
+Thay model Gemini bằng một model giả có độ trễ cố định (không cần mạng),
+sau đó so sánh độ trễ khi gửi N tin nhắn đồng thời qua send_message_async
+với độ trễ của một tin nhắn đơn lẻ.
+
+Chạy: python -m benchmarks.bench_concurrency --sessions 32 --latency 0.5
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from app.models.gemini import ApplyXChatbot
+from app.services.career_analytics import CareerAnalytics
+from app.services.results_store import ResultsStore
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [self]
+        self.candidates = []
+
+
+class FakeChat:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.history = []
+
+    def send_message(self, message: str):
+        time.sleep(self.latency)
+        return FakeResponse(f"echo: {message}")
+
+    async def send_message_async(self, message: str):
+        await asyncio.sleep(self.latency)
+        return FakeResponse(f"echo: {message}")
+
+
+class FakeModel:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def start_chat(self, history=None):
+        return FakeChat(self.latency)
+
+
+async def run(sessions: int, latency: float, tmp: str):
+    # Kết quả và thống kê lưu vào thư mục tạm, không đụng tới app/session
+    bot = ApplyXChatbot(results=ResultsStore(str(Path(tmp) / "results.jsonl")),
+                        analytics=CareerAnalytics(str(Path(tmp) / "analytics.db")))
+    bot.model = FakeModel(latency)
+    session_ids = [bot.create_session(f"bench_{i}") for i in range(sessions)]
+
+    start = time.perf_counter()
+    await bot.send_message_async(session_ids[0], "xin chào")
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bot.send_message_async(sid, "xin chào") for sid in session_ids))
+    concurrent = time.perf_counter() - start
+
+    print(f"Độ trễ 1 hội thoại:          {single * 1000:.1f} ms")
+    print(f"Độ trễ {sessions} hội thoại đồng thời: {concurrent * 1000:.1f} ms")
+    print(f"Nếu chạy tuần tự (ước tính):  {single * sessions * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args.sessions, args.latency, tmp))
@@ -0,0 +1,138 @@
+"""
+Benchmark: giai đoạn embedding khi tạo index (không cần mạng)
+
+Dùng HashEmbeddings - embedder giả, tất định (vector sinh từ hash của văn
+bản), mỗi request tốn `latency` giây và trả 429 với xác suất `--fail-rate`.
+So sánh:
+- tuần tự: từng batch một, không thử lại (một lỗi 429 là hỏng cả lần chạy)
+- pipeline: batch + song song + token bucket + exponential backoff
+- resume: build bị ngắt giữa chừng rồi chạy lại, đếm số văn bản phải embed lại
+
+Chạy: python -m benchmarks.bench_embedding --docs 2000 --concurrency 8
+"""
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.models.cached_embeddings import CachedEmbeddings
+from app.models.embedding_pipeline import EmbeddingPipeline
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+class Interrupted(Exception):
+    """Mô phỏng build bị dừng (Ctrl+C, deploy...) - không thử lại"""
+
+
+class HashEmbeddings(Embeddings):
+    """Embedder giả: vector chuẩn hóa sinh từ sha256 của văn bản"""
+
+    def __init__(self, size: int = 768, latency: float = 0.05, fail_rate: float = 0.0,
+                 fail_after_requests: int = None, seed: int = 0):
+        self.size = size
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_after_requests = fail_after_requests
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+
+    def _vector(self, text: str):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.requests += 1
+            if self.fail_after_requests is not None and self.requests > self.fail_after_requests:
+                raise Interrupted("build bị dừng")
+            failed = self._random.random() < self.fail_rate
+        time.sleep(self.latency)
+        if failed:
+            raise RateLimited("429 Resource has been exhausted")
+        with self._lock:
+            self.texts += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def sequential(embedder: HashEmbeddings, texts, batch_size: int):
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embedder.embed_documents(texts[start:start + batch_size]))
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=6000, help="request/phút của token bucket")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    texts = [f"Tài liệu số {i}: ngành đào tạo, học phí, học bổng..." for i in range(args.docs)]
+    reference = HashEmbeddings(latency=0)
+
+    # 1. Tuần tự, không có lỗi (mốc thời gian) và có lỗi (thường hỏng)
+    embedder = HashEmbeddings(latency=args.latency)
+    start = time.perf_counter()
+    sequential(embedder, texts, args.batch_size)
+    print(f"tuần tự, không lỗi:        {time.perf_counter() - start:6.2f}s  ({embedder.requests} request)")
+    embedder = HashEmbeddings(latency=args.latency, fail_rate=args.fail_rate)
+    start = time.perf_counter()
+    try:
+        sequential(embedder, texts, args.batch_size)
+        print(f"tuần tự, lỗi {args.fail_rate:.0%}:         {time.perf_counter() - start:6.2f}s  (không gặp lỗi)")
+    except RateLimited:
+        print(f"tuần tự, lỗi {args.fail_rate:.0%}:         hỏng sau {time.perf_counter() - start:.2f}s, "
+              f"mất {embedder.texts} văn bản đã embed")
+
+    # 2. Pipeline với lỗi 429 ngẫu nhiên
+    embedder = HashEmbeddings(latency=args.latency, fail_rate=args.fail_rate)
+    pipeline = EmbeddingPipeline(args.batch_size, args.concurrency, args.rpm, max_retries=8,
+                                 backoff_base=args.latency, backoff_max=2)
+    start = time.perf_counter()
+    vectors = pipeline.run(embedder.embed_documents, texts)
+    elapsed = time.perf_counter() - start
+    assert vectors == reference.embed_documents(texts), "kết quả pipeline sai thứ tự"
+    print(f"pipeline, lỗi {args.fail_rate:.0%}:        {elapsed:6.2f}s  {pipeline.stats()}")
+
+    # 3. Resume: ngắt sau một nửa số request, chạy lại với cùng file cache
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "embeddings.db")
+        half = (args.docs // args.batch_size) // 2
+        embedder = HashEmbeddings(latency=args.latency, fail_after_requests=half)
+        cached = CachedEmbeddings(embedder, "hash", path,
+                                  pipeline=EmbeddingPipeline(args.batch_size, args.concurrency, args.rpm))
+        try:
+            cached.embed_documents(texts)
+        except Interrupted:
+            print(f"resume: lần 1 bị ngắt sau {embedder.texts} văn bản")
+        embedder = HashEmbeddings(latency=args.latency)
+        cached = CachedEmbeddings(embedder, "hash", path,
+                                  pipeline=EmbeddingPipeline(args.batch_size, args.concurrency, args.rpm))
+        start = time.perf_counter()
+        vectors = cached.embed_documents(texts)
+        assert vectors == reference.embed_documents(texts)
+        print(f"resume: lần 2 chỉ embed {embedder.texts}/{args.docs} văn bản "
+              f"({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: thời gian mở index và RSS của một worker theo kích thước dữ liệu
+
+Sinh N document giả (văn bản ~`--doc-bytes` byte, vector ngẫu nhiên) rồi
+ghi ra cả hai định dạng:
+- cũ: FAISS.save_local của LangChain (index.faiss + index.pkl)
+- mới: index_store (vectors.faiss mmap + docs.sqlite + meta.json)
+Mỗi lần đo chạy trong một process riêng: mở index, chạy một truy vấn top-5,
+in thời gian, RSS tăng thêm và phần RSS riêng (RssAnon). Với định dạng mới,
+vector nằm trong page cache dùng chung giữa các worker nên RssAnon gần như không tăng.
+
+Chạy: python -m benchmarks.bench_index_load --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+DIMENSION = 768
+
+
+def _rss_mb(field: str = "VmRSS") -> float:
+    """RSS (MB); RssAnon là phần bộ nhớ riêng của process, không chia sẻ được giữa các worker"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build(path: Path, count: int, doc_bytes: int):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    from app.models.index_store import IndexWriter, content_hash, document_key
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((count, DIMENSION)).astype(np.float32)
+    filler = "Thông tin tuyển sinh, học phí, học bổng. " * (doc_bytes // 40)
+    docs = [
+        Document(page_content=f"Tài liệu {i}: {filler}",
+                 metadata={"source": "bench.json", "page": i + 1, "type": "entity", "parent_key": "k", "index": i})
+        for i in range(count)
+    ]
+
+    legacy = FAISS.from_embeddings(
+        [(doc.page_content, vector.tolist()) for doc, vector in zip(docs, vectors)], embedding=None,
+        metadatas=[doc.metadata for doc in docs],
+    )
+    legacy.save_local(str(path / "legacy"))
+
+    writer = IndexWriter(path / "mmap")
+    writer.add([(document_key(doc.metadata), content_hash(doc), doc) for doc in docs], vectors)
+    writer.commit("bench")
+
+
+def measure(path: str):
+    """Chạy trong process con: mở index, truy vấn một lần, in JSON kết quả"""
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    from app.models.index_store import load_vector_store
+
+    before = _rss_mb()
+    before_anon = _rss_mb("RssAnon")
+    start = time.perf_counter()
+    store = load_vector_store(Path(path), None)
+    load_ms = (time.perf_counter() - start) * 1000
+    query = np.random.default_rng(1).standard_normal(DIMENSION).astype(np.float32).tolist()
+    start = time.perf_counter()
+    store.similarity_search_by_vector(query, k=5)
+    query_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({"load_ms": load_ms, "query_ms": query_ms, "rss_mb": _rss_mb() - before,
+                      "anon_mb": _rss_mb("RssAnon") - before_anon}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--doc-bytes", type=int, default=2000)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.measure)
+        return
+
+    print(f"{'docs':>7} {'định dạng':>10} {'mở (ms)':>9} {'top-5 (ms)':>11} {'RSS +MB':>8} {'riêng +MB':>10} "
+          f"{'trên đĩa MB':>12}")
+    for count in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            build(tmp, count, args.doc_bytes)
+            for name in ("legacy", "mmap"):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_index_load", "--measure", str(tmp / name)],
+                    capture_output=True, text=True, check=True,
+                ).stdout.strip().splitlines()[-1]
+                result = json.loads(output)
+                disk_mb = sum(f.stat().st_size for f in (tmp / name).iterdir()) / 1024 / 1024
+                print(f"{count:>7} {name:>10} {result['load_ms']:>9.1f} {result['query_ms']:>11.2f} "
+                      f"{result['rss_mb']:>8.1f} {result['anon_mb']:>10.1f} {disk_mb:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
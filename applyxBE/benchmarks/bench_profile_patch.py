@@ -0,0 +1,72 @@
+"""
+Benchmark: ngữ nghĩa PATCH /profile/{profile_id} so với PUT
+
+Gửi qua API (TestClient, ProfileService trên file SQLite tạm) các trường hợp:
+- PATCH profile chưa tồn tại: 404 và không tạo profile nào
+- PATCH với null cho trường bắt buộc (firstName, email): 422 và profile giữ nguyên
+- PATCH bình thường / null cho trường không bắt buộc: 200, chỉ đổi trường được gửi
+- PUT profile chưa tồn tại: tạo mới (200)
+In mã trạng thái của từng trường hợp và "đúng" / "SAI", rồi đo thời gian trung bình
+của --patches lần PATCH hợp lệ.
+
+Chạy: python -m benchmarks.bench_profile_patch --patches 200
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.main import app, get_profile_service
+from app.services.profile_service_fastapi import ProfileService
+from app.services.profile_store import ProfileStore
+
+PROFILE = {"firstName": "An", "lastName": "Nguyễn", "email": "an@example.com", "school": "THPT"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patches", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = ProfileService(ProfileStore(str(Path(tmp) / "profiles.db")))
+        app.dependency_overrides[get_profile_service] = lambda: service
+        client = TestClient(app)
+        try:
+            checks = []
+
+            response = client.patch("/profile/missing", json={"school": "THPT"})
+            checks.append(("PATCH profile chưa có", response.status_code,
+                           response.status_code == 404 and service.store.get("missing") is None))
+
+            client.put("/profile/an", json=PROFILE)
+            for field in ("firstName", "email"):
+                response = client.patch("/profile/an", json={field: None})
+                checks.append((f"PATCH {field}=null", response.status_code,
+                               response.status_code == 422 and service.store.get("an")["data"][field] == PROFILE[field]))
+
+            response = client.patch("/profile/an", json={"school": "THPT Chuyên", "notes": None})
+            data = service.store.get("an")["data"]
+            checks.append(("PATCH hợp lệ", response.status_code,
+                           response.status_code == 200 and data["school"] == "THPT Chuyên"
+                           and data["firstName"] == PROFILE["firstName"]))
+
+            response = client.put("/profile/new", json=PROFILE)
+            checks.append(("PUT profile chưa có", response.status_code,
+                           response.status_code == 200 and service.store.get("new") is not None))
+
+            for name, status, ok in checks:
+                print(f"{name:<24} {status:>4}  {'đúng' if ok else 'SAI'}")
+
+            start = time.perf_counter()
+            for i in range(args.patches):
+                client.patch("/profile/an", json={"gpa": str(i)})
+            print(f"\nPATCH hợp lệ: {(time.perf_counter() - start) / args.patches * 1000:.2f} ms / request")
+        finally:
+            app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
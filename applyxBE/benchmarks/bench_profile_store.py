@@ -0,0 +1,130 @@
+"""
+Benchmark: lưu trữ profile - file JSON dùng chung (cách cũ) so với ProfileStore (SQLite WAL)
+
+Đo số lượt đọc / ghi mỗi giây trên --profiles profile (mỗi profile ~--size-kb KB),
+đọc qua cache của ProfileService (--hot profile được đọc nhiều nhất, như trang profile
+gọi lại /profile/get) kèm kiểm tra cache thấy được thay đổi của worker khác,
+và kiểm tra mất dữ liệu khi --threads thread cùng cập nhật một profile: mỗi lượt
+tăng một bộ đếm trong profile, kết quả đúng là threads * updates.
+
+Chạy: python -m benchmarks.bench_profile_store --profiles 1000 --threads 8
+"""
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from app.services.profile_service_fastapi import ProfileService
+from app.services.profile_store import ProfileStore
+
+
+def make_profile(i: int, size_kb: float) -> dict:
+    return {
+        "firstName": f"Học sinh {i}", "lastName": "", "gender": "Nam", "birthDate": "",
+        "email": f"student{i}@example.com", "phone": "", "school": "THPT", "major": "",
+        "gpa": "8.5", "portfolio": "", "achievements": [], "shareProfile": False,
+        "notes": "x" * int(size_kb * 1024), "counter": 0,
+    }
+
+
+class JsonFileProfiles:
+    """Cách cũ: mỗi lần đọc / ghi mở lại và parse lại file JSON của profile"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def get(self, profile_id: str) -> dict:
+        with open(self.directory / f"{profile_id}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, profile_id: str, data: dict):
+        with open(self.directory / f"{profile_id}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def increment(self, profile_id: str):
+        data = self.get(profile_id)
+        data["counter"] += 1
+        self.put(profile_id, data)
+
+
+def rate(fn, ids, seconds: float) -> float:
+    """Số lượt fn(id) mỗi giây, chạy trong khoảng seconds giây"""
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn(random.choice(ids))
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def concurrent_increments(increment, threads: int, updates: int) -> float:
+    def work():
+        for _ in range(updates):
+            try:
+                increment()
+            except ValueError:
+                # Cách cũ: một thread có thể đọc đúng lúc file đang được ghi dở
+                pass
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * updates / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=1000)
+    parser.add_argument("--size-kb", type=float, default=1.0, help="kích thước xấp xỉ mỗi profile")
+    parser.add_argument("--seconds", type=float, default=2.0, help="thời gian đo mỗi thao tác")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=200, help="số lượt cập nhật của mỗi thread")
+    parser.add_argument("--hot", type=int, default=100, help="số profile được đọc qua cache")
+    args = parser.parse_args()
+
+    ids = [f"p{i}" for i in range(args.profiles)]
+    with tempfile.TemporaryDirectory() as tmp:
+        files = JsonFileProfiles(Path(tmp))
+        store = ProfileStore(str(Path(tmp) / "profiles.db"))
+        for i, profile_id in enumerate(ids):
+            files.put(profile_id, make_profile(i, args.size_kb))
+            store.put(profile_id, make_profile(i, args.size_kb))
+        service = ProfileService(store)
+
+        print(f"{args.profiles} profile ~{args.size_kb} KB, đo mỗi thao tác {args.seconds}s\n")
+        print(f"{'':<22} {'đọc/s':>10} {'ghi/s':>10}")
+        print(f"{'file JSON':<22} {rate(files.get, ids, args.seconds):>10.0f} "
+              f"{rate(lambda i: files.put(i, make_profile(0, args.size_kb)), ids, args.seconds):>10.0f}")
+        print(f"{'ProfileStore':<22} {rate(store.get, ids, args.seconds):>10.0f} "
+              f"{rate(lambda i: service.update_profile(i, {'gpa': '9.0'}), ids, args.seconds):>10.0f}")
+        service.cache.clear()
+        print(f"{'ProfileService (cache)':<22} {rate(service.get_profile, ids[:args.hot], args.seconds):>10.0f}")
+        print(f"  cache: {service.cache_stats()}")
+
+        # Worker khác (connection riêng) sửa profile: lần đọc tiếp theo phải thấy bản mới
+        other_worker = ProfileStore(store.path)
+        other_worker.put(ids[0], {**store.get(ids[0])["data"], "gpa": "10"})
+        seen = service.get_profile(ids[0])["data"]["gpa"]
+        print(f"  sau khi worker khác ghi: gpa = {seen} ({'đúng' if seen == '10' else 'SAI, cache cũ'}), "
+              f"số lần xóa cache do worker khác = {service.external_invalidations}")
+
+        expected = args.threads * args.updates
+        print(f"\n{args.threads} thread cùng cập nhật một profile, mỗi thread {args.updates} lượt "
+              f"(đúng: bộ đếm = {expected})")
+        speed = concurrent_increments(lambda: files.increment(ids[0]), args.threads, args.updates)
+        print(f"{'file JSON':<22} {speed:>10.0f} lượt/s, bộ đếm = {files.get(ids[0])['counter']}")
+        speed = concurrent_increments(
+            lambda: store.update(ids[0], lambda data: {**data, "counter": data["counter"] + 1}),
+            args.threads, args.updates)
+        record = store.get(ids[0])
+        print(f"{'ProfileStore':<22} {speed:>10.0f} lượt/s, bộ đếm = {record['data']['counter']}, "
+              f"version = {record['version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: kích thước prompt mỗi lượt và dung lượng mỗi session của chatbot Ikigai
+
+Mô phỏng một cuộc khảo sát N lượt với model giả, đo ở mỗi lượt:
+- số byte / token của system instruction (dùng chung, gửi kèm mỗi request)
+- số byte / token của lịch sử hội thoại gửi đi
+- số byte session chiếm trong session store
+
+Token được ước lượng theo số ký tự / 4; thêm --count-tokens để gọi
+model.count_tokens của Gemini (cần GEMINI_API_KEY và mạng).
+
+Chạy: python -m benchmarks.bench_prompt_size --turns 20
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from app.models.gemini import IKIGAI_SYSTEM_INSTRUCTION, ApplyXChatbot
+from app.services.career_analytics import CareerAnalytics
+from app.services.results_store import ResultsStore
+from app.services.session_store import dumps
+from benchmarks.bench_concurrency import FakeModel
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class RecordingModel(FakeModel):
+    """Model giả ghi lại history được dùng để dựng ChatSession mỗi lượt"""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.histories = []
+
+    def start_chat(self, history=None):
+        self.histories.append(history or [])
+        return super().start_chat(history)
+
+
+def run(turns: int, count_tokens: bool, tmp: str):
+    # Kết quả và thống kê lưu vào thư mục tạm, không đụng tới app/session
+    bot = ApplyXChatbot(results=ResultsStore(str(Path(tmp) / "results.jsonl")),
+                        analytics=CareerAnalytics(str(Path(tmp) / "analytics.db")))
+    real_model = bot.model
+    bot.model = RecordingModel()
+    session_id = bot.create_session("bench_prompt")
+
+    system_bytes = len(IKIGAI_SYSTEM_INSTRUCTION.encode("utf-8"))
+    system_tokens = (real_model.count_tokens(IKIGAI_SYSTEM_INSTRUCTION).total_tokens
+                     if count_tokens else estimate_tokens(IKIGAI_SYSTEM_INSTRUCTION))
+    print(f"System instruction: {system_bytes} bytes, ~{system_tokens} tokens (1 bản dùng chung)")
+    print(f"{'lượt':>5} {'history bytes':>14} {'prompt tokens':>14} {'session bytes':>14}")
+
+    for turn in range(1, turns + 1):
+        bot.send_message(session_id, f"Câu trả lời số {turn}: b) Giải quyết vấn đề logic hoặc kỹ thuật")
+        history = bot.model.histories[-1]
+        history_text = json.dumps(history, ensure_ascii=False)
+        if count_tokens:
+            prompt_tokens = real_model.count_tokens(history or "").total_tokens + system_tokens
+        else:
+            prompt_tokens = estimate_tokens(history_text) + system_tokens
+        session_bytes = len(dumps(bot.store.get(session_id)).encode("utf-8"))
+        print(f"{turn:>5} {len(history_text.encode('utf-8')):>14} {prompt_tokens:>14} {session_bytes:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--count-tokens", action="store_true")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        run(args.turns, args.count_tokens, tmp)
@@ -0,0 +1,85 @@
+"""
+Benchmark: lưu kết quả Ikigai - một file session_data.txt ghi đè (cách cũ) so với ResultsStore
+
+Lưu --sessions session, mỗi session lưu lại --saves lần (kết quả mẫu lấy từ
+app/session/session_data.txt), đo số lượt lưu / đọc mỗi giây, kiểm tra mỗi session
+đọc lại đúng kết quả của chính nó, và dung lượng file log trước / sau khi compact.
+
+Chạy: python -m benchmarks.bench_results_store --sessions 2000 --saves 3
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.results_store import LEGACY_RESULTS_FILE, ResultsStore
+
+
+class OverwrittenFile:
+    """Cách cũ: mọi session ghi đè cùng một file, mỗi lần đọc mở lại file"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def save(self, session_id: str, result: str):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(f"session_id: {session_id}\n")
+            f.write(f"result: {result}\n")
+
+    def get(self, session_id: str) -> str:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+
+def timed(fn, calls) -> float:
+    """Số lượt fn(*args) mỗi giây trên danh sách calls"""
+    start = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    return len(calls) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--saves", type=int, default=3, help="số lần lưu lại kết quả của mỗi session")
+    parser.add_argument("--reads", type=int, default=20000)
+    args = parser.parse_args()
+
+    sample = LEGACY_RESULTS_FILE.read_text(encoding="utf-8").split("result: ", 1)[1].strip()
+    ids = [f"session_{i}" for i in range(args.sessions)]
+    # Mỗi session lưu một kết quả có đánh dấu riêng để kiểm tra đọc lại đúng kết quả của mình
+    saves = [(session_id, sample.replace("\"rank\": 1,", f"\"rank\": 1, \"note\": \"{session_id}\","))
+             for _ in range(args.saves) for session_id in ids]
+    reads = [(random.choice(ids),) for _ in range(args.reads)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old = OverwrittenFile(Path(tmp) / "session_data.txt")
+        # Không tự compact trong lúc đo ghi: compact được đo riêng bên dưới
+        store = ResultsStore(str(Path(tmp) / "results.jsonl"), compact_min_records=len(saves) + 1)
+
+        print(f"{args.sessions} session x {args.saves} lần lưu, {args.reads} lượt đọc ngẫu nhiên\n")
+        print(f"{'':<22} {'lưu/s':>10} {'đọc/s':>10} {'đọc đúng session':>18}")
+        save_rate, read_rate = timed(old.save, saves), timed(old.get, reads)
+        correct = sum(f"\"note\": \"{session_id}\"" in old.get(session_id) for session_id in ids)
+        print(f"{'session_data.txt':<22} {save_rate:>10.0f} {read_rate:>10.0f} {correct:>10}/{args.sessions}")
+        save_rate, read_rate = timed(store.save, saves), timed(store.get, reads)
+        correct = sum(f"\"note\": \"{session_id}\"" in store.get(session_id)["result"] for session_id in ids)
+        print(f"{'ResultsStore':<22} {save_rate:>10.0f} {read_rate:>10.0f} {correct:>10}/{args.sessions}")
+
+        # Worker khác mở cùng file: dựng chỉ mục bằng một lần quét
+        start = time.perf_counter()
+        ResultsStore(str(store.path)).stats()
+        print(f"\ndựng chỉ mục khi khởi động: {(time.perf_counter() - start) * 1000:.1f} ms")
+        before = store.stats()
+        start = time.perf_counter()
+        store.compact()
+        after = store.stats()
+        print(f"compact: {before['records']} -> {after['records']} dòng, "
+              f"{before['file_bytes'] / 1024 / 1024:.1f} -> {after['file_bytes'] / 1024 / 1024:.1f} MB "
+              f"trong {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
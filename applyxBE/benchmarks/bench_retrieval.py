@@ -0,0 +1,181 @@
+"""
+Benchmark: chất lượng và tốc độ truy xuất trên app/data (không cần mạng)
+
+Dựng index từ app/data bằng đúng code ingestion (process_data + IndexWriter),
+với LocalEmbeddings - embedder tất định chạy cục bộ (feature hashing các từ và
+cặp từ đã bỏ dấu), rồi chạy bộ câu hỏi có nhãn benchmarks/retrieval_questions.json.
+Một tài liệu được coi là đúng nếu cùng file nguồn và chứa mọi chuỗi trong "contains".
+
+So sánh các cấu hình:
+- cách dựng document (--render compact/json) và kích thước chunk (--chunk, 0 = không chia)
+- loại index vector (--index-types flat/hnsw/ivf/ivfpq) và kiểu lưu vector (--dtypes float32/float16/int8),
+  dựng bằng đúng IndexWriter như khi ingestion; --ef-search / --nprobe quét tham số tìm kiếm của HNSW / IVF
+- cách truy xuất (--modes vector/lexical/hybrid/auto; auto = như chatbot: BM25 nếu chắc chắn, không thì hybrid)
+
+Báo cáo recall@k và MRR, độ trễ truy xuất p50/p99 (không tính thời gian embed câu hỏi),
+thời gian dựng index và dung lượng index (vector FAISS + docs.sqlite).
+
+Chạy: python -m benchmarks.bench_retrieval --ks 1 3 5 10 --index-types flat hnsw --dtypes float32 int8
+"""
+import argparse
+import hashlib
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.models.index_store import (DOCS_FILE, VECTORS_FILE, IndexStore, IndexWriter, apply_search_params,
+                                    content_hash, document_key)
+from app.models.process_data import DATA_PATH, create_documents_from_generic_json
+from app.services.hybrid_retrieval import HybridRetriever
+from app.services.text_normalize import query_terms, tokenize
+
+QUESTIONS_PATH = Path(__file__).resolve().parent / "retrieval_questions.json"
+DIMENSION = 768
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embedder tất định, không cần mạng: mỗi từ / cặp từ liền nhau (đã bỏ dấu) được băm
+    vào một chiều của vector, trọng số log(1 + tần suất), rồi chuẩn hóa L2.
+    Chỉ bắt được độ giống về từ ngữ, đủ để so sánh tương đối các cấu hình.
+    """
+
+    def __init__(self, size: int = DIMENSION):
+        self.size = size
+
+    def _vector(self, text: str):
+        vector = np.zeros(self.size, dtype=np.float32)
+        tokens = tokenize(text)
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.size] += 1.0
+        vector = np.log1p(vector)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def load_documents(render_mode: str, chunk_tokens: int):
+    docs = []
+    for path in sorted(DATA_PATH.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        docs.extend(create_documents_from_generic_json(data, path.name, render_mode=render_mode,
+                                                       target_tokens=chunk_tokens, verbose=False))
+    return docs
+
+
+def build_index(path: Path, docs, vectors, index_type: str, vector_dtype: str) -> float:
+    """Dựng index định dạng mới bằng IndexWriter từ các vector đã embed; trả về số giây"""
+    start = time.perf_counter()
+    writer = IndexWriter(path, index_type=index_type, vector_dtype=vector_dtype)
+    writer.add([(document_key(doc.metadata), content_hash(doc), doc) for doc in docs], vectors)
+    writer.commit("local-hash")
+    return time.perf_counter() - start
+
+
+def search_settings(index_type: str, ef_search, nprobe):
+    """Các bộ tham số tìm kiếm cần đo cho một loại index ([None] = giữ giá trị trong meta)"""
+    if index_type == "hnsw":
+        return [{"ef_search": ef} for ef in ef_search] or [None]
+    if index_type in ("ivf", "ivfpq"):
+        return [{"nprobe": n} for n in nprobe] or [None]
+    return [None]
+
+
+def is_relevant(doc, question: dict) -> bool:
+    return (doc.metadata.get("source") == question["source"]
+            and all(text in doc.page_content for text in question["contains"]))
+
+
+def retrieve(retriever: HybridRetriever, mode: str, question: str, vector):
+    store = retriever.store
+    if mode == "vector":
+        return retriever.documents([doc_id for doc_id, _ in store.vector_search(vector, retriever.k)])
+    if mode == "lexical":
+        return retriever.documents([doc_id for doc_id, _ in store.lexical_search(query_terms(question),
+                                                                                  retriever.k)])
+    hits, confident = retriever.lexical(question)
+    if mode == "auto" and confident:
+        return retriever.lexical_documents(hits)
+    docs, _ = retriever.search(vector, hits)
+    return docs
+
+
+def evaluate(retriever: HybridRetriever, mode: str, questions, vectors, ks, repeat: int):
+    first_relevant = []
+    latencies = []
+    for question, vector in zip(questions, vectors):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            docs = retrieve(retriever, mode, question["question"], vector)
+            latencies.append((time.perf_counter() - start) * 1000)
+        rank = next((i for i, doc in enumerate(docs, start=1) if is_relevant(doc, question)), None)
+        first_relevant.append(rank)
+    recall = {k: sum(1 for rank in first_relevant if rank is not None and rank <= k) / len(questions)
+              for k in ks}
+    mrr = sum(1 / rank for rank in first_relevant if rank is not None) / len(questions)
+    return recall, mrr, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--render", nargs="+", default=["json", "compact"])
+    parser.add_argument("--chunk", type=int, nargs="+", default=[0, 400], help="token mỗi chunk, 0 = không chia")
+    parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw", "ivf", "ivfpq"])
+    parser.add_argument("--dtypes", nargs="+", default=["float32"], help="float32 / float16 / int8")
+    parser.add_argument("--ef-search", type=int, nargs="*", default=[], help="các giá trị efSearch của HNSW")
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[], help="các giá trị nprobe của IVF")
+    parser.add_argument("--modes", nargs="+", default=["vector", "lexical", "hybrid", "auto"])
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--repeat", type=int, default=20, help="số lần chạy mỗi câu hỏi khi đo độ trễ")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH))
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    embeddings = LocalEmbeddings()
+    query_vectors = [embeddings.embed_query(q["question"]) for q in questions]
+    ks = sorted(args.ks)
+    print(f"{len(questions)} câu hỏi, embedder cục bộ {DIMENSION} chiều\n")
+    print(f"{'render':>8} {'chunk':>5} {'index':>6} {'dtype':>7} {'search':>9} {'mode':>8} {'docs':>5} "
+          f"{'build s':>8} {'index MB':>9} "
+          + " ".join(f"{'R@' + str(k):>6}" for k in ks) + f" {'MRR':>6} {'p50 ms':>7} {'p99 ms':>7}")
+
+    for render_mode in args.render:
+        for chunk_tokens in args.chunk:
+            docs = load_documents(render_mode, chunk_tokens)
+            vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+            for index_type in args.index_types:
+                # ivfpq lưu mã PQ, không phụ thuộc kiểu lưu vector
+                for vector_dtype in (["float32"] if index_type == "ivfpq" else args.dtypes):
+                    with tempfile.TemporaryDirectory() as tmp:
+                        path = Path(tmp)
+                        build_seconds = build_index(path, docs, vectors, index_type, vector_dtype)
+                        index_mb = sum((path / name).stat().st_size for name in (VECTORS_FILE, DOCS_FILE)) / 1024 / 1024
+                        store = IndexStore(path, embeddings)
+                        retriever = HybridRetriever(store, k=max(ks))
+                        for params in search_settings(index_type, args.ef_search, args.nprobe):
+                            if params is not None:
+                                apply_search_params(store.index, params)
+                            label = ",".join(f"{key}={value}" for key, value in (params or {}).items()) or "-"
+                            for mode in args.modes:
+                                recall, mrr, p50, p99 = evaluate(retriever, mode, questions, query_vectors,
+                                                                 ks, args.repeat)
+                                print(f"{render_mode:>8} {chunk_tokens:>5} {index_type:>6} {vector_dtype:>7} "
+                                      f"{label:>9} {mode:>8} {len(docs):>5} {build_seconds:>8.2f} {index_mb:>9.2f} "
+                                      + " ".join(f"{recall[k]:>6.2f}" for k in ks)
+                                      + f" {mrr:>6.3f} {p50:>7.2f} {p99:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark: giới hạn hàng đợi của LLMScheduler khi một loạt request đến cùng lúc
+
+Bắn --requests request vào scheduler cùng một lúc bằng asyncio.gather (mỗi request
+một session, giữ slot --hold giây), rồi bắn lần lượt từng request để so sánh.
+Với max_in_flight + max_queue chỗ, đúng max_in_flight + max_queue request được nhận,
+phần còn lại bị từ chối 429 ngay (không xếp hàng), và thống kê về 0 sau khi xong.
+
+Chạy: python -m benchmarks.bench_scheduler_burst --requests 50 --max-in-flight 2 --max-queue 2
+"""
+import argparse
+import asyncio
+
+from app.services.scheduler import LLMScheduler, SchedulerOverloaded
+
+
+async def request(scheduler: LLMScheduler, session_id: str, hold: float) -> str:
+    try:
+        async with scheduler.slot(session_id):
+            await asyncio.sleep(hold)
+        return "admitted"
+    except SchedulerOverloaded as e:
+        return str(e.status_code)
+
+
+async def burst(scheduler: LLMScheduler, count: int, hold: float):
+    return await asyncio.gather(*(request(scheduler, f"burst_{i}", hold) for i in range(count)))
+
+
+async def staggered(scheduler: LLMScheduler, count: int, hold: float):
+    tasks = []
+    for i in range(count):
+        tasks.append(asyncio.create_task(request(scheduler, f"staggered_{i}", hold)))
+        await asyncio.sleep(0)
+    return await asyncio.gather(*tasks)
+
+
+async def main(args):
+    capacity = args.max_in_flight + args.max_queue
+    print(f"{args.requests} request, max_in_flight={args.max_in_flight} max_queue={args.max_queue}\n")
+    print(f"{'':<12} {'nhận':>6} {'429':>6} {'503':>6} {'in_flight':>10} {'waiting':>8}  đúng?")
+    for name, run in (("cùng lúc", burst), ("lần lượt", staggered)):
+        # Chờ đủ lâu để mọi request đã nhận đều chạy xong, không ra 503
+        scheduler = LLMScheduler(args.max_in_flight, args.max_queue, queue_timeout=args.hold * capacity * 2)
+        outcomes = await run(scheduler, args.requests, args.hold)
+        stats = scheduler.stats()
+        admitted, rejected, timed_out = (outcomes.count(o) for o in ("admitted", "429", "503"))
+        ok = (admitted == min(capacity, args.requests) and rejected == args.requests - admitted
+              and stats["in_flight"] == 0 and stats["waiting"] == 0)
+        print(f"{name:<12} {admitted:>6} {rejected:>6} {timed_out:>6} {stats['in_flight']:>10} "
+              f"{stats['waiting']:>8}  {'đúng' if ok else 'SAI'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--max-in-flight", type=int, default=2)
+    parser.add_argument("--max-queue", type=int, default=2)
+    parser.add_argument("--hold", type=float, default=0.05, help="thời gian giữ slot của mỗi request (giây)")
+    asyncio.run(main(parser.parse_args()))
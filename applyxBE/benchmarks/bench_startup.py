@@ -0,0 +1,63 @@
+"""
+Benchmark: thời gian khởi động của API
+
+Chạy uvicorn trong một process con và đo:
+- thời gian tới khi /healthz trả về 200 (app đã nhận kết nối)
+- thời gian tới khi /readyz trả về 200 (service đã warm-up xong)
+
+Chạy: python -m benchmarks.bench_startup --runs 3
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def wait_for(url: str, timeout: float, start: float):
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def run_once(port: int, timeout: float):
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        live = wait_for(f"http://127.0.0.1:{port}/healthz", timeout, start)
+        ready = wait_for(f"http://127.0.0.1:{port}/readyz", timeout, start)
+        return live, ready
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def fmt(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "không đạt"
+    return f"median {statistics.median(values) * 1000:.0f} ms (min {min(values) * 1000:.0f} ms)"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    results = [run_once(args.port, args.timeout) for _ in range(args.runs)]
+    print(f"Tới khi nhận kết nối (/healthz): {fmt([r[0] for r in results])}")
+    print(f"Tới khi sẵn sàng (/readyz):      {fmt([r[1] for r in results])}")
@@ -0,0 +1,114 @@
+"""
+Benchmark: ticket của scheduler khi stream SSE bị ngắt trước đoạn đầu tiên
+
+Mỗi kịch bản lấy ticket từ llm_scheduler như route /chat/send/stream, dựng response
+rồi ngắt trước khi model trả về đoạn đầu tiên:
+- disconnect: client gửi http.disconnect (ASGI < 2.4, Starlette hủy việc đọc generator)
+- send-error: gửi header thất bại (ASGI 2.4, generator chưa từng được đọc)
+- cancel:     task của request bị hủy trong lúc chờ đoạn đầu tiên
+Sau --rounds lượt mỗi kịch bản, in_flight / waiting của scheduler phải về 0 và
+session vẫn lấy được ticket mới. So sánh StreamingResponse thường với _SchedulerStream.
+
+Chạy: python -m benchmarks.bench_stream_cancel --rounds 20
+"""
+import argparse
+import asyncio
+
+from fastapi.responses import StreamingResponse
+
+from app.main import _SchedulerStream, _stream_as_sse, llm_scheduler
+from app.services.scheduler import SchedulerOverloaded
+
+
+async def slow_chunks():
+    await asyncio.sleep(1)
+    yield "xin chào"
+
+
+def scope(spec_version: str) -> dict:
+    return {"type": "http", "asgi": {"spec_version": spec_version}}
+
+
+async def disconnect(response):
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    await response(scope("2.3"), receive, send)
+
+
+async def send_error(response):
+    async def receive():
+        await asyncio.sleep(10)
+
+    async def send(message):
+        raise OSError("client đã đóng kết nối")
+
+    try:
+        await response(scope("2.4"), receive, send)
+    except Exception:
+        pass
+
+
+async def cancel(response):
+    async def receive():
+        await asyncio.sleep(10)
+
+    async def send(message):
+        pass
+
+    task = asyncio.create_task(response(scope("2.4"), receive, send))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def run(make_response, scenario, rounds: int):
+    session_id = f"bench:{scenario.__name__}"
+    for _ in range(rounds):
+        try:
+            ticket = await llm_scheduler.acquire(session_id)
+        except SchedulerOverloaded as e:
+            return f"lượt sau bị từ chối ({e.status_code})"
+        await scenario(make_response(ticket))
+    stats = llm_scheduler.stats()
+    # Trả lại các ticket bị rò để kịch bản sau bắt đầu từ trạng thái sạch
+    leaked = stats["in_flight"]
+    for lock in llm_scheduler._session_locks.values():
+        if lock.locked():
+            lock.release()
+    for _ in range(leaked):
+        llm_scheduler._get_slots().release()
+    llm_scheduler._in_flight = 0
+    llm_scheduler._pending = 0
+    llm_scheduler._session_locks.clear()
+    llm_scheduler._session_refs.clear()
+    return f"in_flight={stats['in_flight']} waiting={stats['waiting']}"
+
+
+async def main(rounds: int):
+    # Chờ ngắn để lượt bị kẹt lock trả về 503 ngay thay vì sau LLM_QUEUE_TIMEOUT
+    llm_scheduler.queue_timeout = 0.2
+    responses = {
+        "StreamingResponse": lambda ticket: StreamingResponse(
+            _stream_as_sse(slow_chunks(), "bench", ticket), media_type="text/event-stream"),
+        "_SchedulerStream": lambda ticket: _SchedulerStream(
+            _stream_as_sse(slow_chunks(), "bench", ticket), ticket, media_type="text/event-stream"),
+    }
+    print(f"{rounds} lượt mỗi kịch bản, cùng một session\n")
+    print(f"{'':<18} {'disconnect':>26} {'send-error':>26} {'cancel':>26}")
+    for name, make_response in responses.items():
+        results = [await run(make_response, scenario, rounds) for scenario in (disconnect, send_error, cancel)]
+        print(f"{name:<18} " + " ".join(f"{result:>26}" for result in results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds))